@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Compare the dithering engines on each colour panel size.
+
+For every panel and engine this reports the encode time and two errors
+against the source picture, both in the panel's measured colours: the plain
+RMS error per pixel, and the RMS error after a small blur, which is closer to
+what the eye sees from a step away. Pick the fastest engine whose blurred
+error is acceptable.
+
+    ./benchmarks/bench_dither.py --panels epd7in3f,epd1in64g --output-file dither.jsonl
+"""
+import importlib
+import json
+import os
+import statistics
+import sys
+import time
+from argparse import ArgumentParser
+from typing import Any, Dict, Iterator
+
+os.environ.setdefault("EPD_BACKEND", "Simulated")
+
+root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, root)
+
+import numpy as np  # noqa: E402
+from PIL import Image, ImageFilter  # noqa: E402
+
+from bench_drivers import git_commit, test_image  # noqa: E402
+from lib.waveshare_epd import dither  # noqa: E402
+from lib.waveshare_epd.emulator import PANELS  # noqa: E402
+
+DEFAULT_PANELS = "epd2in13b_V3,epd1in64g,epd4in37g,epd5in65f,epd7in3f,epd7in5b_V2"
+BLUR_RADIUS = 1.5
+
+
+def rms(a: Image.Image, b: Image.Image) -> float:
+    diff = np.asarray(a, dtype=np.float32) - np.asarray(b, dtype=np.float32)
+    return float(np.sqrt((diff**2).mean()))
+
+
+def bench_panel(name: str, engines: list, repeat: int) -> Iterator[Dict[str, Any]]:
+    module = importlib.import_module(f"lib.waveshare_epd.{name}")
+    width, height = module.EPD_WIDTH, module.EPD_HEIGHT
+    colours = PANELS[name][1]
+    palette = dither.load_palettes()[colours]
+    image = test_image(width, height)
+    # What a perfect panel with these inks would show
+    target = Image.fromarray(dither.compress(np.asarray(image), palette).round().astype(np.uint8))
+    blurred_target = target.filter(ImageFilter.GaussianBlur(BLUR_RADIUS))
+
+    for engine in engines:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            indices = dither.dither(image, engine, palette)
+            timings.append(time.perf_counter() - start)
+        shown = dither.render(indices, palette)
+        yield {
+            "panel": name,
+            "size": (width, height),
+            "colours": colours,
+            "engine": engine,
+            "encode_ms": round(statistics.median(timings) * 1000, 2),
+            "rms": round(rms(shown, target), 2),
+            "blurred_rms": round(rms(shown.filter(ImageFilter.GaussianBlur(BLUR_RADIUS)), blurred_target), 2),
+        }
+
+
+def main() -> None:
+    argparser = ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument("--panels", default=DEFAULT_PANELS, help="Comma separated driver modules")
+    argparser.add_argument("--engines", default=",".join(dither.ENGINES), help="Comma separated engines")
+    argparser.add_argument("--repeat", type=int, default=3, help="Median of this many runs")
+    argparser.add_argument("--output-file", help="Append results as JSON lines")
+    args = argparser.parse_args()
+
+    engines = args.engines.split(",")
+    run = {"commit": git_commit(), "time": time.time()}
+    # Build the cached masks outside of the timings
+    dither.bayer_matrix()
+    dither.blue_noise()
+
+    print("%-14s %-9s %-6s %-16s %10s %8s %12s" % ("panel", "size", "inks", "engine", "encode ms", "rms", "blurred rms"))
+    for panel in args.panels.split(","):
+        for result in bench_panel(panel, engines, args.repeat):
+            print(
+                "%-14s %-9s %-6s %-16s %10.2f %8.2f %12.2f"
+                % (
+                    panel,
+                    "x".join(map(str, result["size"])),
+                    result["colours"],
+                    result["engine"],
+                    result["encode_ms"],
+                    result["rms"],
+                    result["blurred_rms"],
+                )
+            )
+            if args.output_file:
+                with open(args.output_file, "a") as output_file:
+                    output_file.write(json.dumps({**run, **result}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Benchmark every driver in lib/waveshare_epd without hardware.
+
+Drivers run against the Simulated epdconfig backend, which records the SPI
+traffic and keeps a virtual clock for delays and BUSY waits. For every panel,
+in portrait and landscape image orientation, this reports the host time of
+getbuffer, display, Clear and partial/gray paths along with the bytes sent,
+the SPI transfer count and the simulated panel time.
+
+    ./benchmarks/bench_drivers.py --panels epd2in13b_V3,epd7in3f --output-file bench.jsonl
+
+Results are appended as JSON lines tagged with the git commit so runs can be
+compared over time.
+"""
+import importlib
+import inspect
+import json
+import os
+import pkgutil
+import re
+import statistics
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+os.environ.setdefault("EPD_BACKEND", "Simulated")
+
+root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, root)
+
+from PIL import Image  # noqa: E402
+
+from lib import waveshare_epd  # noqa: E402
+from lib.waveshare_epd import epdconfig  # noqa: E402
+
+DRIVER_RE = re.compile(r"^epd\d")
+OPERATION_RE = re.compile(r"^(getbuffer\w*|display\w*|Display\w*|EPD_\w*Partial\w*|Clear)$")
+COORDINATES = ("x_start", "y_start", "x_end", "y_end")
+
+
+def driver_names() -> List[str]:
+    return sorted(
+        name
+        for _, name, _ in pkgutil.iter_modules(waveshare_epd.__path__)
+        if DRIVER_RE.match(name)
+    )
+
+
+def test_image(width: int, height: int) -> Image.Image:
+    """Deterministic RGB picture with gradients in every channel."""
+    red = Image.linear_gradient("L").resize((width, height))
+    green = Image.radial_gradient("L").resize((width, height))
+    blue = red.transpose(Image.Transpose.ROTATE_90).resize((width, height))
+    return Image.merge("RGB", (red, green, blue))
+
+
+def arguments(epd: Any, method: Callable, buffers: Dict[str, Any], name: str) -> list:
+    """Guess arguments for the many driver signatures from parameter names."""
+    args = []
+    for param in inspect.signature(method).parameters.values():
+        pname = param.name.lower()
+        if param.default is not inspect.Parameter.empty:
+            args.append(param.default)
+        elif pname == "lut":
+            args.append(epd.lut_full_update)
+        elif pname in ("ispartial", "update", "mode", "num"):
+            args.append(0)
+        elif pname == "color":
+            args.append(0xFF)
+        elif pname in COORDINATES:
+            end = epd.width if pname[0] == "x" else epd.height
+            args.append(0 if pname.endswith("start") else end)
+        elif "4gray" in name.lower():
+            args.append(buffers["getbuffer_4Gray"])
+        else:
+            args.append(buffers["getbuffer"])
+    return args
+
+
+def measure(func: Callable, args: list, repeat: int) -> Dict[str, Any]:
+    sim = epdconfig.implementation
+    timings = []
+    for _ in range(repeat):
+        sim.reset_stats()
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+    return {
+        "host_ms": round(statistics.median(timings) * 1000, 3),
+        "bytes": sim.bytes_sent,
+        "transfers": sim.transfers,
+        "panel_ms": round(sim.clock_ms, 1),
+        "result": result,
+    }
+
+
+def bench_panel(name: str, repeat: int) -> Iterator[Dict[str, Any]]:
+    try:
+        module = importlib.import_module(f"lib.waveshare_epd.{name}")
+        epd = module.EPD()
+    except Exception as exc:
+        yield {"panel": name, "operation": "import", "error": repr(exc)}
+        return
+    init = getattr(epd, "init", None) or getattr(epd, "Init")
+    init_result = measure(init, arguments(epd, init, {}, "init"), 1)
+    init_result.pop("result")
+    yield {"panel": name, "operation": "init", **init_result}
+
+    operations = sorted(
+        op for op in dir(epd) if OPERATION_RE.match(op) and callable(getattr(epd, op))
+    )
+    getbuffers = [op for op in operations if op.startswith("getbuffer")]
+    others = [op for op in operations if not op.startswith("getbuffer")]
+
+    for size in dict.fromkeys([(epd.width, epd.height), (epd.height, epd.width)]):
+        image = test_image(*size)
+        buffers = {}
+        for op in getbuffers:
+            try:
+                result = measure(getattr(epd, op), [image], repeat)
+            except Exception as exc:
+                yield {"panel": name, "operation": op, "size": size, "error": repr(exc)}
+                continue
+            buffers[op] = result.pop("result")
+            yield {"panel": name, "operation": op, "size": size, **result}
+
+        # Sending depends on the buffer, not on the image orientation
+        if size != (epd.width, epd.height) or "getbuffer" not in buffers:
+            continue
+        for op in others:
+            method = getattr(epd, op)
+            try:
+                result = measure(method, arguments(epd, method, buffers, op), repeat)
+            except Exception as exc:
+                yield {"panel": name, "operation": op, "error": repr(exc)}
+                continue
+            result.pop("result")
+            yield {"panel": name, "operation": op, **result}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=root,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    argparser = ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument("--panels", help="Comma separated driver modules (default: all)")
+    argparser.add_argument("--repeat", type=int, default=3, help="Median of this many runs")
+    argparser.add_argument("--output-file", help="Append results as JSON lines")
+    args = argparser.parse_args()
+
+    panels = args.panels.split(",") if args.panels else driver_names()
+    run = {"commit": git_commit(), "time": time.time()}
+
+    print(
+        "%-16s %-22s %-11s %10s %8s %9s %10s"
+        % ("panel", "operation", "size", "host ms", "bytes", "transfers", "panel ms")
+    )
+    for panel in panels:
+        for result in bench_panel(panel, args.repeat):
+            size = "x".join(map(str, result.get("size", ())))
+            if "error" in result:
+                print("%-16s %-22s %-11s %s" % (panel, result["operation"], size, result["error"]))
+            else:
+                print(
+                    "%-16s %-22s %-11s %10.2f %8d %9d %10.1f"
+                    % (
+                        panel,
+                        result["operation"],
+                        size,
+                        result["host_ms"],
+                        result["bytes"],
+                        result["transfers"],
+                        result["panel_ms"],
+                    )
+                )
+            if args.output_file:
+                with open(args.output_file, "a") as output_file:
+                    output_file.write(json.dumps({**run, **result}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Measure the refresh modes of the drivers that have more than one.
+
+For every panel listing `refresh_modes`, this times display(buf, mode=...)
+once the controller is set up for the mode, alternating between two
+pictures so partial refreshes have pixels to change. Against the panel
+emulator (the default, EPD_BACKEND=Simulated) it reports the host time, the
+bytes and SPI transfers sent and the simulated panel time; on a Raspberry Pi
+with the panel attached (EPD_BACKEND=RaspberryPi) the host time is the real
+latency, BUSY waits included.
+
+    ./benchmarks/bench_modes.py --panels epd3in52,epd4in2 --output-file modes.jsonl
+"""
+import importlib
+import json
+import os
+import statistics
+import sys
+import time
+from argparse import ArgumentParser
+from typing import Any, Dict, Iterator, List
+
+os.environ.setdefault("EPD_BACKEND", "Simulated")
+
+root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, root)
+
+from PIL import Image  # noqa: E402
+
+from bench_drivers import driver_names, git_commit, test_image  # noqa: E402
+from lib.waveshare_epd import epdconfig, modes  # noqa: E402
+from lib.waveshare_epd.emulator import Emulator  # noqa: E402
+
+
+def mode_panels() -> List[str]:
+    panels = []
+    for name in driver_names():
+        try:
+            module = importlib.import_module(f"lib.waveshare_epd.{name}")
+        except Exception:
+            continue
+        if hasattr(module.EPD, "refresh_modes"):
+            panels.append(name)
+    return panels
+
+
+def bench_panel(name: str, repeat: int) -> Iterator[Dict[str, Any]]:
+    module = importlib.import_module(f"lib.waveshare_epd.{name}")
+    epd = module.EPD()
+    if isinstance(epdconfig.implementation, epdconfig.Simulated):
+        # Refreshes keep the panel busy for the emulator's full or partial time
+        epdconfig.use(Emulator.for_epd(epd))
+    sim = epdconfig.implementation
+    simulated = isinstance(sim, epdconfig.Simulated)
+    first = test_image(epd.width, epd.height)
+    pictures = [first, first.transpose(Image.Transpose.ROTATE_180)]
+
+    epd.init()
+    for mode in modes.supported(epd):
+        getbuffer = epd.getbuffer_4Gray if mode == modes.GRAY else epd.getbuffer
+        buffers = [getbuffer(picture) for picture in pictures]
+        # Switch the controller to the mode outside of the timings
+        modes.display(epd, buffers[1], mode=mode)
+        timings = []
+        for i in range(repeat):
+            if simulated:
+                sim.reset_stats()
+            start = time.perf_counter()
+            modes.display(epd, buffers[i % 2], mode=mode)
+            timings.append(time.perf_counter() - start)
+        result = {"panel": name, "mode": mode, "host_ms": round(statistics.median(timings) * 1000, 3)}
+        if simulated:
+            result.update(bytes=sim.bytes_sent, transfers=sim.transfers, panel_ms=round(sim.clock_ms, 1))
+        yield result
+    epd.sleep()
+
+
+def main() -> None:
+    argparser = ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument("--panels", help="Comma separated driver modules (default: all with refresh modes)")
+    argparser.add_argument("--repeat", type=int, default=3, help="Median of this many runs")
+    argparser.add_argument("--output-file", help="Append results as JSON lines")
+    args = argparser.parse_args()
+
+    panels = args.panels.split(",") if args.panels else mode_panels()
+    run = {"commit": git_commit(), "time": time.time()}
+
+    print("%-14s %-8s %10s %8s %9s %10s" % ("panel", "mode", "host ms", "bytes", "transfers", "panel ms"))
+    for panel in panels:
+        for result in bench_panel(panel, args.repeat):
+            if "panel_ms" in result:
+                print(
+                    "%-14s %-8s %10.2f %8d %9d %10.1f"
+                    % (
+                        panel,
+                        result["mode"],
+                        result["host_ms"],
+                        result["bytes"],
+                        result["transfers"],
+                        result["panel_ms"],
+                    )
+                )
+            else:
+                print("%-14s %-8s %10.2f" % (panel, result["mode"], result["host_ms"]))
+            if args.output_file:
+                with open(args.output_file, "a") as output_file:
+                    output_file.write(json.dumps({**run, **result}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""SPI bus arbitration between panels and other devices sharing a bus.
+
+Drivers send a command and its parameters as separate SPI writes, toggling
+DC and CS in between, so two threads using one bus can interleave them and
+corrupt both. A Bus hands the bus to one transaction at a time: a command
+and all the data after it, up to the driver's next command or until it
+waits (BUSY poll, delay, module exit), which is when another panel's
+transfers can go out. Waiting transactions queue in arrival order, so one
+panel's long display() cannot starve another's init():
+
+    shared = bus.for_backend(backend)
+    shared.attach(epd, backend)
+    ...
+    logger.info(shared.format_stats())
+
+Other code using the bus, e.g. a sensor on another chip select, takes it
+for a transaction with `with shared.transaction():`.
+"""
+import collections
+import contextlib
+import functools
+import inspect
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# epdconfig functions during which the driver holds no transaction
+WAIT_FUNCTIONS = ("delay_ms", "digital_read", "module_exit")
+# Driver methods doing the transfers, all others end the transaction when
+# they return so the bus is free while the caller e.g. encodes the next frame
+TRANSFER_METHODS = ("send_command", "send_data", "send_data2")
+
+_buses = {}
+_buses_lock = threading.Lock()
+
+
+def for_backend(backend):
+    """The Bus of the SPI bus `backend` is configured for."""
+    number = backend.settings["bus"]
+    with _buses_lock:
+        if number not in _buses:
+            _buses[number] = Bus("spi%d" % number)
+        return _buses[number]
+
+
+class Bus:
+    def __init__(self, name):
+        self.name = name
+        self.condition = threading.Condition()
+        self.owner = None
+        self.depth = 0
+        self.acquired_at = 0.0
+        self.pending = collections.deque()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.transactions = 0
+        self.contended = 0
+        self.wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.held_ms = 0.0
+        self.max_pending = 0
+
+    # ---- locking ------------------------------------------------------------
+    def acquire(self, owner):
+        """Start (or nest in) a transaction for `owner`, after the ones
+        already waiting."""
+        if self.owner is owner:
+            self.depth += 1
+            return
+        with self.condition:
+            start = time.perf_counter()
+            contended = self.owner is not None
+            self.pending.append(owner)
+            self.max_pending = max(self.max_pending, len(self.pending))
+            while self.owner is not None or self.pending[0] is not owner:
+                self.condition.wait()
+            self.pending.popleft()
+            self.owner = owner
+            self.depth = 1
+            self.acquired_at = time.perf_counter()
+            waited_ms = (self.acquired_at - start) * 1000
+            self.transactions += 1
+            self.contended += contended
+            self.wait_ms += waited_ms
+            self.max_wait_ms = max(self.max_wait_ms, waited_ms)
+
+    def release(self, owner, all_levels=False):
+        """End the transaction of `owner`, if it holds one."""
+        if self.owner is not owner:
+            return
+        with self.condition:
+            self.depth = 0 if all_levels else self.depth - 1
+            if self.depth > 0:
+                return
+            self.held_ms += (time.perf_counter() - self.acquired_at) * 1000
+            self.owner = None
+            self.condition.notify_all()
+
+    @contextlib.contextmanager
+    def transaction(self, owner=None):
+        owner = owner or threading.current_thread()
+        self.acquire(owner)
+        try:
+            yield self
+        finally:
+            self.release(owner)
+
+    # ---- drivers ------------------------------------------------------------
+    def attach(self, epd, config):
+        """Make `epd`'s commands with their data transactions on this bus.
+
+        `config` is the epdconfig module or backend the driver uses."""
+        send_command = epd.send_command
+
+        @functools.wraps(send_command)
+        def command(*args, **kwargs):
+            # Every command starts a new transaction, at the end of the queue
+            self.release(epd, all_levels=True)
+            self.acquire(epd)
+            return send_command(*args, **kwargs)
+
+        epd.send_command = command
+
+        for name in ("send_data", "send_data2"):
+            send = getattr(epd, name, None)
+            if send is None:
+                continue
+
+            @functools.wraps(send)
+            def data(*args, _send=send, **kwargs):
+                # Data after a wait continues the command in a new transaction
+                if self.owner is not epd:
+                    self.acquire(epd)
+                return _send(*args, **kwargs)
+
+            setattr(epd, name, data)
+
+        for name, method in inspect.getmembers(epd, inspect.ismethod):
+            if name.startswith("_") or name in TRANSFER_METHODS:
+                continue
+
+            @functools.wraps(method)
+            def operation(*args, _method=method, **kwargs):
+                try:
+                    return _method(*args, **kwargs)
+                finally:
+                    self.release(epd, all_levels=True)
+
+            setattr(epd, name, operation)
+
+        for name in WAIT_FUNCTIONS:
+            original = getattr(config, name)
+
+            @functools.wraps(original)
+            def waiting(*args, _original=original, **kwargs):
+                self.release(epd, all_levels=True)
+                return _original(*args, **kwargs)
+
+            setattr(config, name, waiting)
+        return epd
+
+    # ---- metrics ------------------------------------------------------------
+    def stats(self):
+        return {
+            "bus": self.name,
+            "transactions": self.transactions,
+            "contended": self.contended,
+            "wait_ms": round(self.wait_ms, 3),
+            "max_wait_ms": round(self.max_wait_ms, 3),
+            "held_ms": round(self.held_ms, 3),
+            "max_pending": self.max_pending,
+        }
+
+    def format_stats(self):
+        stats = self.stats()
+        share = 100.0 * stats["contended"] / stats["transactions"] if stats["transactions"] else 0.0
+        return (
+            "%(bus)s: %(transactions)d transactions, %(contended)d waited" % stats
+            + " (%.1f%%), %.1f ms waiting (max %.1f ms), %.1f ms held, up to %d queued"
+            % (share, stats["wait_ms"], stats["max_wait_ms"], stats["held_ms"], stats["max_pending"])
+        )
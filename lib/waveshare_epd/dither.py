@@ -0,0 +1,226 @@
+"""Dithering engines for the colour panels.
+
+Every engine maps an image to palette indices, the colour codes the
+controller expects, as a 2D uint8 array:
+
+    indices = dither.dither(image, "bayer", "acep7")
+    buf = palette.pack(indices, 4)
+
+Engines, roughly fastest first:
+
+  none             nearest colour, no dithering
+  bayer            ordered dithering with an 8x8 Bayer matrix
+  blue-noise       ordered dithering with a 64x64 void-and-cluster mask
+  floyd-steinberg  error diffusion, in PIL's C quantizer
+  atkinson         error diffusion that keeps 3/4 of the error, in Python,
+                   slow but with less bleeding into flat areas
+
+Colours are matched against the colours the panels really show, which are
+darker and less saturated than the ideal RGB values the drivers send. The
+defaults below are rough values; measure your own panel, e.g. photograph it
+next to a grey card, and put the results in ~/.config/waveshare_epd/palettes.json
+or the file named by EPD_PALETTE_FILE:
+
+    {"acep7": [[57, 48, 57], [255, 255, 255], [58, 91, 70], ...]}
+
+Palettes are lists in controller code order, named by the panel colours of
+emulator.PANELS: bw, bwr, bwy, g4 and acep7.
+"""
+import functools
+import json
+import logging
+import os
+
+import numpy as np
+from PIL import Image
+
+from . import palette
+
+logger = logging.getLogger(__name__)
+
+PALETTE_FILE = os.environ.get(
+    "EPD_PALETTE_FILE", os.path.expanduser("~/.config/waveshare_epd/palettes.json")
+)
+
+PAPER_BLACK = (38, 38, 38)
+PAPER_WHITE = (214, 214, 206)
+INK_RED = (164, 40, 40)
+INK_YELLOW = (222, 190, 40)
+
+DEFAULT_PALETTES = {
+    "bw": (PAPER_BLACK, PAPER_WHITE),
+    "bwr": (PAPER_BLACK, PAPER_WHITE, INK_RED),
+    "bwy": (PAPER_BLACK, PAPER_WHITE, INK_YELLOW),
+    # Same code order as palette.FOUR_COLOUR and palette.SEVEN_COLOUR
+    "g4": (PAPER_BLACK, PAPER_WHITE, INK_YELLOW, INK_RED),
+    "acep7": (
+        (57, 48, 57),
+        (255, 255, 255),
+        (58, 91, 70),
+        (61, 59, 94),
+        (156, 72, 75),
+        (208, 190, 71),
+        (177, 106, 73),
+    ),
+}
+
+BAYER_2 = np.array([[0, 2], [3, 1]])
+
+ENGINES = ("none", "bayer", "blue-noise", "floyd-steinberg", "atkinson")
+
+
+def load_palettes(palette_file=None):
+    """Default palettes updated with the measured ones from the palette file."""
+    palettes = dict(DEFAULT_PALETTES)
+    palette_file = palette_file or PALETTE_FILE
+    if os.path.exists(palette_file):
+        with open(palette_file) as measured:
+            for name, colours in json.load(measured).items():
+                palettes[name] = tuple(tuple(int(c) for c in colour) for colour in colours)
+    return palettes
+
+
+@functools.lru_cache(maxsize=None)
+def bayer_matrix(size=8):
+    """Thresholds in [0, 1) of the size x size Bayer matrix."""
+    matrix = BAYER_2
+    while len(matrix) < size:
+        matrix = np.block([[4 * matrix, 4 * matrix + 2], [4 * matrix + 3, 4 * matrix + 1]])
+    return (matrix + 0.5) / matrix.size
+
+
+@functools.lru_cache(maxsize=None)
+def blue_noise(size=64, sigma=1.5, seed=0):
+    """Thresholds in [0, 1) of a size x size void-and-cluster mask."""
+    offsets = np.minimum(np.arange(size), size - np.arange(size))
+    kernel = np.exp(-(offsets[:, None] ** 2 + offsets[None, :] ** 2) / (2 * sigma**2))
+
+    def splat(energy, index, sign):
+        y, x = divmod(int(index), size)
+        energy += sign * np.roll(kernel, (y, x), axis=(0, 1))
+
+    # Initial pattern: random points relaxed until the tightest cluster is
+    # also the largest void
+    pattern = np.random.default_rng(seed).random((size, size)) < 0.1
+    energy = np.zeros((size, size))
+    for index in np.flatnonzero(pattern):
+        splat(energy, index, 1)
+    while True:
+        cluster = np.where(pattern, energy, -np.inf).argmax()
+        pattern.flat[cluster] = False
+        splat(energy, cluster, -1)
+        void = np.where(pattern, np.inf, energy).argmin()
+        pattern.flat[void] = True
+        splat(energy, void, 1)
+        if void == cluster:
+            break
+
+    ranks = np.zeros(size * size)
+    ones = int(pattern.sum())
+    # Ranks below the initial pattern: remove tightest clusters
+    removing, removing_energy = pattern.copy(), energy.copy()
+    for rank in range(ones - 1, -1, -1):
+        cluster = np.where(removing, removing_energy, -np.inf).argmax()
+        removing.flat[cluster] = False
+        splat(removing_energy, cluster, -1)
+        ranks[cluster] = rank
+    # Ranks above it: fill largest voids
+    for rank in range(ones, size * size):
+        void = np.where(pattern, np.inf, energy).argmin()
+        pattern.flat[void] = True
+        splat(energy, void, 1)
+        ranks[void] = rank
+    return ((ranks + 0.5) / ranks.size).reshape(size, size)
+
+
+def compress(rgb, colours):
+    """Scale 0..255 into the range between the panel's black and white, so
+    error diffusion does not chase whites the paper cannot show."""
+    black = np.array(colours[0], dtype=np.float32)
+    white = np.array(colours[1], dtype=np.float32)
+    return black + rgb.astype(np.float32) * ((white - black) / 255)
+
+
+def nearest(rgb, colours):
+    """Index of the nearest colour for every pixel of a float RGB array,
+    through the palette's RGB lookup cube."""
+    cells = np.clip(rgb, 0, 255).astype(np.uint8) >> (8 - palette.CUBE_BITS)
+    cube = palette.lookup_cube(tuple(tuple(map(int, colour)) for colour in colours))
+    return cube[cells[..., 0], cells[..., 1], cells[..., 2]]
+
+
+def spread(colours):
+    """Widest per channel gap between a palette colour and its nearest
+    neighbour, the range ordered dithering has to bridge."""
+    colours = np.array(colours, dtype=np.float32)
+    steps = np.abs(colours[:, None] - colours[None, :]).max(axis=-1)
+    steps[np.diag_indices(len(colours))] = np.inf
+    return float(steps.min(axis=1).max())
+
+
+def ordered(rgb, colours, thresholds):
+    height, width = rgb.shape[:2]
+    size = len(thresholds)
+    tiled = np.tile(thresholds, (height // size + 1, width // size + 1))[:height, :width]
+    return nearest(rgb + (spread(colours) * (tiled - 0.5))[..., None], colours)
+
+
+def atkinson(rgb, colours):
+    height, width = rgb.shape[:2]
+    colours = [tuple(map(float, colour)) for colour in colours]
+    cube = palette.lookup_cube(tuple(tuple(map(int, colour)) for colour in colours))
+    shift = 8 - palette.CUBE_BITS
+    rows = [[list(pixel) for pixel in row] for row in rgb.tolist()]
+    indices = np.zeros((height, width), dtype=np.uint8)
+    neighbours = ((0, 1), (0, 2), (1, -1), (1, 0), (1, 1), (2, 0))
+    for y in range(height):
+        row = rows[y]
+        out = indices[y]
+        for x in range(width):
+            r, g, b = row[x]
+            index = cube[
+                min(max(int(r), 0), 255) >> shift,
+                min(max(int(g), 0), 255) >> shift,
+                min(max(int(b), 0), 255) >> shift,
+            ]
+            out[x] = index
+            cr, cg, cb = colours[index]
+            er, eg, eb = (r - cr) / 8, (g - cg) / 8, (b - cb) / 8
+            for dy, dx in neighbours:
+                ny, nx = y + dy, x + dx
+                if ny < height and 0 <= nx < width:
+                    pixel = rows[ny][nx]
+                    pixel[0] += er
+                    pixel[1] += eg
+                    pixel[2] += eb
+    return indices
+
+
+def dither(image, engine="floyd-steinberg", colours="bw", palette_file=None):
+    """Palette indices of `image` for the panel colours or palette `colours`."""
+    if isinstance(colours, str):
+        colours = load_palettes(palette_file)[colours]
+    rgb = compress(np.asarray(image.convert("RGB")), colours)
+    if engine == "none":
+        return nearest(rgb, colours)
+    if engine == "bayer":
+        return ordered(rgb, colours, bayer_matrix())
+    if engine == "blue-noise":
+        return ordered(rgb, colours, blue_noise())
+    if engine == "floyd-steinberg":
+        compressed = Image.fromarray(rgb.round().astype(np.uint8), "RGB")
+        quantized = compressed.quantize(palette=palette.palette_image(tuple(colours)))
+        indices = np.array(quantized, dtype=np.uint8)
+        # Padding entries repeat the first colour
+        indices[indices >= len(colours)] = 0
+        return indices
+    if engine == "atkinson":
+        return atkinson(rgb, colours)
+    raise ValueError("Unknown dithering engine %r, expected one of %s" % (engine, ", ".join(ENGINES)))
+
+
+def render(indices, colours="bw", palette_file=None):
+    """RGB image of what the panel shows for these indices."""
+    if isinstance(colours, str):
+        colours = load_palettes(palette_file)[colours]
+    return Image.fromarray(np.array(colours, dtype=np.uint8)[indices], "RGB")
@@ -0,0 +1,435 @@
+"""Panel emulator: an epdconfig backend that shows what the controller would.
+
+The Emulator decodes the command/data stream the drivers send, keeps the
+controller RAM planes, and on every refresh command turns them into an RGB
+picture, optionally saved as a PNG snapshot. BUSY waits are charged to the
+Simulated virtual clock with a per-family refresh time model, so dry runs
+test rendering and partial update logic end to end at full speed.
+
+    from lib.waveshare_epd import epdconfig, epd2in13b_V3   # EPD_BACKEND=Simulated
+    from lib.waveshare_epd.emulator import Emulator
+
+    epd = epd2in13b_V3.EPD()
+    emulator = epdconfig.use(Emulator.for_epd(epd, snapshot_dir="snapshots"))
+    epd.init()
+    epd.display(epd.getbuffer(black), epd.getbuffer(red))
+    emulator.image.show()
+
+Controller families:
+  uc81xx   RAM 0x10 (old or black) and 0x13 (new or red), refresh 0x12,
+           partial window 0x90 between partial in/out 0x91/0x92, whose
+           refreshes only redraw the window
+  ssd16xx  RAM 0x24 (black/white) and 0x26 (red or old), address window
+           0x44/0x45, cursor 0x4E/0x4F, entry mode 0x11, refresh 0x20 with
+           the update sequence from 0x22
+  uc8159   4 bits per pixel in 0x10, 0 black, 3 white, 4 red
+  acep     7 colour, 4 bits per pixel in 0x10
+  g4       4 colour, 2 bits per pixel in 0x10
+
+The 7.5" HD panels (SSD1677) scan their gates backwards from where the
+drivers start writing, so their snapshots come out shifted and upside down.
+"""
+import logging
+import os
+
+import numpy as np
+from PIL import Image
+
+from . import epdconfig
+
+logger = logging.getLogger(__name__)
+
+UC81XX = "uc81xx"
+SSD16XX = "ssd16xx"
+UC8159 = "uc8159"
+ACEP = "acep"
+G4 = "g4"
+
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+RED = (255, 0, 0)
+YELLOW = (255, 255, 0)
+
+# Driver module: (controller family, colours)
+PANELS = {
+    "epd1in02": (UC81XX, "bw"),
+    "epd1in54": (SSD16XX, "bw"),
+    "epd1in54_V2": (SSD16XX, "bw"),
+    "epd1in54b": (UC81XX, "bwr"),
+    "epd1in54b_V2": (SSD16XX, "bwr"),
+    "epd1in54c": (UC81XX, "bwy"),
+    "epd1in64g": (G4, "g4"),
+    "epd2in13": (SSD16XX, "bw"),
+    "epd2in13_V2": (SSD16XX, "bw"),
+    "epd2in13_V3": (SSD16XX, "bw"),
+    "epd2in13b_V3": (UC81XX, "bwr"),
+    "epd2in13b_V4": (SSD16XX, "bwr"),
+    "epd2in13bc": (UC81XX, "bwr"),
+    "epd2in13d": (UC81XX, "bw"),
+    "epd2in36g": (G4, "g4"),
+    "epd2in66": (SSD16XX, "bw"),
+    "epd2in66b": (SSD16XX, "bwr"),
+    "epd2in7": (UC81XX, "bw"),
+    "epd2in7b": (UC81XX, "bwr"),
+    "epd2in7b_V2": (SSD16XX, "bwr"),
+    "epd2in9": (SSD16XX, "bw"),
+    "epd2in9_V2": (SSD16XX, "bw"),
+    "epd2in9b_V3": (UC81XX, "bwr"),
+    "epd2in9bc": (UC81XX, "bwr"),
+    "epd2in9d": (UC81XX, "bw"),
+    "epd3in0g": (G4, "g4"),
+    "epd3in52": (UC81XX, "bw"),
+    "epd3in7": (SSD16XX, "bw"),
+    "epd4in01f": (ACEP, "acep7"),
+    "epd4in2": (UC81XX, "bw"),
+    "epd4in2b_V2": (UC81XX, "bwr"),
+    "epd4in2bc": (UC81XX, "bwr"),
+    "epd4in37g": (G4, "g4"),
+    "epd5in65f": (ACEP, "acep7"),
+    "epd5in83": (UC8159, "bw"),
+    "epd5in83_V2": (UC81XX, "bw"),
+    "epd5in83b_V2": (UC81XX, "bwr"),
+    "epd5in83bc": (UC8159, "bwr"),
+    "epd7in3f": (ACEP, "acep7"),
+    "epd7in3g": (G4, "g4"),
+    "epd7in5": (UC8159, "bw"),
+    "epd7in5_HD": (SSD16XX, "bw"),
+    "epd7in5_V2": (UC81XX, "bw"),
+    "epd7in5b_HD": (SSD16XX, "bwr"),
+    "epd7in5b_V2": (UC81XX, "bwr"),
+    "epd7in5bc": (UC8159, "bwr"),
+}
+
+# Where a driver differs from its family: the bit value that means black (or
+# red) in a plane, as UC8179 panels run in "KW" mode and some drivers invert,
+# 2 bits per pixel black planes, SSD1677 pixel x addresses, the UC8151 and
+# UC8176 data polarity bit (DDX[0] of 0x50), which partial refreshes clear,
+# and the IL91874 VCOM LUT, which starts with 2 bytes before its groups
+PANEL_OPTIONS = {
+    "epd1in54b": {"black_bits": 2},
+    "epd2in13d": {"ddx": True},
+    "epd2in9d": {"inverse_lut": (0x23, "lut_wb1")},
+    "epd2in7": {"vcom_lut_offset": 2, "gray_lut": (0x24, "gray_lut_bb")},
+    "epd3in7": {"pixel_x": True, "gray_lut": (0x32, "lut_4Gray_GC")},
+    "epd4in2": {"ddx": True, "gray_lut": (0x24, "EPD_4IN2_4Gray_lut_bb")},
+    "epd2in7b": {"black_level": 1, "red_level": 1},
+    "epd5in83_V2": {"black_level": 1},
+    "epd5in83b_V2": {"red_level": 1},
+    "epd7in5_V2": {"black_level": 1},
+    "epd7in5b_V2": {"red_level": 1},
+    "epd7in5_HD": {"pixel_x": True},
+    "epd7in5b_HD": {"pixel_x": True},
+}
+
+# Rough refresh durations in ms from the panel datasheets
+FULL_REFRESH_MS = {"bw": 2000, "bwr": 15000, "bwy": 15000, "g4": 20000, "acep7": 30000}
+PARTIAL_REFRESH_MS = 400
+# UC81xx frame rates of the PLL settings (0x30) the drivers use. Refreshes
+# with an uploaded LUT last as many frames as its VCOM LUT (0x20) has, e.g.
+# 46 frames for the 0.9 s GC and 16 for the 0.3 s DU waveform of the 3.52".
+PLL_HZ = {0x3C: 50, 0x3A: 100, 0x29: 150, 0x39: 200, 0x31: 171}
+DEFAULT_FRAME_HZ = 50
+# SSD16xx update sequence bit that drives the panel; without it 0x20 only
+# e.g. powers up the analog circuits
+SSD_DISPLAY = 0x04
+# SSD16xx display update sequences (0x22) that skip the full waveform
+SSD_PARTIAL_SEQUENCES = (0x0C, 0x0F, 0xCF, 0xFF)
+
+PALETTES = {
+    ACEP: [BLACK, WHITE, (0, 255, 0), (0, 0, 255), RED, YELLOW, (255, 128, 0), WHITE],
+    G4: [BLACK, WHITE, YELLOW, RED],
+    # UC8159 4 bits per pixel, 1 and 2 are the gray levels of the b/w panels
+    UC8159: [BLACK, (85, 85, 85), (170, 170, 170), WHITE, RED, WHITE, WHITE, WHITE],
+}
+GRAYS = [BLACK, (85, 85, 85), (170, 170, 170), WHITE]
+
+
+def lut_frames(table):
+    """Frames a UC81xx LUT runs for: groups of a level byte, four phase
+    lengths and a repeat count."""
+    return sum(sum(table[i + 1:i + 5]) * table[i + 5] for i in range(0, len(table) - 5, 6))
+
+
+class Emulator(epdconfig.Simulated):
+    def __init__(self, width, height, family=UC81XX, colours="bw", name="epd",
+                 snapshot_dir=None, record=False, black_level=0, red_level=None,
+                 black_bits=1, pixel_x=False, ddx=False, vcom_lut_offset=0, gray_lut=None,
+                 inverse_lut=None):
+        self.width = width
+        self.height = height
+        self.family = family
+        self.colours = colours
+        self.name = name
+        self.snapshot_dir = snapshot_dir
+        self.black_level = black_level
+        self.black_bits = black_bits
+        self.pixel_x = pixel_x
+        self.ddx = ddx
+        self.vcom_lut_offset = vcom_lut_offset
+        # UC81xx red planes are 0 for red, SSD16xx ones 1
+        self.red_level = red_level if red_level is not None else int(family == SSD16XX)
+        # (register, table) of the driver's 4-gray waveform: while the
+        # register holds it, render the two b/w planes as 4 gray levels
+        self.gray_lut = gray_lut
+        # (register, table) of a waveform that drives pixels to the opposite
+        # of their new data, as the 2.9" D's partial one ("wb" drives white)
+        self.inverse_lut = inverse_lut
+        self.BUSY_MS = {0x12: 10} if family == SSD16XX else {0x02: 30, 0x04: 80}
+        super().__init__(record=record)
+        self.power_cycle()
+
+    @classmethod
+    def for_epd(cls, epd, **kwargs):
+        name = type(epd).__module__.rsplit(".", 1)[-1]
+        family, colours = PANELS.get(name, (UC81XX, "bw"))
+        options = dict(PANEL_OPTIONS.get(name, {}), **kwargs)
+        for option in ("gray_lut", "inverse_lut"):
+            if options.get(option) and isinstance(options[option][1], str):
+                # Named by the driver attribute that holds the table
+                register, table = options[option]
+                options[option] = (register, bytes(getattr(epd, table)))
+        return cls(epd.width, epd.height, family, colours, name=name, **options)
+
+    # ---- controller state ---------------------------------------------------
+    def power_cycle(self):
+        """Controller state after a hardware reset; RAM keeps its contents."""
+        if self.family in (ACEP, UC8159):
+            self.line_bytes = (self.width + 1) // 2
+            planes = (0x10,)
+        elif self.family == G4:
+            self.line_bytes = (self.width + 3) // 4
+            planes = (0x10,)
+        elif self.family == SSD16XX:
+            self.line_bytes = (self.width + 7) // 8
+            planes = (0x24, 0x26)
+        else:
+            self.line_bytes = (self.width + 7) // 8
+            planes = (0x10, 0x13)
+        size = self.line_bytes * self.height
+        if not hasattr(self, "ram"):
+            self.ram = {plane: bytearray(b"\xff" * size) for plane in planes}
+            if self.black_bits > 1:
+                self.ram[planes[0]] = bytearray(b"\xff" * size * self.black_bits)
+            self.refreshes = 0
+            self.snapshots = []
+            self.image = None
+        self.entry_mode = 0x03
+        self.update_sequence = 0xC7
+        self.ram_options = {}
+        self.partial = False
+        self.inverted = False
+        self.vcom_lut = None
+        self.gray = False
+        self.lut_inverts = False
+        self.frame_hz = DEFAULT_FRAME_HZ
+        self.window = (0, self.line_bytes - 1, 0, self.height - 1)
+        self.x, self.y = 0, 0
+        self.plane = None
+        self.params = bytearray()
+        self.current = None
+
+    def digital_write(self, pin, value):
+        # Reset is active low: a pulse resets the controller registers
+        if pin == self.RST_PIN and value == 0 and self.pins.get(pin, 1) == 1:
+            self.power_cycle()
+        super().digital_write(pin, value)
+
+    def command(self, command):
+        self._apply(self.current, self.params)
+        super().command(command)
+        self.current = command
+        self.params = bytearray()
+        self.plane = command if command in self.ram else None
+        if self.plane is not None and self.family != SSD16XX:
+            # UC81xx restarts the data pointer at every data transmission
+            x0, _, y0, _ = self.active_window()
+            self.x, self.y = x0, y0
+
+        if self.family == SSD16XX:
+            if command == 0x12:
+                self.power_cycle()
+                self.current = 0x12
+            elif command == 0x20 and self.update_sequence & SSD_DISPLAY:
+                partial = self.update_sequence in SSD_PARTIAL_SEQUENCES
+                self.refresh(partial)
+        elif command in (0x12, 0x17):
+            # Display refresh, or the auto power on/refresh/power off sequence
+            self.refresh(self.partial)
+        elif command == 0x91:
+            self.partial = True
+        elif command == 0x92:
+            self.partial = False
+
+    def data(self, data):
+        super().data(data)
+        if self.plane is None:
+            self.params.extend(byte & 0xFF for byte in data)
+            return
+        try:
+            data = bytes(data)
+        except ValueError:
+            data = bytes(byte & 0xFF for byte in data)
+        self.write(self.ram[self.plane], data)
+
+    def _apply(self, command, params):
+        """Latch the parameters of the previous register command."""
+        if command is None or not params:
+            return
+        if self.gray_lut and command == self.gray_lut[0]:
+            # Drivers may send a prefix of the table (epd2in7)
+            self.gray = bytes(params) == self.gray_lut[1][:len(params)]
+        if self.inverse_lut and command == self.inverse_lut[0]:
+            self.lut_inverts = bytes(params) == self.inverse_lut[1][:len(params)]
+        if self.family == SSD16XX:
+            if command == 0x11:
+                self.entry_mode = params[0]
+            elif command == 0x21:
+                # RAM content option: 0x8 inverse, 0x4 bypass as 0
+                self.ram_options = {0x26: params[0] >> 4, 0x24: params[0] & 0x0F}
+            elif command == 0x22:
+                self.update_sequence = params[0]
+            elif command == 0x44 and self.pixel_x and len(params) >= 4:
+                x0, x1 = sorted(((params[0] | params[1] << 8) // 8, (params[2] | params[3] << 8) // 8))
+                self.window = (x0, x1) + self.window[2:]
+            elif command == 0x44 and len(params) >= 2:
+                x0, x1 = sorted(params[:2])
+                self.window = (x0, x1) + self.window[2:]
+            elif command == 0x45 and len(params) >= 4:
+                y0, y1 = sorted((params[0] | params[1] << 8, params[2] | params[3] << 8))
+                self.window = self.window[:2] + (y0, y1)
+            elif command == 0x4E:
+                self.x = (params[0] | params[1] << 8) // 8 if self.pixel_x and len(params) > 1 else params[0]
+            elif command == 0x4F:
+                self.y = params[0] | (params[1] << 8 if len(params) > 1 else 0)
+        elif command == 0x90:
+            # Partial window: 1 byte horizontal fields on small controllers,
+            # 2 bytes on UC8176/UC8179, 1 byte vertical ones on the 1.02"
+            if len(params) >= 9:
+                h0, h1 = params[0] << 8 | params[1], params[2] << 8 | params[3]
+                v0, v1 = params[4] << 8 | params[5], params[6] << 8 | params[7]
+            elif len(params) >= 7:
+                h0, h1 = params[0], params[1]
+                v0, v1 = params[2] << 8 | params[3], params[4] << 8 | params[5]
+            elif len(params) >= 5:
+                h0, h1, v0, v1 = params[:4]
+            else:
+                return
+            self.window = (h0 // 8, h1 // 8, v0, v1)
+        elif command == 0x20 and self.family == UC81XX:
+            self.vcom_lut = bytes(params[self.vcom_lut_offset:])
+        elif command == 0x30 and self.family == UC81XX:
+            self.frame_hz = PLL_HZ.get(params[0], DEFAULT_FRAME_HZ)
+        elif command == 0x50 and self.ddx:
+            self.inverted = not params[0] & 0x10
+
+    def active_window(self, line_bytes=None):
+        if self.family == SSD16XX or self.partial:
+            return self.window
+        return (0, (line_bytes or self.line_bytes) - 1, 0, self.height - 1)
+
+    def write(self, ram, data):
+        """Store data at the address counter, which walks the active window
+        in the entry mode direction and wraps around at its end."""
+        line_bytes = len(ram) // self.height
+        x0, x1, y0, y1 = self.active_window(line_bytes)
+        xstep = 1 if self.family != SSD16XX or self.entry_mode & 0x01 else -1
+        ystep = 1 if self.family != SSD16XX or self.entry_mode & 0x02 else -1
+        if not x0 <= self.x <= x1:
+            self.x = x0 if xstep > 0 else x1
+        i, n = 0, len(data)
+        while i < n:
+            if xstep > 0:
+                # Whole row segments at a time
+                take = min(n - i, x1 - self.x + 1)
+                if 0 <= self.y < self.height:
+                    stop = min(self.x + take, line_bytes)
+                    if stop > self.x:
+                        start = self.y * line_bytes
+                        ram[start + self.x:start + stop] = data[i:i + stop - self.x]
+            else:
+                take = 1
+                if 0 <= self.x < line_bytes and 0 <= self.y < self.height:
+                    ram[self.y * line_bytes + self.x] = data[i]
+            i += take
+            self.x += take * xstep
+            if not x0 <= self.x <= x1:
+                self.x = x0 if xstep > 0 else x1
+                self.y += ystep
+                if not y0 <= self.y <= y1:
+                    self.y = y0 if ystep > 0 else y1
+
+    # ---- refresh ------------------------------------------------------------
+    def refresh(self, partial=False):
+        if self.vcom_lut:
+            duration = lut_frames(self.vcom_lut) * 1000 / self.frame_hz
+        elif partial:
+            duration = PARTIAL_REFRESH_MS
+        else:
+            duration = FULL_REFRESH_MS.get(self.colours, 2000)
+        self.busy_until_ms = max(self.busy_until_ms, self.clock_ms + duration)
+        if partial and self.family == UC81XX and self.image is not None:
+            # Only the pixels in the partial window are driven
+            x0, x1, y0, y1 = self.window
+            box = (x0 * 8, y0, min((x1 + 1) * 8, self.width), y1 + 1)
+            image = self.image.copy()
+            image.paste(self.render().crop(box), box[:2])
+            self.image = image
+        else:
+            self.image = self.render()
+        self.refreshes += 1
+        logger.debug("%s refresh %d (%s, %d ms)", self.name, self.refreshes,
+                     "partial" if partial else "full", duration)
+        if self.snapshot_dir:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            path = os.path.join(self.snapshot_dir, "%s-%04d.png" % (self.name, self.refreshes))
+            self.image.save(path)
+            self.snapshots.append(path)
+
+    def _bits(self, plane):
+        bits = np.unpackbits(np.frombuffer(bytes(self.ram[plane]), dtype=np.uint8))
+        bits = bits.reshape(self.height, -1)
+        if bits.shape[1] >= 2 * self.width:
+            # 2 bits per pixel, 11 white and 00 black
+            bits = bits[:, ::2]
+        bits = bits[:, :self.width]
+        option = self.ram_options.get(plane, 0)
+        if option & 0x8:
+            bits = 1 - bits
+        elif option & 0x4:
+            bits = np.zeros_like(bits)
+        return bits
+
+    def _indexed(self, bits_per_pixel):
+        ram = np.frombuffer(bytes(self.ram[0x10]), dtype=np.uint8).reshape(self.height, self.line_bytes)
+        per_byte = 8 // bits_per_pixel
+        mask = (1 << bits_per_pixel) - 1
+        shifts = np.arange(8 - bits_per_pixel, -1, -bits_per_pixel, dtype=np.uint8)
+        index = (ram[:, :, None] >> shifts) & mask
+        return index.reshape(self.height, self.line_bytes * per_byte)[:, :self.width]
+
+    def render(self):
+        if self.family in PALETTES:
+            bits_per_pixel = 2 if self.family == G4 else 4
+            palette = np.array(PALETTES[self.family], dtype=np.uint8)
+            if self.family == UC8159 and self.colours == "bw":
+                palette[4] = (128, 128, 128)
+            return Image.fromarray(palette[self._indexed(bits_per_pixel)], "RGB")
+
+        pixels = np.full((self.height, self.width, 3), 255, dtype=np.uint8)
+        if self.family == SSD16XX:
+            black_plane, other_plane = 0x24, 0x26
+        elif self.colours == "bw":
+            black_plane, other_plane = 0x13, 0x10
+        else:
+            black_plane, other_plane = 0x10, 0x13
+
+        if self.gray:
+            # (old, new) bits: 11 white, 10 light gray, 01 dark gray, 00 black
+            level = self._bits(other_plane) * 2 + self._bits(black_plane)
+            return Image.fromarray(np.array(GRAYS, dtype=np.uint8)[level], "RGB")
+
+        pixels[self._bits(black_plane) == self.black_level ^ self.inverted ^ self.lut_inverts] = BLACK
+        if self.colours in ("bwr", "bwy"):
+            accent = RED if self.colours == "bwr" else YELLOW
+            pixels[self._bits(other_plane) == self.red_level] = accent
+        return Image.fromarray(pixels, "RGB")
@@ -29,7 +29,8 @@
 #
 
 import logging
-from . import epdconfig
+from . import epdconfig, framebuffer, sequence
+from .sequence import step
 
 # Display resolution
 EPD_WIDTH       = 80
@@ -37,6 +38,37 @@ EPD_HEIGHT      = 128
 
 logger = logging.getLogger(__name__)
 
+INIT_SEQUENCE = (
+    step(0xD2, 0x3F),
+    step(0x00, 0x6F),  # from outside
+    step(0x01, 0x03, 0x00, 0x2b, 0x2b),  # power setting
+    step(0x06, 0x3f),  # Configuring the charge pump
+    step(0x2A, 0x00, 0x00),  # Setting XON and the options of LUT
+    step(0x30, 0x17),  # Set the clock frequency: 50Hz
+    step(0x50, 0x57),  # Set VCOM and data output interval
+    step(0x60, 0x22),  # Set The non-overlapping period of Gate and Source.
+    step(0x61,  # resolution setting
+         0x50,  # source 128
+         0x80,
+    ),
+    step(0x82, 0x12),  # sets VCOM_DC value: -1v
+    step(0xe3, 0x33),  # Set POWER SAVING
+)
+
+PARTIAL_INIT_SEQUENCE = (
+    step(0xD2, 0x3F),
+    step(0x00, 0x6F),  # from outside
+    step(0x01, 0x03, 0x00, 0x2b, 0x2b),  # power setting
+    step(0x06, 0x3f),  # Configuring the charge pump
+    step(0x2A, 0x00, 0x00),  # Setting XON and the options of LUT
+    step(0x30, 0x17),  # Set the clock frequency
+    step(0x50, 0xf2),  # Set VCOM and data output interval
+    step(0x60, 0x22),  # Set The non-overlapping period of Gate and Source.
+    step(0x82, 0x12),  # Set VCOM_DC value: -1v
+    step(0xe3, 0x33),  # Set POWER SAVING
+)
+
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -45,6 +77,8 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        # What the panel shows, the old data of partial refreshes
+        self.shadow = framebuffer.allocate(EPD_WIDTH, EPD_HEIGHT)
     
     #full screen update LUT
 
@@ -109,6 +143,13 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a lot of data
+    def send_data2(self, data):
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
@@ -151,43 +192,7 @@ class EPD:
         # EPD hardware init start
         self.reset()
         
-        self.send_command(0xD2)			
-        self.send_data(0x3F)
-
-        self.send_command(0x00)  			
-        self.send_data (0x6F)  #from outside
-
-        self.send_command(0x01)  #power setting
-        self.send_data (0x03)	    
-        self.send_data (0x00)
-        self.send_data (0x2b)		
-        self.send_data (0x2b) 
-
-        self.send_command(0x06)  #Configuring the charge pump
-        self.send_data(0x3f)
-
-        self.send_command(0x2A)  #Setting XON and the options of LUT
-        self.send_data(0x00) 
-        self.send_data(0x00) 
-
-        self.send_command(0x30)  #Set the clock frequency
-        self.send_data(0x17) #50Hz
-
-        self.send_command(0x50)  #Set VCOM and data output interval
-        self.send_data(0x57)			
-
-        self.send_command(0x60)  #Set The non-overlapping period of Gate and Source.
-        self.send_data(0x22)
-
-        self.send_command(0x61)  #resolution setting
-        self.send_data (0x50)    #source 128 	 
-        self.send_data (0x80)       
-
-        self.send_command(0x82)  #sets VCOM_DC value
-        self.send_data(0x12)  #-1v
-
-        self.send_command(0xe3)#Set POWER SAVING
-        self.send_data(0x33)
+        sequence.run(self, INIT_SEQUENCE, epdconfig)
         self.SetFulltReg()	
         self.send_command(0x04)     		#power on
         self.ReadBusy()
@@ -197,39 +202,7 @@ class EPD:
     def Partial_Init(self):
         self.reset()
         
-        self.send_command(0xD2)
-        self.send_data(0x3F)
-
-        self.send_command(0x00)
-        self.send_data (0x6F)  #from outside
-
-        self.send_command(0x01)  #power setting
-        self.send_data (0x03)
-        self.send_data (0x00)
-        self.send_data (0x2b)
-        self.send_data (0x2b)
-
-        self.send_command(0x06)  #Configuring the charge pump
-        self.send_data(0x3f)
-
-        self.send_command(0x2A)  #Setting XON and the options of LUT
-        self.send_data(0x00)
-        self.send_data(0x00)
-
-        self.send_command(0x30)  #Set the clock frequency
-        self.send_data(0x17)
-
-        self.send_command(0x50)  #Set VCOM and data output interval
-        self.send_data(0xf2)
-
-        self.send_command(0x60)  #Set The non-overlapping period of Gate and Source.
-        self.send_data(0x22)
-
-        self.send_command(0x82)  #Set VCOM_DC value
-        self.send_data(0x12)#-1v
-
-        self.send_command(0xe3)#Set POWER SAVING
-        self.send_data(0x33)
+        sequence.run(self, PARTIAL_INIT_SEQUENCE, epdconfig)
 
         self.SetPartReg()	
 
@@ -238,46 +211,19 @@ class EPD:
         # EPD hardware init end
         return 0
     
-    def getbuffer(self, image):
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+    def getbuffer(self, image, out=None):
+        return framebuffer.getbuffer(image, self.width, self.height, out)
 
     def Display(self, image):
         if (image == None):
             return
-        # Width = (self.width % 8 == 0)? (self.width / 8 ): (self.width / 8 + 1)
-        if(self.width % 8 == 0):
-            Width = self.width / 8
-        else:
-            Width = self.width / 8 + 1
             
         self.send_command(0x10)
-        for j in range(0, self.height):
-            for i in range(0, int(Width)):
-                self.send_data(0xff)  
+        self.send_data2(framebuffer.fill(0xff, len(self.shadow)))
         
         self.send_command(0x13)
-        for j in range(0, self.height):
-            for i in range(0, int(Width)):
-                self.send_data(image[i + j * int(Width)])  
+        self.send_data2(image)
+        self.shadow[:] = image
         self.TurnOnDisplay()
         
     def Clear(self):
@@ -290,45 +236,36 @@ class EPD:
         Height = self.height
         
         self.send_command(0x10)
-        for j in range(0, Height):
-            for i in range(0, int(Width)):
-                self.send_data(0x00)  
+        self.send_data2(framebuffer.fill(0x00, Height * int(Width)))
         
         self.send_command(0x13)
-        for j in range(0, Height):
-            for i in range(0, int(Width)):
-                self.send_data(0xff)  
+        self.send_data2(framebuffer.fill(0xff, Height * int(Width)))
+        self.shadow[:] = framebuffer.fill(0xff, len(self.shadow))
         self.TurnOnDisplay()
 
-    def DisplayPartial(self, old_Image, Image):
+    # DisplayPartial(Image) refreshes the pixels that differ from what the
+    # panel shows; DisplayPartial(old_Image, Image) compares with old_Image
+    def DisplayPartial(self, old_Image, Image=None):
+        if Image is None:
+            old_Image, Image = self.shadow, old_Image
+        box = framebuffer.changed(old_Image, Image, self.width, self.height)
+        if box is None:
+            logger.debug("panel already shows the image")
+            return
+        x0, y0, x1, y1 = box
 
         # Set partial Windows */
         self.send_command(0x91)		#This command makes the display enter partial mode
         self.send_command(0x90)		#resolution setting
-        self.send_data(0)           #x-start
-        self.send_data(79)       #x-end
+        self.send_data2([x0, x1 - 1, y0, y1 - 1, 0x00])  # x-start, x-end, y-start, y-end
 
-        self.send_data(0)
-        self.send_data(127)  #y-end
-        self.send_data(0x00)
-       
-        # Width = (self.width % 8 == 0)? (self.width / 8 ): (self.width / 8 + 1)
-        if(self.width % 8 == 0):
-            Width = self.width / 8
-        else:
-            Width = self.width / 8 + 1
-            
-        Height = self.height
         # send data
         self.send_command(0x10)
-        for j in range(0, Height):
-            for i in range(0, int(Width)):
-                self.send_data(old_Image[i + j * int(Width)])
+        self.send_data2(framebuffer.crop(old_Image, self.width, self.height, box))
 
         self.send_command(0x13)
-        for j in range(0, Height):
-            for i in range(0, int(Width)):
-                self.send_data(Image[i + j * int(Width)])
+        self.send_data2(framebuffer.crop(Image, self.width, self.height, box))
+        self.shadow[:] = Image
 
         # Set partial refresh
         self.TurnOnDisplay()
@@ -342,8 +279,7 @@ class EPD:
         self.send_data(0xA5)
         epdconfig.delay_ms(200)
 
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
 
 ### END OF FILE ###
 
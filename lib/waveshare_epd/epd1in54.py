@@ -80,7 +80,8 @@
 #
 
 import logging
-from . import epdconfig
+from . import epdconfig, framebuffer, sequence
+from .sequence import step
 
 # Display resolution
 EPD_WIDTH       = 200
@@ -88,6 +89,17 @@ EPD_HEIGHT      = 200
 
 logger = logging.getLogger(__name__)
 
+INIT_SEQUENCE = (
+    step(0x0C, 0xD7, 0xD6, 0x9D),  # BOOSTER_SOFT_START_CONTROL
+    step(0x2C, 0xA8),  # WRITE_VCOM_REGISTER: VCOM 7C
+    step(0x3A, 0x1A),  # SET_DUMMY_LINE_PERIOD: 4 dummy lines per gate
+    step(0x3B, 0x08),  # SET_GATE_TIME: 2us per line
+    step(0x11, 0x03),  # DATA_ENTRY_MODE_SETTING: X increment Y increment
+    # set the look-up table register
+    step(0x32),
+)
+
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -131,6 +143,13 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a lot of data
+    def send_data2(self, data):
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
@@ -178,51 +197,14 @@ class EPD:
         self.send_data(((EPD_HEIGHT - 1) >> 8) & 0xFF)
         self.send_data(0x00) # GD = 0 SM = 0 TB = 0
         
-        self.send_command(0x0C) # BOOSTER_SOFT_START_CONTROL
-        self.send_data(0xD7)
-        self.send_data(0xD6)
-        self.send_data(0x9D)
-        
-        self.send_command(0x2C) # WRITE_VCOM_REGISTER
-        self.send_data(0xA8) # VCOM 7C
-        
-        self.send_command(0x3A) # SET_DUMMY_LINE_PERIOD
-        self.send_data(0x1A) # 4 dummy lines per gate
-        
-        self.send_command(0x3B) # SET_GATE_TIME
-        self.send_data(0x08) # 2us per line
-        
-        self.send_command(0x11) # DATA_ENTRY_MODE_SETTING
-        self.send_data(0x03) # X increment Y increment
-        
-        # set the look-up table register
-        self.send_command(0x32)
+        sequence.run(self, INIT_SEQUENCE, epdconfig)
         for i in range(0, len(lut)):
             self.send_data(lut[i])
         # EPD hardware init end
         return 0
 
-    def getbuffer(self, image):
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+    def getbuffer(self, image, out=None):
+        return framebuffer.getbuffer(image, self.width, self.height, out)
 
     def display(self, image):
         if (image == None):
@@ -245,8 +227,7 @@ class EPD:
         for j in range(0, self.height):
             self.SetCursor(0, j)
             self.send_command(0x24)
-            for i in range(0, int(self.width / 8)):
-                self.send_data(color)
+            self.send_data2(framebuffer.fill(color, int(self.width / 8)))
         # epdconfig.digital_write(self.cs_pin, 1)
         self.TurnOnDisplay()
 
@@ -254,7 +235,6 @@ class EPD:
         self.send_command(0x10) # DEEP_SLEEP_MODE
         self.send_data(0x01)
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
 ### END OF FILE ###
 
@@ -28,7 +28,8 @@
 #
 
 import logging
-from . import epdconfig
+from . import epdconfig, framebuffer, sequence
+from .sequence import step
 
 # Display resolution
 EPD_WIDTH       = 200
@@ -36,6 +37,18 @@ EPD_HEIGHT      = 200
 
 logger = logging.getLogger(__name__)
 
+INIT_SEQUENCE = (
+    step(0x01, 0x07, 0x00, 0x08, 0x00),  # POWER_SETTING
+    step(0x06, 0x07, 0x07, 0x07),  # BOOSTER_SOFT_START
+    step(0x04, busy=True),  # POWER_ON
+    step(0x00, 0xCF),  # PANEL_SETTING
+    step(0x50, 0x17),  # VCOM_AND_DATA_INTERVAL_SETTING
+    step(0x30, 0x39),  # PLL_CONTROL
+    step(0x61, 0xC8, 0x00, 0xC8),  # TCON_RESOLUTION set x and y
+    step(0x82, 0x0E),  # VCM_DC_SETTING_REGISTER
+)
+
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -74,6 +87,13 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a lot of data
+    def send_data2(self, data):
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
@@ -115,53 +135,17 @@ class EPD:
         # EPD hardware init start
         self.reset()
         
-        self.send_command(0x01) # POWER_SETTING
-        self.send_data(0x07)
-        self.send_data(0x00)
-        self.send_data(0x08)
-        self.send_data(0x00)
-        self.send_command(0x06) # BOOSTER_SOFT_START
-        self.send_data(0x07)
-        self.send_data(0x07)
-        self.send_data(0x07)
-        self.send_command(0x04) # POWER_ON
-
-        self.ReadBusy()
-
-        self.send_command(0X00) # PANEL_SETTING
-        self.send_data(0xCF)
-        self.send_command(0X50) # VCOM_AND_DATA_INTERVAL_SETTING
-        self.send_data(0x17)
-        self.send_command(0x30) # PLL_CONTROL
-        self.send_data(0x39)
-        self.send_command(0x61) # TCON_RESOLUTION set x and y
-        self.send_data(0xC8)
-        self.send_data(0x00)
-        self.send_data(0xC8)
-        self.send_command(0x82) # VCM_DC_SETTING_REGISTER
-        self.send_data(0x0E)
+        sequence.run(self, INIT_SEQUENCE, epdconfig)
         
         self.set_lut_bw()
         self.set_lut_red()
         return 0
 
-    def getbuffer(self, image):
-        buf = [0xFF] * int(self.width * self.height / 8)
-        # Set buffer to value of Python Imaging Library image.
-        # Image must be in mode 1.
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        if imwidth != self.width or imheight != self.height:
+    def getbuffer(self, image, out=None):
+        if image.size != (self.width, self.height):
             raise ValueError('Image must be same dimensions as display \
                 ({0}x{1}).' .format(self.width, self.height))
-
-        pixels = image_monocolor.load()
-        for y in range(self.height):
-            for x in range(self.width):
-                # Set the bits for the column of pixels at the current position.
-                if pixels[x, y] == 0:
-                    buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        return buf
+        return framebuffer.getbuffer(image, self.width, self.height, out)
 
     def display(self, blackimage, redimage):
         # send black data
@@ -190,13 +174,10 @@ class EPD:
 
     def Clear(self):
         self.send_command(0x10) # DATA_START_TRANSMISSION_1
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)
-            self.send_data(0xFF)
+        self.send_data2(framebuffer.fill(0xFF, int(self.width * self.height / 8) * 2))
             
         self.send_command(0x13) # DATA_START_TRANSMISSION_2
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)
+        self.send_data2(framebuffer.fill(0xFF, int(self.width * self.height / 8)))
 
         self.send_command(0x12) # DISPLAY_REFRESH
         self.ReadBusy()
@@ -215,8 +196,7 @@ class EPD:
         
         self.send_command(0x02) # power off
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
 
 ### END OF FILE ###
 
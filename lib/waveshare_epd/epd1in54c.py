@@ -27,7 +27,8 @@
 # THE SOFTWARE.
 #
 import logging
-from . import epdconfig
+from . import epdconfig, framebuffer, sequence
+from .sequence import step
 
 # Display resolution
 EPD_WIDTH       = 152
@@ -35,6 +36,18 @@ EPD_HEIGHT      = 152
 
 logger = logging.getLogger(__name__)
 
+INIT_SEQUENCE = (
+    step(0x06, 0x17, 0x17, 0x17),  # boost soft start
+    step(0x04, busy=True),  # power on
+    step(0x00,  # panel setting
+         0x0f,  # LUT from OTP,160x296
+         0x0d,  # VCOM to 0V fast
+    ),
+    step(0x61, 0x98, 0x00, 0x98),  # resolution setting
+    step(0x50, 0x77),
+)
+
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -64,6 +77,13 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a lot of data
+    def send_data2(self, data):
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
@@ -77,47 +97,10 @@ class EPD:
         # EPD hardware init start
         self.reset()
         
-        self.send_command(0x06) # boost soft start
-        self.send_data(0x17)
-        self.send_data(0x17)
-        self.send_data(0x17)
-        self.send_command(0x04) # power on
-        
-        self.ReadBusy()
-        
-        self.send_command(0x00) # panel setting
-        self.send_data(0x0f) # LUT from OTP,160x296
-        self.send_data(0x0d) # VCOM to 0V fast
-        
-        self.send_command(0x61) # resolution setting
-        self.send_data(0x98)
-        self.send_data(0x00)
-        self.send_data(0x98)
-        
-        self.send_command(0x50)
-        self.send_data(0x77)
+        sequence.run(self, INIT_SEQUENCE, epdconfig)
 
-    def getbuffer(self, image):
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    #  Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+    def getbuffer(self, image, out=None):
+        return framebuffer.getbuffer(image, self.width, self.height, out)
 
     def display(self, blackimage, yellowimage):
         self.send_command(0x10)
@@ -134,11 +117,9 @@ class EPD:
         
     def Clear(self):
         self.send_command(0x10)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)            
+        self.send_data2(framebuffer.fill(0xFF, int(self.width * self.height / 8)))
         self.send_command(0x13)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)
+        self.send_data2(framebuffer.fill(0xFF, int(self.width * self.height / 8)))
             
         self.send_command(0x12)
         self.ReadBusy()
@@ -150,7 +131,6 @@ class EPD:
         self.send_command(0X07)  #  deep sleep
         self.send_data(0xA5)
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
 ### END OF FILE ###
 
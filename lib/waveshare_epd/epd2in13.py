@@ -29,7 +29,8 @@
 
 
 import logging
-from . import epdconfig
+from . import epdconfig, framebuffer, sequence
+from .sequence import step
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -37,6 +38,18 @@ EPD_HEIGHT      = 250
 
 logger = logging.getLogger(__name__)
 
+INIT_SEQUENCE = (
+    step(0x0C, 0xD7, 0xD6, 0x9D),  # BOOSTER_SOFT_START_CONTROL
+    step(0x2C, 0xA8),  # WRITE_VCOM_REGISTER: VCOM 7C
+    step(0x3A, 0x1A),  # SET_DUMMY_LINE_PERIOD: 4 dummy lines per gate
+    step(0x3B, 0x08),  # SET_GATE_TIME: 2us per line
+    step(0x3C, 0x03),  # BORDER_WAVEFORM_CONTROL
+    step(0x11, 0x03),  # DATA_ENTRY_MODE_SETTING: X increment; Y increment
+    # WRITE_LUT_REGISTER
+    step(0x32),
+)
+
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -80,6 +93,13 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a lot of data
+    def send_data2(self, data):
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):        
         while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
@@ -105,28 +125,7 @@ class EPD:
         self.send_data(((EPD_HEIGHT - 1) >> 8) & 0xFF)
         self.send_data(0x00) # GD = 0 SM = 0 TB = 0
         
-        self.send_command(0x0C) # BOOSTER_SOFT_START_CONTROL
-        self.send_data(0xD7)
-        self.send_data(0xD6)
-        self.send_data(0x9D)
-        
-        self.send_command(0x2C) # WRITE_VCOM_REGISTER
-        self.send_data(0xA8) # VCOM 7C
-        
-        self.send_command(0x3A) # SET_DUMMY_LINE_PERIOD
-        self.send_data(0x1A) # 4 dummy lines per gate
-        
-        self.send_command(0x3B) # SET_GATE_TIME
-        self.send_data(0x08) # 2us per line
-        
-        self.send_command(0X3C) # BORDER_WAVEFORM_CONTROL
-        self.send_data(0x03)      
-        
-        self.send_command(0X11) # DATA_ENTRY_MODE_SETTING
-        self.send_data(0x03) # X increment; Y increment
-        
-        # WRITE_LUT_REGISTER
-        self.send_command(0x32)
+        sequence.run(self, INIT_SEQUENCE, epdconfig)
         for count in range(30):
             self.send_data(lut[count])
 
@@ -157,34 +156,8 @@ class EPD:
         self.send_data((y >> 8) & 0xFF)
         self.ReadBusy()
         
-    def getbuffer(self, image):
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-         
-        buf = [0xFF] * (linewidth * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):                    
-                    if pixels[x, y] == 0:
-                        # x = imwidth - x
-                        buf[int(x / 8) + y * linewidth] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        # newy = imwidth - newy - 1
-                        buf[int(newx / 8) + newy*linewidth] &= ~(0x80 >> (y % 8))
-        return buf   
+    def getbuffer(self, image, out=None):
+        return framebuffer.getbuffer(image, self.width, self.height, out)
 
         
     def display(self, image):
@@ -211,8 +184,7 @@ class EPD:
         for j in range(0, self.height):
             self.SetCursor(0, j);
             self.send_command(0x24);
-            for i in range(0, linewidth):
-                self.send_data(color)   
+            self.send_data2(framebuffer.fill(color, linewidth))
         self.TurnOnDisplay()
 
     def sleep(self):
@@ -220,8 +192,7 @@ class EPD:
         self.send_data(0x01)
         epdconfig.delay_ms(100)
          
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
         
 ### END OF FILE ###
 
@@ -29,7 +29,8 @@
 
 
 import logging
-from . import epdconfig
+from . import epdconfig, framebuffer
+from PIL import Image
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -218,34 +219,20 @@ class EPD:
             self.send_data(0x01)
         return 0
 
-    def getbuffer(self, image):
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-         
-        buf = [0xFF] * (linewidth * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        
+    def getbuffer(self, image, out=None):
+        # The panel scans mirrored: portrait pictures are flipped and start
+        # one pixel in, landscape ones are mirrored along the diagonal
+        imwidth, imheight = image.size
         if(imwidth == self.width and imheight == self.height):
             logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):                    
-                    if pixels[x, y] == 0:
-                        x = imwidth - x
-                        buf[int(x / 8) + y * linewidth] &= ~(0x80 >> (x % 8))
+            linewidth = framebuffer.line_bytes(self.width)
+            mirrored = Image.new('1', (linewidth * 8, self.height), 255)
+            mirrored.paste(image.convert('1').transpose(Image.Transpose.FLIP_LEFT_RIGHT), (1, 0))
+            return framebuffer.getbuffer(mirrored, linewidth * 8, self.height, out)
         elif(imwidth == self.height and imheight == self.width):
             logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        newy = imwidth - newy - 1
-                        buf[int(newx / 8) + newy*linewidth] &= ~(0x80 >> (y % 8))
-        return buf   
+            image = image.convert('1').transpose(Image.Transpose.TRANSPOSE)
+        return framebuffer.getbuffer(image, self.width, self.height, out)
         
         
     def display(self, image):
@@ -254,15 +241,7 @@ class EPD:
         self.TurnOnDisplay()
         
     def displayPartial(self, image):
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-
-        buf = [0x00] * self.height * linewidth
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                buf[i + j * linewidth] = ~image[i + j * linewidth]
+        buf = framebuffer.inverted(image)
 
         self.send_command(0x24)
         self.send_data2(image)   
@@ -287,13 +266,8 @@ class EPD:
             linewidth = int(self.width/8) + 1
         # logger.debug(linewidth)
         
-        buf = [0x00] * self.height * linewidth
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                buf[i + j * linewidth] = color
-
         self.send_command(0x24)
-        self.send_data2(buf)
+        self.send_data2(framebuffer.fill(color, self.height * linewidth))
                 
         # self.send_command(0x26)
         # for j in range(0, self.height):
@@ -309,8 +283,7 @@ class EPD:
 
         self.send_command(0x10) #enter deep sleep
         self.send_data(0x03)
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
 
 ### END OF FILE ###
 
@@ -29,7 +29,7 @@
 
 
 import logging
-from . import epdconfig
+from . import epdconfig, framebuffer
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -45,6 +45,9 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+
+    # Refresh modes display() takes, see modes.py
+    refresh_modes = ("full", "partial")
         
     lut_partial_update= [
         0x0,0x40,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
@@ -270,28 +273,20 @@ class EPD:
     parameter:
         image : Image data
     '''
-    def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        if(imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif(imwidth == self.height and imheight == self.width):
-            # image has correct dimensions, but needs to be rotated
-            img = img.rotate(90, expand=True).convert('1')
-        else:
-            logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
-            # return a blank buffer
-            return [0x00] * (int(self.width/8) * self.height)
-
-        buf = bytearray(img.tobytes('raw'))
-        return buf
+    def getbuffer(self, image, out=None):
+        return framebuffer.getbuffer(image, self.width, self.height, out, blank=0x00)
         
     '''
     function : Sends the image buffer in RAM to e-Paper and displays
     parameter:
         image : Image data
+        mode : "full", or "partial" for displayPartial()
     '''
-    def display(self, image):
+    def display(self, image, mode="full"):
+        if mode == "partial":
+            return self.displayPartial(image)
+        if mode != "full":
+            raise ValueError("Unsupported refresh mode %r" % mode)
         if self.width%8 == 0:
             linewidth = int(self.width/8)
         else:
@@ -369,7 +364,7 @@ class EPD:
         # logger.debug(linewidth)
         
         self.send_command(0x24)
-        self.send_data2([color] * int(self.height * linewidth))  
+        self.send_data2(framebuffer.fill(color, int(self.height * linewidth)))  
         self.TurnOnDisplay()
 
     '''
@@ -380,8 +375,7 @@ class EPD:
         self.send_command(0x10) #enter deep sleep
         self.send_data(0x01)
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
 
 ### END OF FILE ###
 
@@ -28,7 +28,8 @@
 #
 
 import logging
-from . import epdconfig
+from . import epdconfig, framebuffer, sequence
+from .sequence import step
 
 # Display resolution
 EPD_WIDTH       = 104
@@ -36,6 +37,30 @@ EPD_HEIGHT      = 212
 
 logger = logging.getLogger(__name__)
 
+INIT_SEQUENCE = (
+    step(0x04, busy=True),  # waiting for the electronic paper IC to release the idle signal
+    step(0x00,  # panel setting
+         0x0f,  # LUT from OTP,128x296
+         0x89,  # Temperature sensor, boost and other related timing settings
+    ),
+    step(0x61, 0x68, 0x00, 0xD4),  # resolution setting
+    # WBRmode:VBDF F7 VBDW 77 VBDB 37  VBDR B7
+    step(0x50, 0x77),  # VCOM AND DATA INTERVAL SETTING: WBmode:VBDF 17|D7 VBDW 97 VBDB 57
+)
+
+# After power_off() the controller keeps its registers, powering the panel
+# on again and restoring the border setting is all a refresh needs
+WAKE_SEQUENCE = (
+    step(0x04, busy=True),  # POWER_ON
+    step(0x50, 0x77),  # VCOM AND DATA INTERVAL SETTING
+)
+
+# Controller states, see EPD.state
+ASLEEP = "asleep"
+OFF = "off"
+ON = "on"
+
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -44,6 +69,9 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        # ASLEEP until init(), which resets and sets the controller up. OFF
+        # after power_off(): configured, and woken by init() without a reset
+        self.state = ASLEEP
 
     # Hardware reset
     def reset(self):
@@ -65,6 +93,13 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a lot of data
+    def send_data2(self, data):
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
@@ -75,60 +110,30 @@ class EPD:
         logger.debug("e-Paper busy release")
 
     def init(self):
+        # Releasing the pins drives RST low, which resets the controller
+        if self.state == OFF and epdconfig.is_initialized():
+            logger.debug("controller still configured, powering on only")
+            sequence.run(self, WAKE_SEQUENCE, epdconfig)
+            self.state = ON
+            return 0
+
         if (epdconfig.module_init() != 0):
             return -1
             
         self.reset()
-        self.send_command(0x04);  
-        self.ReadBusy();#waiting for the electronic paper IC to release the idle signal
-
-        self.send_command(0x00);    #panel setting
-        self.send_data(0x0f);   #LUT from OTP,128x296
-        self.send_data(0x89);    #Temperature sensor, boost and other related timing settings
-
-        self.send_command(0x61);    #resolution setting
-        self.send_data (0x68);  
-        self.send_data (0x00);  
-        self.send_data (0xD4);
-
-        self.send_command(0X50);    #VCOM AND DATA INTERVAL SETTING
-        self.send_data(0x77);   #WBmode:VBDF 17|D7 VBDW 97 VBDB 57
-                            # WBRmode:VBDF F7 VBDW 77 VBDB 37  VBDR B7
-        
+        sequence.run(self, INIT_SEQUENCE, epdconfig)
+        self.state = ON
         return 0
 
-    def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+    def getbuffer(self, image, out=None):
+        return framebuffer.getbuffer(image, self.width, self.height, out)
 
     def display(self, imageblack, imagered):
         self.send_command(0x10)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(imageblack[i])
+        self.send_data2(imageblack[:int(self.width * self.height / 8)])
         
         self.send_command(0x13)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(imagered[i])
+        self.send_data2(imagered[:int(self.width * self.height / 8)])
         
         self.send_command(0x12) # REFRESH
         epdconfig.delay_ms(100)
@@ -136,26 +141,35 @@ class EPD:
         
     def Clear(self):
         self.send_command(0x10)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)
+        self.send_data2(framebuffer.fill(0xFF, int(self.width * self.height / 8)))
         
         self.send_command(0x13)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)
+        self.send_data2(framebuffer.fill(0xFF, int(self.width * self.height / 8)))
         
         self.send_command(0x12) # REFRESH
         epdconfig.delay_ms(100)
         self.ReadBusy()
 
-    def sleep(self):
+    # Power the panel off, keeping the controller set up for the next init().
+    # Use between refreshes while a session holds the pins, sleep() otherwise
+    def power_off(self):
         self.send_command(0X50) 
         self.send_data(0xf7)
         self.send_command(0X02) 
         self.ReadBusy()
+        self.state = OFF
+
+    def sleep(self):
+        if self.state == ASLEEP:
+            # No init() since the start or the last sleep(): the pins may not
+            # even be set up
+            return
+        if self.state == ON:
+            self.power_off()
         self.send_command(0x07) # DEEP_SLEEP
         self.send_data(0xA5) # check code
+        self.state = ASLEEP
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
 ### END OF FILE ###
 
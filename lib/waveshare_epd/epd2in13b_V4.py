@@ -28,7 +28,7 @@
 #
 
 import logging
-from . import epdconfig
+from . import epdconfig, framebuffer
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -145,21 +145,8 @@ class EPD:
         self.busy()
 
     # image converted to bytearray
-    def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        if(imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif(imwidth == self.height and imheight == self.width):
-            # image has correct dimensions, but needs to be rotated
-            img = img.rotate(90, expand=True).convert('1')
-        else:
-            logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
-            # return a blank buffer
-            return [0x00] * (int(self.width/8) * self.height)
-
-        buf = bytearray(img.tobytes('raw'))
-        return buf
+    def getbuffer(self, image, out=None):
+        return framebuffer.getbuffer(image, self.width, self.height, out, blank=0x00)
 
     # display image
     def display(self, imageblack, imagered):
@@ -178,7 +165,7 @@ class EPD:
         else:
             linewidth = int(self.width/8) + 1
             
-        buf = [0xff] * (int(linewidth * self.height))
+        buf = framebuffer.fill(0xff, int(linewidth * self.height))
             
         self.send_command(0x24)
         self.send_data2(buf)
@@ -197,7 +184,6 @@ class EPD:
         self.send_command(0x10) # DEEP_SLEEP
         self.send_data(0x01) # check code
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
 ### END OF FILE ###
 
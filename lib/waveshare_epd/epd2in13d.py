@@ -29,9 +29,9 @@
 
 
 import logging
-from . import epdconfig
+from . import epdconfig, framebuffer, sequence
+from .sequence import step
 from PIL import Image
-import RPi.GPIO as GPIO
 
 # Display resolution
 EPD_WIDTH       = 104
@@ -39,6 +39,23 @@ EPD_HEIGHT      = 212
 
 logger = logging.getLogger(__name__)
 
+INIT_SEQUENCE = (
+    step(0x01, 0x03, 0x00, 0x2b, 0x2b, 0x03),  # POWER SETTING
+    step(0x06,  # boost soft start
+         0x17,  # A
+         0x17,  # B
+         0x17,  # C
+    ),
+    step(0x04, busy=True),
+    step(0x00,  # panel setting
+         0xbf,  # LUT from OTP,128x296
+         0x0d,  # VCOM to 0V fast
+    ),
+    step(0x30, 0x3a),  # PLL setting: 3a 100HZ   29 150Hz 39 200HZ	31 171HZ
+    step(0x61),  # resolution setting
+)
+
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -47,6 +64,8 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        # What the panel shows, None until a whole panel refresh
+        self.shadow = None
 
     lut_vcomDC = [  
         0x00, 0x08, 0x00, 0x00, 0x00, 0x02,
@@ -196,29 +215,7 @@ class EPD:
         # EPD hardware init start
         self.reset()
         
-        self.send_command(0x01)	# POWER SETTING
-        self.send_data(0x03)
-        self.send_data(0x00)
-        self.send_data(0x2b)
-        self.send_data(0x2b)
-        self.send_data(0x03)
-
-        self.send_command(0x06)	# boost soft start
-        self.send_data(0x17) # A
-        self.send_data(0x17) # B
-        self.send_data(0x17) # C
-
-        self.send_command(0x04)
-        self.ReadBusy()
-
-        self.send_command(0x00)	# panel setting
-        self.send_data(0xbf) # LUT from OTP,128x296
-        self.send_data(0x0d) # VCOM to 0V fast
-
-        self.send_command(0x30)	# PLL setting
-        self.send_data(0x3a) # 3a 100HZ   29 150Hz 39 200HZ	31 171HZ
-
-        self.send_command(0x61)	# resolution setting
+        sequence.run(self, INIT_SEQUENCE, epdconfig)
         self.send_data(self.width)
         self.send_data((self.height >> 8) & 0xff)
         self.send_data(self.height& 0xff)
@@ -261,29 +258,8 @@ class EPD:
         self.send_command(0x24) # bb b
         self.send_data2(self.lut_bb1)
 
-    def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+    def getbuffer(self, image, out=None):
+        return framebuffer.getbuffer(image, self.width, self.height, out)
 
     def display(self, image):
         if (Image == None):
@@ -295,48 +271,42 @@ class EPD:
             linewidth = int(self.width/8) + 1
 
         self.send_command(0x10)
-        self.send_data2([0x00] * self.height * linewidth)
+        self.send_data2(framebuffer.fill(0x00, self.height * linewidth))
         epdconfig.delay_ms(10)
         
         self.send_command(0x13)
         self.send_data2(image)
         epdconfig.delay_ms(10)
+        self.shadow = bytearray(image)
         
         self.SetFullReg()
         self.TurnOnDisplay()
         
-    def DisplayPartial(self, image):   
-        if (Image == None):
+    # Refreshes the box around the pixels that differ from what the panel
+    # shows, or nothing when none do
+    def DisplayPartial(self, image):
+        if (image == None):
             return
-            
+        box = (0, 0, framebuffer.line_bytes(self.width) * 8, self.height)
+        if self.shadow is not None:
+            box = framebuffer.changed(self.shadow, image, self.width, self.height)
+            if box is None:
+                logger.debug("panel already shows the image")
+                return
+        x0, y0, x1, y1 = box
+
         self.send_command(0x91)
         self.send_command(0x90)
-        self.send_data(0)
-        self.send_data(self.width - 1)
-
-        self.send_data(0)
-        self.send_data(0)
-        self.send_data(int(self.height / 256))
-        self.send_data(self.height % 256 - 1)
-        self.send_data(0x28)
-        
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
+        self.send_data2([x0, x1 - 1, y0 >> 8, y0 & 0xFF, (y1 - 1) >> 8, (y1 - 1) & 0xFF, 0x28])
 
-        buf = [0x00] * self.height * linewidth
-
-        for i in range(self.height * linewidth):
-            buf[i] = ~image[i]
-        
         self.send_command(0x10)
-        self.send_data2(image)
+        self.send_data2(framebuffer.crop(image, self.width, self.height, box))
         epdconfig.delay_ms(10)
         
         self.send_command(0x13)
-        self.send_data2(buf)
+        self.send_data2(framebuffer.inverted(framebuffer.crop(image, self.width, self.height, box)))
         epdconfig.delay_ms(10)
+        self.shadow = bytearray(image)
         
         self.SetPartReg()
         self.TurnOnDisplay()
@@ -348,12 +318,13 @@ class EPD:
             linewidth = int(self.width/8) + 1
 
         self.send_command(0x10)
-        self.send_data2([0x00] * self.height * linewidth)
+        self.send_data2(framebuffer.fill(0x00, self.height * linewidth))
         epdconfig.delay_ms(10)
         
         self.send_command(0x13)
-        self.send_data2([0xFF] * self.height * linewidth)
+        self.send_data2(framebuffer.fill(0xFF, self.height * linewidth))
         epdconfig.delay_ms(10)
+        self.shadow = framebuffer.allocate(self.width, self.height)
         
         self.SetFullReg()
         self.TurnOnDisplay()
@@ -365,8 +336,7 @@ class EPD:
         self.send_command(0X07) # deep sleep  
         self.send_data(0xA5)
 
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
 
 ### END OF FILE ###
 
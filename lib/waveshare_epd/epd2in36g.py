@@ -29,7 +29,8 @@
 #
 
 import logging
-from . import epdconfig
+from . import epdconfig, framebuffer, palette, sequence
+from .sequence import step
 
 import PIL
 from PIL import Image
@@ -41,6 +42,22 @@ EPD_HEIGHT      = 296
 
 logger = logging.getLogger(__name__)
 
+INIT_SEQUENCE = (
+    step(0x66, 0x49, 0x55, 0x13, 0x5D),
+    step(0x66, 0x49, 0x55),
+    step(0xB0, 0x03),
+    step(0x00, 0x4F, 0x69),
+    step(0x03, 0x00),
+    step(0xF0, 0xF6, 0x0D, 0x00, 0x00, 0x00),
+    step(0x06, 0xCF, 0xDE, 0x0F),
+    step(0x41, 0x00),
+    step(0x50, 0x30),
+    step(0x60, 0x0C, 0x05),
+    step(0x61, 0xA8, 0x01, 0x28),
+    step(0x84, 0x01),
+)
+
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -74,6 +91,13 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a lot of data
+    def send_data2(self, data):
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusyH(self):
         logger.debug("e-Paper busy H")
@@ -103,83 +127,13 @@ class EPD:
 
         self.reset()
 
-        self.send_command(0x66)
-        self.send_data(0x49)
-        self.send_data(0x55)
-        self.send_data(0x13)
-        self.send_data(0x5D)
-
-        self.send_command(0x66)
-        self.send_data(0x49)
-        self.send_data(0x55)
-
-        self.send_command(0xB0)
-        self.send_data(0x03)
-
-        self.send_command(0x00)
-        self.send_data(0x4F)
-        self.send_data(0x69)
-
-        self.send_command(0x03)
-        self.send_data(0x00)
-
-        self.send_command(0xF0)
-        self.send_data(0xF6)
-        self.send_data(0x0D)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-
-        self.send_command(0x06)
-        self.send_data(0xCF)
-        self.send_data(0xDE)
-        self.send_data(0x0F)
-
-        self.send_command(0x41)
-        self.send_data(0x00)
-
-        self.send_command(0x50)
-        self.send_data(0x30)
-
-        self.send_command(0x60)
-        self.send_data(0x0C) 
-        self.send_data(0x05)
-
-        self.send_command(0x61)
-        self.send_data(0xA8)
-        self.send_data(0x01) 
-        self.send_data(0x28) 
-
-        self.send_command(0x84)
-        self.send_data(0x01)
+        sequence.run(self, INIT_SEQUENCE, epdconfig)
         return 0
 
-    def getbuffer(self, image):
-        # Create a pallette with the 4 colors supported by the panel
-        pal_image = Image.new("P", (1,1))
-        pal_image.putpalette( (0,0,0,  255,255,255,  255,255,0,   255,0,0) + (0,0,0)*252)
-
-        # Check if we need to rotate the image
-        imwidth, imheight = image.size
-        if(imwidth == self.width and imheight == self.height):
-            image_temp = image
-        elif(imwidth == self.height and imheight == self.width):
-            image_temp = image.rotate(90, expand=True)
-        else:
-            logger.warning("Invalid image dimensions: %d x %d, expected %d x %d" % (imwidth, imheight, self.width, self.height))
-
-        # Convert the soruce image to the 4 colors, dithering if needed
-        image_4color = image_temp.convert("RGB").quantize(palette=pal_image)
-        buf_4color = bytearray(image_4color.tobytes('raw'))
-
-        # into a single byte to transfer to the panel
-        buf = [0x00] * int(self.width * self.height / 4)
-        idx = 0
-        for i in range(0, len(buf_4color), 4):
-            buf[idx] = (buf_4color[i] << 6) + (buf_4color[i+1] << 4) + (buf_4color[i+2] << 2) + buf_4color[i+3]
-            idx += 1
-
-        return buf
+    def getbuffer(self, image, dither=True):
+        # Convert the source image to the 4 colors supported by the panel,
+        # dithering if needed, packed 4 pixels per byte
+        return palette.getbuffer(image, self.width, self.height, palette.FOUR_COLOUR, dither)
 
     def display(self, image):
         if self.width % 4 == 0 :
@@ -218,9 +172,7 @@ class EPD:
         self.ReadBusyH()
 
         self.send_command(0x10)
-        for j in range(0, Height):
-            for i in range(0, Width):
-                self.send_data(color)
+        self.send_data2(framebuffer.fill(color, Height * Width))
 
         self.send_command(0x68)
         self.send_data(0x00)
@@ -234,7 +186,6 @@ class EPD:
         self.send_command(0x07) # DEEP_SLEEP
         self.send_data(0XA5)
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
 ### END OF FILE ###
 
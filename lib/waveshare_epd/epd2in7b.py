@@ -29,7 +29,8 @@
 
 
 import logging
-from . import epdconfig
+from . import epdconfig, framebuffer, sequence
+from .sequence import step
 
 # Display resolution
 EPD_WIDTH       = 176
@@ -37,6 +38,33 @@ EPD_HEIGHT      = 264
 
 logger = logging.getLogger(__name__)
 
+INIT_SEQUENCE = (
+    step(0x04, busy=True),  # POWER_ON
+    step(0x00, 0xaf),  # PANEL_SETTING: KW-BF   KWR-AF    BWROTP 0f
+    step(0x30, 0x3a),  # PLL_CONTROL: 3A 100HZ   29 150Hz 39 200HZ    31 171HZ
+    step(0x01,  # POWER_SETTING
+         0x03,  # VDS_EN, VDG_EN
+         0x00,  # VCOM_HV, VGHL_LV[1], VGHL_LV[0]
+         0x2b,  # VDH
+         0x2b,  # VDL
+         0x09,  # VDHR
+    ),
+    step(0x06, 0x07, 0x07, 0x17),  # BOOSTER_SOFT_START
+    # Power optimization
+    step(0xF8, 0x60, 0xA5),
+    # Power optimization
+    step(0xF8, 0x89, 0xA5),
+    # Power optimization
+    step(0xF8, 0x90, 0x00),
+    # Power optimization
+    step(0xF8, 0x93, 0x2A),
+    # Power optimization
+    step(0xF8, 0x73, 0x41),
+    step(0x82, 0x12),  # VCM_DC_SETTING_REGISTER
+    step(0x50, 0x87),  # VCOM_AND_DATA_INTERVAL_SETTING: define by OTP
+)
+
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -119,6 +147,13 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a lot of data
+    def send_data2(self, data):
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
@@ -149,56 +184,7 @@ class EPD:
             
         self.reset()
 
-        self.send_command(0x04) # POWER_ON
-        self.ReadBusy()
-
-        self.send_command(0x00) # PANEL_SETTING
-        self.send_data(0xaf) #KW-BF   KWR-AF    BWROTP 0f
-        
-        self.send_command(0x30) # PLL_CONTROL
-        self.send_data(0x3a) #3A 100HZ   29 150Hz 39 200HZ    31 171HZ
-
-        self.send_command(0x01) # POWER_SETTING
-        self.send_data(0x03) # VDS_EN, VDG_EN
-        self.send_data(0x00) # VCOM_HV, VGHL_LV[1], VGHL_LV[0]
-        self.send_data(0x2b) # VDH
-        self.send_data(0x2b) # VDL
-        self.send_data(0x09) # VDHR
-
-        self.send_command(0x06) # BOOSTER_SOFT_START
-        self.send_data(0x07)
-        self.send_data(0x07)
-        self.send_data(0x17)
-
-        # Power optimization
-        self.send_command(0xF8)
-        self.send_data(0x60)
-        self.send_data(0xA5)
-
-        # Power optimization
-        self.send_command(0xF8)
-        self.send_data(0x89)
-        self.send_data(0xA5)
-
-        # Power optimization
-        self.send_command(0xF8)
-        self.send_data(0x90)
-        self.send_data(0x00)
-        
-        # Power optimization
-        self.send_command(0xF8)
-        self.send_data(0x93)
-        self.send_data(0x2A)
-
-        # Power optimization
-        self.send_command(0xF8)
-        self.send_data(0x73)
-        self.send_data(0x41)
-
-        self.send_command(0x82) # VCM_DC_SETTING_REGISTER
-        self.send_data(0x12)                   
-        self.send_command(0x50) # VCOM_AND_DATA_INTERVAL_SETTING
-        self.send_data(0x87) # define by OTP
+        sequence.run(self, INIT_SEQUENCE, epdconfig)
 
         self.set_lut()
 
@@ -207,29 +193,8 @@ class EPD:
         
         return 0
 
-    def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+    def getbuffer(self, image, out=None):
+        return framebuffer.getbuffer(image, self.width, self.height, out)
 
     def display(self, imageblack, imagered):
         self.send_command(0x10)
@@ -247,13 +212,11 @@ class EPD:
         
     def Clear(self, color=0x00):
         self.send_command(0x10)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(color)
+        self.send_data2(framebuffer.fill(color, int(self.width * self.height / 8)))
         self.send_command(0x11) 
         
         self.send_command(0x13)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(color)
+        self.send_data2(framebuffer.fill(color, int(self.width * self.height / 8)))
         self.send_command(0x11)
         
         self.send_command(0x12) 
@@ -266,7 +229,6 @@ class EPD:
         self.send_command(0X07)
         self.send_data(0xA5)
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
 ### END OF FILE ###
 
@@ -30,11 +30,10 @@
 # THE SOFTWARE.
 #
 
-from distutils.command.build_scripts import build_scripts
 import logging
-from . import epdconfig
+from . import epdconfig, framebuffer, sequence
+from .sequence import step
 from PIL import Image
-import RPi.GPIO as GPIO
 
 # Display resolution
 EPD_WIDTH       = 128
@@ -42,6 +41,14 @@ EPD_HEIGHT      = 296
 
 logger = logging.getLogger(__name__)
 
+INIT_SEQUENCE = (
+    step(0x04, busy=True),  # waiting for the electronic paper IC to release the idle signal
+    step(0x00, 0x1f),  # panel setting: LUT from OTP，KW-BF   KWR-AF    BWROTP 0f   BWOTP 1f
+    step(0x61, 0x80, 0x01, 0x28),  # resolution setting
+    step(0x50, 0x97),  # VCOM AND DATA INTERVAL SETTING: WBmode:VBDF 17|D7 VBDW 97 VBDB 57  WBRmode:VBDF F7 VBDW 77 VBDB 37  VBDR B7
+)
+
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -50,6 +57,8 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        # What the panel shows, None until a whole panel refresh
+        self.shadow = None
     
     lut_vcom1 = [  
         0x00, 0x19, 0x01, 0x00, 0x00, 0x01,
@@ -156,19 +165,7 @@ class EPD:
         # EPD hardware init start
         self.reset()
         
-        self.send_command(0x04)
-        self.ReadBusy() #waiting for the electronic paper IC to release the idle signal
-
-        self.send_command(0x00)     #panel setting
-        self.send_data(0x1f)        # LUT from OTP，KW-BF   KWR-AF    BWROTP 0f   BWOTP 1f
-
-        self.send_command(0x61)     #resolution setting
-        self.send_data (0x80)       
-        self.send_data (0x01)   
-        self.send_data (0x28)   
-
-        self.send_command(0X50) #VCOM AND DATA INTERVAL SETTING     
-        self.send_data(0x97)        #WBmode:VBDF 17|D7 VBDW 97 VBDB 57  WBRmode:VBDF F7 VBDW 77 VBDB 37  VBDR B7
+        sequence.run(self, INIT_SEQUENCE, epdconfig)
 
         return 0
     
@@ -217,76 +214,56 @@ class EPD:
         self.send_command(0x24)         # bb b
         self.send_data2(self.lut_bb1)
 
-    def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+    def getbuffer(self, image, out=None):
+        return framebuffer.getbuffer(image, self.width, self.height, out)
 
     def display(self, image):
         self.send_command(0x10)
-        self.send_data2([0x00] * int(self.width * self.height / 8))
+        self.send_data2(framebuffer.fill(0x00, int(self.width * self.height / 8)))
         epdconfig.delay_ms(10)
         
         self.send_command(0x13)
         self.send_data2(image)
         epdconfig.delay_ms(10)
+        self.shadow = bytearray(image)
         
         self.TurnOnDisplay()
         
+    # Refreshes the box around the pixels that differ from what the panel
+    # shows, or nothing when none do
     def DisplayPartial(self, image):
+        box = (0, 0, framebuffer.line_bytes(self.width) * 8, self.height)
+        if self.shadow is not None:
+            box = framebuffer.changed(self.shadow, image, self.width, self.height)
+            if box is None:
+                logger.debug("panel already shows the image")
+                return
+        x0, y0, x1, y1 = box
         self.SetPartReg()
         self.send_command(0x91)
         self.send_command(0x90)
-        self.send_data(0)
-        self.send_data(self.width - 1)
-
-        self.send_data(0)
-        self.send_data(0)
-        self.send_data(int(self.height / 256))
-        self.send_data(self.height % 256 - 1)
-        self.send_data(0x28)
-        
+        self.send_data2([x0, x1 - 1, y0 >> 8, y0 & 0xFF, (y1 - 1) >> 8, (y1 - 1) & 0xFF, 0x28])
 
-        buf = [0x00] * int(self.width * self.height / 8)
-        for i in range(0, int(self.width * self.height / 8)):
-            buf[i] = ~image[i]
         self.send_command(0x10)
-        self.send_data2(image)
+        self.send_data2(framebuffer.crop(image, self.width, self.height, box))
         epdconfig.delay_ms(10)
         
         self.send_command(0x13)
-        self.send_data2(buf)
+        self.send_data2(framebuffer.inverted(framebuffer.crop(image, self.width, self.height, box)))
         epdconfig.delay_ms(10)
-          
+        self.shadow = bytearray(image)
+        
         self.TurnOnDisplay()
         
     def Clear(self):
         self.send_command(0x10)
-        self.send_data2([0x00] * int(self.width * self.height / 8))
+        self.send_data2(framebuffer.fill(0x00, int(self.width * self.height / 8)))
         epdconfig.delay_ms(10)
         
         self.send_command(0x13)
-        self.send_data2([0xFF] * int(self.width * self.height / 8))
+        self.send_data2(framebuffer.fill(0xFF, int(self.width * self.height / 8)))
         epdconfig.delay_ms(10)
+        self.shadow = framebuffer.allocate(self.width, self.height)
         
         self.TurnOnDisplay()
 
@@ -297,8 +274,7 @@ class EPD:
         self.send_command(0X07)         #deep sleep  
         self.send_data(0xA5)
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
 
 ### END OF FILE ###
 
@@ -29,7 +29,8 @@
 
 import logging
 from multiprocessing.reduction import recv_handle
-from . import epdconfig
+from . import epdconfig, framebuffer, lut, sequence
+from .sequence import step
 
 # Display resolution
 EPD_width       = 240
@@ -37,6 +38,50 @@ EPD_height      = 360
 
 logger = logging.getLogger(__name__)
 
+# framebuffer.pattern() of each display_NUM() pattern
+NUM_PATTERNS = {
+    0xFF: "white",
+    0x00: "black",
+    0xAA: "source-lines",
+    0x55: "gate-lines",
+    0xF0: "up-black",
+    0x0F: "left-black",
+    0x01: "frame",
+    0x02: "crosstalk",
+    0x03: "chessboard",
+}
+
+INIT_SEQUENCE = (
+    step(0x00,  # panel setting   PSR
+         0xFF,  # RES1 RES0 REG KW/R     UD    SHL   SHD_N  RST_N
+         0x01,  # x x x VCMZ TS_AUTO TIGE NORG VC_LUTZ
+    ),
+    step(0x01,  # POWER SETTING   PWR
+         0x03,  # x x x x x x VDS_EN VDG_EN
+         0x10,  # x x x VCOM_SLWE VGH[3:0]   VGH=20V, VGL=-20V
+         0x3F,  # x x VSH[5:0]    VSH = 15V
+         0x3F,  # x x VSL[5:0]    VSL=-15V
+         0x03,  # OPTEN VDHR[6:0]  VHDR=6.4V
+    ),
+    # T_VDS_OFF[1:0] 00=1 frame; 01=2 frame; 10=3 frame; 11=4 frame
+    step(0x06,  # booster soft start   BTST
+         0x37,  # BT_PHA[7:0]
+         0x3D,  # BT_PHB[7:0]
+         0x3D,  # x x BT_PHC[5:0]
+    ),
+    step(0x60, 0x22),  # TCON setting            TCON: S2G[3:0] G2S[3:0]   non-overlap = 12
+    step(0x82, 0x07),  # VCOM_DC setting        VDCS: x  VDCS[6:0]    VCOM_DC value= -1.9v    00~3f,0x12=-1.9v
+    step(0x30, 0x09),
+    step(0xe3, 0x88),  # power saving            PWS: VCOM_W[3:0] SD_W[3:0]
+    step(0x61,  # resoultion setting
+         0xf0,  # HRES[7:3] 0 0 0
+         0x01,  # x x x x x x x VRES[8]
+         0x68,  # VRES[7:0]
+    ),
+    step(0x50, 0xB7),
+)
+
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -57,8 +102,11 @@ class EPD:
         self.Chessboard = 0x03
         self.Image = 0x04
 
+    # Refresh modes display() takes, see modes.py: GC and DU waveforms
+    refresh_modes = ("full", "fast")
+
     # GC 0.9S
-    lut_R20_GC = [
+    lut_R20_GC = bytes([
         0x01,0x0f,0x0f,0x0f,0x01,0x01,0x01,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
@@ -67,16 +115,16 @@ class EPD:
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00
-    ]                          
-    lut_R21_GC = [
+    ])                          
+    lut_R21_GC = bytes([
         0x01,0x4f,0x8f,0x0f,0x01,0x01,0x01,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00
-    ]                     
-    lut_R22_GC = [
+    ])                     
+    lut_R22_GC = bytes([
         0x01,0x0f,0x8f,0x0f,0x01,0x01,0x01,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
@@ -85,8 +133,8 @@ class EPD:
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00
-    ]
-    lut_R23_GC = [
+    ])
+    lut_R23_GC = bytes([
         0x01,0x4f,0x8f,0x4f,0x01,0x01,0x01,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
@@ -95,18 +143,18 @@ class EPD:
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00
-    ]
-    lut_R24_GC = [
+    ])
+    lut_R24_GC = bytes([
         0x01,0x0f,0x8f,0x4f,0x01,0x01,0x01,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00
-    ]
+    ])
 
     # DU 0.3s
-    lut_R20_DU = [
+    lut_R20_DU = bytes([
         0x01,0x0f,0x01,0x00,0x00,0x01,0x01,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
@@ -115,16 +163,16 @@ class EPD:
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00
-    ]                              
-    lut_R21_DU = [
+    ])                              
+    lut_R21_DU = bytes([
         0x01,0x0f,0x01,0x00,0x00,0x01,0x01,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00
-    ]                         
-    lut_R22_DU = [
+    ])                         
+    lut_R22_DU = bytes([
         0x01,0x8f,0x01,0x00,0x00,0x01,0x01,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
@@ -133,8 +181,8 @@ class EPD:
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00
-    ]
-    lut_R23_DU = [
+    ])
+    lut_R23_DU = bytes([
         0x01,0x4f,0x01,0x00,0x00,0x01,0x01,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
@@ -143,59 +191,60 @@ class EPD:
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00
-    ]
-    lut_R24_DU = [
+    ])
+    lut_R24_DU = bytes([
         0x01,0x0f,0x01,0x00,0x00,0x01,0x01,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00
-    ]
+    ])
 
-    lut_vcom = [
+    lut_vcom = bytes([
         0x01,0x19,0x19,0x19,0x19,0x01,0x01,
         0x01,0x19,0x19,0x19,0x01,0x01,0x01,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00
-    ]
-    lut_ww = [
+    ])
+    lut_ww = bytes([
         0x01,0x59,0x99,0x59,0x99,0x01,0x01,
         0x01,0x59,0x99,0x19,0x01,0x01,0x01,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00
-    ]
-    lut_bw = [
+    ])
+    lut_bw = bytes([
         0x01,0x59,0x99,0x59,0x99,0x01,0x01,
         0x01,0x59,0x99,0x19,0x01,0x01,0x01,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00
-    ]
-    lut_wb = [
+    ])
+    lut_wb = bytes([
         0x01,0x19,0x99,0x59,0x99,0x01,0x01,
         0x01,0x59,0x99,0x59,0x01,0x01,0x01,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00
-    ]
-    lut_bb = [
+    ])
+    lut_bb = bytes([
         0x01,0x19,0x99,0x59,0x99,0x01,0x01,
         0x01,0x59,0x99,0x59,0x01,0x01,0x01,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00
-    ]
+    ])
         
     # Hardware reset
     def reset(self):
+        lut.invalidate(self)
         epdconfig.digital_write(self.reset_pin, 1)
         epdconfig.delay_ms(200) 
         epdconfig.digital_write(self.reset_pin, 0)
@@ -229,20 +278,13 @@ class EPD:
         logger.debug("e-Paper busy release")
 
     def lut(self) :
-        self.send_command(0x20)        # vcom
-        self.send_data2(self.lut_vcom[:42])
-            
-        self.send_command(0x21)        # ww --
-        self.send_data2(self.lut_ww[:42])
-            
-        self.send_command(0x22)        # bw r
-        self.send_data2(self.lut_bw[:42])
-            
-        self.send_command(0x23)        # wb w
-        self.send_data2(self.lut_bb[:42])
-            
-        self.send_command(0x24)        # bb b
-        self.send_data2(self.lut_wb[:42])
+        lut.load(self, (
+            (0x20, self.lut_vcom[:42]),     # vcom
+            (0x21, self.lut_ww[:42]),       # ww --
+            (0x22, self.lut_bw[:42]),       # bw r
+            (0x23, self.lut_bb[:42]),       # wb w
+            (0x24, self.lut_wb[:42]),       # bb b
+        ))
 
     def refresh(self):
         self.send_command(0x17)
@@ -252,59 +294,27 @@ class EPD:
 
     # LUT download
     def lut_GC(self):
-        self.send_command(0x20);        # vcom
-        self.send_data2(self.lut_R20_GC[:56])
-            
-        self.send_command(0x21);        # red not use
-        self.send_data2(self.lut_R21_GC[:42])
-            
-        self.send_command(0x24);        # bb b
-        self.send_data2(self.lut_R24_GC[:42])
-        
-        if(self.Flag == 0) :
-            self.send_command(0x22);    # bw r
-            self.send_data2(self.lut_R22_GC[:56])
-                
-            self.send_command(0x23);    # wb w
-            self.send_data2(self.lut_R23_GC[:42])
-            self.Flag = 1
-
-        else :
-            self.send_command(0x22);    # bw r
-            self.send_data2(self.lut_R23_GC[:56])
-
-            self.send_command(0x23);    # wb w
-            self.send_data2(self.lut_R22_GC[:42])
-            self.Flag = 0
+        self.lut_waveform(self.lut_R20_GC, self.lut_R21_GC, self.lut_R22_GC, self.lut_R23_GC, self.lut_R24_GC)
 
     # LUT download        
     def lut_DU(self):
-        self.send_command(0x20);      # vcom
-        self.send_data2(self.lut_R20_DU[:56])
-            
-        self.send_command(0x21);     # red not use
-        self.send_data2(self.lut_R21_DU[:42])
-            
-        self.send_command(0x24);    # bb b
-        self.send_data2(self.lut_R24_DU[:42])
-        
+        self.lut_waveform(self.lut_R20_DU, self.lut_R21_DU, self.lut_R22_DU, self.lut_R23_DU, self.lut_R24_DU)
+
+    def lut_waveform(self, r20, r21, r22, r23, r24):
+        # 0x22 and 0x23 swap on every refresh, the others stay loaded
         if(self.Flag == 0) :
-            self.send_command(0x22);      # bw r
-            self.send_data2(self.lut_R22_DU[:56])
-                
-            self.send_command(0x23);     # wb w
-            self.send_data2(self.lut_R23_DU[:42])
-                
+            bw, wb = r22, r23
             self.Flag = 1
-            
         else :
-            self.send_command(0x22);    # bw r
-            self.send_data2(self.lut_R23_DU[:56])
-                
-            self.send_command(0x23);   # wb w
-            self.send_data2(self.lut_R22_DU[:42])
-                
+            bw, wb = r23, r22
             self.Flag = 0
+        lut.load(self, (
+            (0x20, r20[:56]),   # vcom
+            (0x21, r21[:42]),   # red not use
+            (0x24, r24[:42]),   # bb b
+            (0x22, bw[:56]),    # bw r
+            (0x23, wb[:42]),    # wb w
+        ))
         
                 
     def init(self):
@@ -314,146 +324,46 @@ class EPD:
         self.Flag = 0
         self.reset()
 
-        self.send_command(0x00)     # panel setting   PSR
-        self.send_data(0xFF)        # RES1 RES0 REG KW/R     UD    SHL   SHD_N  RST_N    
-        self.send_data(0x01)        # x x x VCMZ TS_AUTO TIGE NORG VC_LUTZ
-
-        self.send_command(0x01)     # POWER SETTING   PWR
-        self.send_data(0x03)        #  x x x x x x VDS_EN VDG_EN    
-        self.send_data(0x10)        #  x x x VCOM_SLWE VGH[3:0]   VGH=20V, VGL=-20V    
-        self.send_data(0x3F)        #  x x VSH[5:0]    VSH = 15V
-        self.send_data(0x3F)        #  x x VSL[5:0]    VSL=-15V
-        self.send_data(0x03)        #  OPTEN VDHR[6:0]  VHDR=6.4V
-                                    # T_VDS_OFF[1:0] 00=1 frame; 01=2 frame; 10=3 frame; 11=4 frame
-        self.send_command(0x06)     # booster soft start   BTST 
-        self.send_data(0x37)        #  BT_PHA[7:0]      
-        self.send_data(0x3D)        #  BT_PHB[7:0]    
-        self.send_data(0x3D)        #  x x BT_PHC[5:0]    
-
-        self.send_command(0x60)     # TCON setting            TCON 
-        self.send_data(0x22)        # S2G[3:0] G2S[3:0]   non-overlap = 12        
-
-        self.send_command(0x82)     # VCOM_DC setting        VDCS 
-        self.send_data(0x07)        # x  VDCS[6:0]    VCOM_DC value= -1.9v    00~3f,0x12=-1.9v
-
-        self.send_command(0x30)             
-        self.send_data(0x09)        
-
-        self.send_command(0xe3)     # power saving            PWS 
-        self.send_data(0x88)        # VCOM_W[3:0] SD_W[3:0]
-
-        self.send_command(0x61)     # resoultion setting 
-        self.send_data(0xf0)        #  HRES[7:3] 0 0 0    
-        self.send_data(0x01)        #  x x x x x x x VRES[8]    
-        self.send_data(0x68)        #  VRES[7:0]
-
-        self.send_command(0x50);            
-        self.send_data(0xB7);    
+        sequence.run(self, INIT_SEQUENCE, epdconfig)
         return 0
 
-    def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+    def getbuffer(self, image, out=None):
+        return framebuffer.getbuffer(image, self.width, self.height, out)
 
-    def display(self, image):
+    # Without a mode, the caller loads a LUT and refreshes
+    def display(self, image, mode=None):
         if (image == None):
             return            
+        if mode not in (None, "full", "fast"):
+            raise ValueError("Unsupported refresh mode %r" % mode)
         self.send_command(0x13);		     # Transfer new data
         self.send_data2(image)
+        if mode == "full":
+            self.lut_GC()
+            self.refresh()
+        elif mode == "fast":
+            self.lut_DU()
+            self.refresh()
 
+    # Send one of the test patterns self.WHITE ... self.Crosstalk as the new
+    # data; self.Image has no picture bundled and sends nothing
     def display_NUM(self, NUM):
-        # pcnt = 0
-
         self.send_command(0x13);		     #Transfer new data
-        for column in range(0, self.height):
-            for row in range(0, self.width//8):
-                if NUM == self.WHITE:
-                    self.send_data(0xFF)
-                        
-                elif NUM == self.BLACK:
-                    self.send_data(0x00)
-                        
-                elif NUM == self.Source_Line:
-                    self.send_data(0xAA)
-                        
-                elif NUM == self.Gate_Line:
-                    if(column%2):
-                        self.send_data(0xff) # An odd number of Gate line  
-                    else:
-                        self.send_data(0x00) # The even line Gate  
-                        
-                elif NUM == self.Chessboard:
-                    if(row>=(self.width/8/2) and column>=(self.height/2)):
-                        self.send_data(0xff)
-                    elif(row<(self.width/8/2) and column<(self.height/2)):
-                        self.send_data(0xff)									
-                    else:
-                        self.send_data(0x00)	
-                        
-                elif NUM == self.LEFT_BLACK_RIGHT_WHITE:
-                    if(row>=(self.width/8/2)):
-                        self.send_data(0xff)
-                    else:
-                        self.send_data(0x00)
-                            
-                elif NUM == self.UP_BLACK_DOWN_WHITE:
-                    if(column>=(self.height/2)):
-                        self.send_data(0xFF)
-                    else:
-                        self.send_data(0x00)
-                            
-                elif NUM == self.Frame:
-                    if(column==0 or column==(self.height-1)):
-                        self.send_data(0x00)					
-                    elif(row==0):
-                        self.send_data(0x7F)
-                    elif(row==(self.width/8-1)):
-                        self.send_data(0xFE);					
-                    else:
-                        self.send_data(0xFF);				
-                            
-                elif NUM == self.Crosstalk:
-                    if((row>=(self.width/8/3) and row<=(self.width/8/3*2) and column<=(self.height/3)) or (row>=(self.width/8/3) and row<=(self.width/8/3*2) and column>=(self.height/3*2))):
-                        self.send_data(0x00)
-                    else:
-                        self.send_data(0xFF)				
-                            
-                elif NUM == self.Image:
-                    epdconfig.delay_ms(1)
-                    # self.send_data(gImage_1[pcnt++])
- 
-        
+        if NUM == self.Image:
+            return
+        self.send_data2(framebuffer.pattern(NUM_PATTERNS[NUM], self.width, self.height))
+
     def Clear(self):
         self.send_command(0x13);		     # Transfer new data
-        self.send_data2([0xFF] * int(self.width * self.height / 8))
+        self.send_data2(framebuffer.fill(0xFF, int(self.width * self.height / 8)))
         self.lut_GC()
         self.refresh()
 
     def sleep(self):
         self.send_command(0X07) # DEEP_SLEEP_MODE
         self.send_data(0xA5)
+        lut.invalidate(self)
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
 ### END OF FILE ###
 
@@ -29,9 +29,9 @@
 
 
 import logging
-from . import epdconfig
+from . import epdconfig, framebuffer, grayscale, lut, sequence
+from .sequence import step
 from PIL import Image
-import RPi.GPIO as GPIO
 
 # Display resolution
 EPD_WIDTH       = 400
@@ -44,6 +44,59 @@ GRAY4  = 0x00 #Blackest
 
 logger = logging.getLogger(__name__)
 
+INIT_SEQUENCE = (
+    step(0x01,  # POWER SETTING
+         0x03,  # VDS_EN, VDG_EN
+         0x00,  # VCOM_HV, VGHL_LV[1], VGHL_LV[0]
+         0x2b,  # VDH
+         0x2b,  # VDL
+    ),
+    step(0x06, 0x17, 0x17, 0x17),  # boost soft start
+    step(0x04, busy=True),  # POWER_ON
+    step(0x00, 0xbf),  # panel setting: KW-BF   KWR-AF  BWROTP 0f
+    step(0x30, 0x3c),  # PLL setting: 3A 100HZ   29 150Hz 39 200HZ  31 171HZ
+    step(0x61,  # resolution setting
+         0x01,
+         0x90,  # 128
+         0x01,
+         0x2c,
+    ),
+    step(0x82, 0x12),  # vcom_DC setting
+    step(0x50, 0x97),  # VCOM AND DATA INTERVAL SETTING: 97white border 77black border  VBDF 17|D7 VBDW 97 VBDB 57  VBDF F7 VBDW 77 VBDB 37  VBDR B7
+)
+
+# As init(), but with the border floating and the data inverted
+PARTIAL_INIT_SEQUENCE = INIT_SEQUENCE[:-1] + (
+    step(0x50, 0x07),  # VCOM AND DATA INTERVAL SETTING
+)
+
+GRAY_INIT_SEQUENCE = (
+    step(0x01,  # POWER SETTING
+         0x03,
+         0x00,  # VGH=20V,VGL=-20V
+         0x2b,  # VDH=15V
+         0x2b,  # VDL=-15V
+         0x13,
+    ),
+    step(0x06,  # booster soft start
+         0x17,  # A
+         0x17,  # B
+         0x17,  # C
+    ),
+    step(0x04, busy=True),
+    step(0x00, 0x3f),  # panel setting: KW-3f   KWR-2F BWROTP 0f BWOTP 1f
+    step(0x30, 0x3c),  # PLL setting: 100hz
+    step(0x61,  # resolution setting
+         0x01,  # 400
+         0x90,
+         0x01,  # 300
+         0x2c,
+    ),
+    step(0x82, 0x12),  # vcom_DC setting
+    step(0x50, 0x97),  # VCOM AND DATA INTERVAL SETTING
+)
+
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -56,9 +109,13 @@ class EPD:
         self.GRAY2  = GRAY2
         self.GRAY3  = GRAY3 #gray
         self.GRAY4  = GRAY4 #Blackest
-        self.DATA   = [0x00] * 15000
+        self.shadow = framebuffer.allocate(EPD_WIDTH, EPD_HEIGHT)  # what the panel shows
+        self.refresh_mode = None    # what the last init set up
 
-    lut_vcom0 = [
+    # Refresh modes display() takes, see modes.py
+    refresh_modes = ("full", "partial", "gray")
+
+    lut_vcom0 = bytes([
     0x00, 0x08, 0x08, 0x00, 0x00, 0x02, 
     0x00, 0x0F, 0x0F, 0x00, 0x00, 0x01, 
     0x00, 0x08, 0x08, 0x00, 0x00, 0x02, 
@@ -67,8 +124,8 @@ class EPD:
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
     0x00, 0x00, 
-    ]
-    lut_ww = [
+    ])
+    lut_ww = bytes([
     0x50, 0x08, 0x08, 0x00, 0x00, 0x02, 
     0x90, 0x0F, 0x0F, 0x00, 0x00, 0x01, 
     0xA0, 0x08, 0x08, 0x00, 0x00, 0x02, 
@@ -76,8 +133,8 @@ class EPD:
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
-    lut_bw = [
+    ])
+    lut_bw = bytes([
     0x50, 0x08, 0x08, 0x00, 0x00, 0x02, 
     0x90, 0x0F, 0x0F, 0x00, 0x00, 0x01, 
     0xA0, 0x08, 0x08, 0x00, 0x00, 0x02, 
@@ -85,8 +142,8 @@ class EPD:
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
-    lut_wb = [
+    ])
+    lut_wb = bytes([
     0xA0, 0x08, 0x08, 0x00, 0x00, 0x02, 
     0x90, 0x0F, 0x0F, 0x00, 0x00, 0x01, 
     0x50, 0x08, 0x08, 0x00, 0x00, 0x02, 
@@ -94,8 +151,8 @@ class EPD:
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
-    lut_bb = [
+    ])
+    lut_bb = bytes([
     0x20, 0x08, 0x08, 0x00, 0x00, 0x02, 
     0x90, 0x0F, 0x0F, 0x00, 0x00, 0x01, 
     0x10, 0x08, 0x08, 0x00, 0x00, 0x02, 
@@ -103,9 +160,9 @@ class EPD:
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
+    ])
     #******************************partial screen update LUT*********************************/
-    EPD_4IN2_Partial_lut_vcom1 =[
+    EPD_4IN2_Partial_lut_vcom1 = bytes([
     0x00, 0x01, 0x20, 0x01, 0x00, 0x01, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
@@ -116,9 +173,9 @@ class EPD:
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
+    ])
 
-    EPD_4IN2_Partial_lut_ww1 =[
+    EPD_4IN2_Partial_lut_ww1 = bytes([
     0x00, 0x01, 0x20, 0x01, 0x00, 0x01, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
@@ -126,9 +183,9 @@ class EPD:
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
+    ])
 
-    EPD_4IN2_Partial_lut_bw1 =[
+    EPD_4IN2_Partial_lut_bw1 = bytes([
     0x20, 0x01, 0x20, 0x01, 0x00, 0x01, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
@@ -139,9 +196,9 @@ class EPD:
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
-    ]
+    ])
 
-    EPD_4IN2_Partial_lut_wb1 =[
+    EPD_4IN2_Partial_lut_wb1 = bytes([
     0x10, 0x01, 0x20, 0x01, 0x00, 0x01, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
@@ -149,9 +206,9 @@ class EPD:
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
-    ]
+    ])
 
-    EPD_4IN2_Partial_lut_bb1 =[
+    EPD_4IN2_Partial_lut_bb1 = bytes([
     0x00, 0x01,0x20, 0x01, 0x00, 0x01, 
     0x00, 0x00,0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00,0x00, 0x00, 0x00, 0x00, 
@@ -159,11 +216,11 @@ class EPD:
     0x00, 0x00,0x00, 0x00, 0x00, 0x00, 
     0x00, 0x00,0x00, 0x00, 0x00, 0x00,
     0x00, 0x00,0x00, 0x00, 0x00, 0x00, 
-    ]
+    ])
 
     #******************************gray*********************************/
     #0~3 gray
-    EPD_4IN2_4Gray_lut_vcom =[
+    EPD_4IN2_4Gray_lut_vcom = bytes([
     0x00 ,0x0A ,0x00 ,0x00 ,0x00 ,0x01,
     0x60 ,0x14 ,0x14 ,0x00 ,0x00 ,0x01,
     0x00 ,0x14 ,0x00 ,0x00 ,0x00 ,0x01,
@@ -171,9 +228,9 @@ class EPD:
     0x00 ,0x00 ,0x00 ,0x00 ,0x00 ,0x00,
     0x00 ,0x00 ,0x00 ,0x00 ,0x00 ,0x00,
     0x00 ,0x00 ,0x00 ,0x00 ,0x00 ,0x00
-    ]
+    ])
     #R21
-    EPD_4IN2_4Gray_lut_ww =[
+    EPD_4IN2_4Gray_lut_ww = bytes([
     0x40 ,0x0A ,0x00 ,0x00 ,0x00 ,0x01,
     0x90 ,0x14 ,0x14 ,0x00 ,0x00 ,0x01,
     0x10 ,0x14 ,0x0A ,0x00 ,0x00 ,0x01,
@@ -181,9 +238,9 @@ class EPD:
     0x00 ,0x00 ,0x00 ,0x00 ,0x00 ,0x00,
     0x00 ,0x00 ,0x00 ,0x00 ,0x00 ,0x00,
     0x00 ,0x00 ,0x00 ,0x00 ,0x00 ,0x00,
-    ]
+    ])
     #R22H r
-    EPD_4IN2_4Gray_lut_bw =[
+    EPD_4IN2_4Gray_lut_bw = bytes([
     0x40 ,0x0A ,0x00 ,0x00 ,0x00 ,0x01,
     0x90 ,0x14 ,0x14 ,0x00 ,0x00 ,0x01,
     0x00 ,0x14 ,0x0A ,0x00 ,0x00 ,0x01,
@@ -191,9 +248,9 @@ class EPD:
     0x00 ,0x00 ,0x00 ,0x00 ,0x00 ,0x00,
     0x00 ,0x00 ,0x00 ,0x00 ,0x00 ,0x00,
     0x00 ,0x00 ,0x00 ,0x00 ,0x00 ,0x00,
-    ]
+    ])
     #R23H w
-    EPD_4IN2_4Gray_lut_wb =[
+    EPD_4IN2_4Gray_lut_wb = bytes([
     0x40 ,0x0A ,0x00 ,0x00 ,0x00 ,0x01,
     0x90 ,0x14 ,0x14 ,0x00 ,0x00 ,0x01,
     0x00 ,0x14 ,0x0A ,0x00 ,0x00 ,0x01,
@@ -201,9 +258,9 @@ class EPD:
     0x00 ,0x00 ,0x00 ,0x00 ,0x00 ,0x00,
     0x00 ,0x00 ,0x00 ,0x00 ,0x00 ,0x00,
     0x00 ,0x00 ,0x00 ,0x00 ,0x00 ,0x00,
-    ]
+    ])
     #R24H b
-    EPD_4IN2_4Gray_lut_bb =[
+    EPD_4IN2_4Gray_lut_bb = bytes([
     0x80 ,0x0A ,0x00 ,0x00 ,0x00 ,0x01,
     0x90 ,0x14 ,0x14 ,0x00 ,0x00 ,0x01,
     0x20 ,0x14 ,0x0A ,0x00 ,0x00 ,0x01,
@@ -211,10 +268,11 @@ class EPD:
     0x00 ,0x00 ,0x00 ,0x00 ,0x00 ,0x00,
     0x00 ,0x00 ,0x00 ,0x00 ,0x00 ,0x00,
     0x00 ,0x00 ,0x00 ,0x00 ,0x00 ,0x00,
-    ]
+    ])
     
     # Hardware reset
     def reset(self):
+        lut.invalidate(self)
         epdconfig.digital_write(self.reset_pin, 1)
         epdconfig.delay_ms(10) 
         epdconfig.digital_write(self.reset_pin, 0)
@@ -256,59 +314,32 @@ class EPD:
             epdconfig.delay_ms(100)    
 
     def set_lut(self):
-        self.send_command(0x20)               # vcom
-        self.send_data2(self.lut_vcom0)
-            
-        self.send_command(0x21)         # ww --
-        self.send_data2(self.lut_ww)
-            
-        self.send_command(0x22)         # bw r
-        self.send_data2(self.lut_bw)
-            
-        self.send_command(0x23)         # wb w
-        self.send_data2(self.lut_bb)
-            
-        self.send_command(0x24)         # bb b
-        self.send_data2(self.lut_wb)
-
+        lut.load(self, (
+            (0x20, self.lut_vcom0),     # vcom
+            (0x21, self.lut_ww),        # ww --
+            (0x22, self.lut_bw),        # bw r
+            (0x23, self.lut_bb),        # wb w
+            (0x24, self.lut_wb),        # bb b
+        ))
 
     def Partial_SetLut(self):
-        self.send_command(0x20)
-        self.send_data2(self.EPD_4IN2_Partial_lut_vcom1)
-
-        self.send_command(0x21)
-        self.send_data2(self.EPD_4IN2_Partial_lut_ww1)
-        
-        self.send_command(0x22)
-        self.send_data2(self.EPD_4IN2_Partial_lut_bw1)
-
-        self.send_command(0x23)
-        self.send_data2(self.EPD_4IN2_Partial_lut_wb1)
+        lut.load(self, (
+            (0x20, self.EPD_4IN2_Partial_lut_vcom1),
+            (0x21, self.EPD_4IN2_Partial_lut_ww1),
+            (0x22, self.EPD_4IN2_Partial_lut_bw1),
+            (0x23, self.EPD_4IN2_Partial_lut_wb1),
+            (0x24, self.EPD_4IN2_Partial_lut_bb1),
+        ))
 
-        self.send_command(0x24)
-        self.send_data2(self.EPD_4IN2_Partial_lut_bb1)
-
-
-       
     def Gray_SetLut(self):
-        self.send_command(0x20)      #vcom
-        self.send_data2(self.EPD_4IN2_4Gray_lut_vcom) 
-
-        self.send_command(0x21)      #red not use
-        self.send_data2(self.EPD_4IN2_4Gray_lut_ww) 
-
-        self.send_command(0x22)       #bw r
-        self.send_data2(self.EPD_4IN2_4Gray_lut_bw) 
-
-        self.send_command(0x23)       #wb w
-        self.send_data2(self.EPD_4IN2_4Gray_lut_wb) 
-
-        self.send_command(0x24)                          #bb b
-        self.send_data2(self.EPD_4IN2_4Gray_lut_bb) 
-
-        self.send_command(0x25)      #vcom
-        self.send_data2(self.EPD_4IN2_4Gray_lut_ww)
-      
+        lut.load(self, (
+            (0x20, self.EPD_4IN2_4Gray_lut_vcom),   #vcom
+            (0x21, self.EPD_4IN2_4Gray_lut_ww),     #red not use
+            (0x22, self.EPD_4IN2_4Gray_lut_bw),     #bw r
+            (0x23, self.EPD_4IN2_4Gray_lut_wb),     #wb w
+            (0x24, self.EPD_4IN2_4Gray_lut_bb),     #bb b
+            (0x25, self.EPD_4IN2_4Gray_lut_ww),     #vcom
+        ))
     
     def init(self):
         if (epdconfig.module_init() != 0):
@@ -316,39 +347,10 @@ class EPD:
         # EPD hardware init start
         self.reset()
         
-        self.send_command(0x01) # POWER SETTING
-        self.send_data(0x03) # VDS_EN, VDG_EN
-        self.send_data(0x00) # VCOM_HV, VGHL_LV[1], VGHL_LV[0]
-        self.send_data(0x2b) # VDH
-        self.send_data(0x2b) # VDL
-        
-        self.send_command(0x06) # boost soft start
-        self.send_data(0x17)
-        self.send_data(0x17)
-        self.send_data(0x17)
-        
-        self.send_command(0x04) # POWER_ON
-        self.ReadBusy()
-        
-        self.send_command(0x00) # panel setting
-        self.send_data(0xbf) # KW-BF   KWR-AF  BWROTP 0f
-        
-        self.send_command(0x30) # PLL setting
-        self.send_data(0x3c) # 3A 100HZ   29 150Hz 39 200HZ  31 171HZ
-
-        self.send_command(0x61) # resolution setting
-        self.send_data(0x01)
-        self.send_data(0x90) # 128
-        self.send_data(0x01)  
-        self.send_data(0x2c)
-
-        self.send_command(0x82) # vcom_DC setting
-        self.send_data(0x12)
-
-        self.send_command(0X50) # VCOM AND DATA INTERVAL SETTING
-        self.send_data(0x97) # 97white border 77black border  VBDF 17|D7 VBDW 97 VBDB 57  VBDF F7 VBDW 77 VBDB 37  VBDR B7
+        sequence.run(self, INIT_SEQUENCE, epdconfig)
     
         self.set_lut()
+        self.refresh_mode = "full"
         # EPD hardware init end
         return 0
         
@@ -358,39 +360,10 @@ class EPD:
         # EPD hardware init start
         self.reset()
         
-        self.send_command(0x01) # POWER SETTING
-        self.send_data(0x03) # VDS_EN, VDG_EN
-        self.send_data(0x00) # VCOM_HV, VGHL_LV[1], VGHL_LV[0]
-        self.send_data(0x2b) # VDH
-        self.send_data(0x2b) # VDL
-        
-        self.send_command(0x06) # boost soft start
-        self.send_data(0x17)
-        self.send_data(0x17)
-        self.send_data(0x17)
-        
-        self.send_command(0x04) # POWER_ON
-        self.ReadBusy()
-        
-        self.send_command(0x00) # panel setting
-        self.send_data(0xbf) # KW-BF   KWR-AF  BWROTP 0f
-        
-        self.send_command(0x30) # PLL setting
-        self.send_data(0x3c) # 3A 100HZ   29 150Hz 39 200HZ  31 171HZ
-
-        self.send_command(0x61) # resolution setting
-        self.send_data(0x01)
-        self.send_data(0x90) # 128
-        self.send_data(0x01)  
-        self.send_data(0x2c)
-
-        self.send_command(0x82) # vcom_DC setting
-        self.send_data(0x12)
-
-        self.send_command(0X50) # VCOM AND DATA INTERVAL SETTING
-        self.send_data(0x07) # 97white border 77black border  VBDF 17|D7 VBDW 97 VBDB 57  VBDF F7 VBDW 77 VBDB 37  VBDR B7
+        sequence.run(self, PARTIAL_INIT_SEQUENCE, epdconfig)
     
         self.Partial_SetLut();
+        self.refresh_mode = "partial"
         # EPD hardware init end
         return 0
         
@@ -400,101 +373,29 @@ class EPD:
         # EPD hardware init start
         self.reset()
         
-        self.send_command(0x01)   #POWER SETTING
-        self.send_data (0x03)
-        self.send_data (0x00)       #VGH=20V,VGL=-20V
-        self.send_data (0x2b)  #VDH=15V                
-        self.send_data (0x2b)  #VDL=-15V
-        self.send_data (0x13)
-
-        self.send_command(0x06)         #booster soft start
-        self.send_data (0x17)  #A
-        self.send_data (0x17)  #B
-        self.send_data (0x17)  #C 
-
-        self.send_command(0x04)
-        self.ReadBusy()
+        sequence.run(self, GRAY_INIT_SEQUENCE, epdconfig)
+        self.refresh_mode = "gray"
 
-        self.send_command(0x00)   #panel setting
-        self.send_data(0x3f)  #KW-3f   KWR-2F BWROTP 0f BWOTP 1f
-
-        self.send_command(0x30)   #PLL setting
-        self.send_data (0x3c)       #100hz 
-
-        self.send_command(0x61)   #resolution setting
-        self.send_data (0x01)  #400
-        self.send_data (0x90)       
-        self.send_data (0x01)  #300
-        self.send_data (0x2c)
-
-        self.send_command(0x82)   #vcom_DC setting
-        self.send_data (0x12)
-
-        self.send_command(0X50)   #VCOM AND DATA INTERVAL SETTING   
-        self.send_data(0x97)
-
-    def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+    def getbuffer(self, image, out=None):
+        return framebuffer.getbuffer(image, self.width, self.height, out)
         
     def getbuffer_4Gray(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 4) * self.height)
-        image_monocolor = image.convert('L')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        i=0
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((x + (y * self.width))/4)] = ((pixels[x-3, y]&0xc0) | (pixels[x-2, y]&0xc0)>>2 | (pixels[x-1, y]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6)
-                        
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for x in range(imwidth):
-                for y in range(imheight):
-                    newx = y
-                    newy = x
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((newx + (newy * self.width))/4)] = ((pixels[x, y-3]&0xc0) | (pixels[x, y-2]&0xc0)>>2 | (pixels[x, y-1]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6) 
-        
-        return buf
+        return grayscale.getbuffer(image, self.width, self.height, transpose=True)
+
+    # mode "partial" only changes the pixels that differ from the last
+    # full or partial display(), "gray" shows a getbuffer_4Gray() buffer.
+    # The controller is re-initialised when the last init was for another
+    # refresh mode.
+    def display(self, image, mode="full"):
+        if mode not in self.refresh_modes:
+            raise ValueError("Unsupported refresh mode %r" % mode)
+        if self.refresh_mode != mode:
+            {"full": self.init, "partial": self.init_Partial, "gray": self.Init_4Gray}[mode]()
+        if mode == "partial":
+            return self.display_Partial(image)
+        if mode == "gray":
+            return self.display_4Gray(image)
 
-    def display(self, image):
         if self.width%8 == 0:
             linewidth = int(self.width/8)
         else:
@@ -503,148 +404,64 @@ class EPD:
         self.send_command(0x92); 
         self.set_lut()
         self.send_command(0x10)
-        self.send_data2([0xFF] * int(self.width * linewidth))
+        self.send_data2(framebuffer.fill(0xFF, int(self.width * linewidth)))
             
         self.send_command(0x13)
         self.send_data2(image)
+        self.shadow[:] = image
             
         self.send_command(0x12) 
         self.ReadBusy()
 
+    # Partial refresh of the pixels that differ from what the panel shows,
+    # skipped when none do
+    def display_Partial(self, image):
+        box = framebuffer.changed(self.shadow, image, self.width, self.height)
+        if box is None:
+            logger.debug("panel already shows the image")
+            return
+        self.send_partial(box, image)
+
+    # Partial refresh of the window X_start..X_end, Y_start..Y_end (ends
+    # exclusive, X widened to whole bytes) from the whole panel `Image`
     def EPD_4IN2_PartialDisplay(self, X_start, Y_start, X_end, Y_end, Image):
-        # EPD_WIDTH       = 400
-        # EPD_HEIGHT      = 300
-
-        if(EPD_WIDTH % 8 != 0):
-           Width = int(EPD_WIDTH / 8) + 1
-        else:
-            Width = int(EPD_WIDTH / 8)
-        Height = EPD_HEIGHT
-        
-        if(X_start % 8 != 0):
-            X_start = int(X_start/8) + 1
-        else:
-            X_start = int(X_start/8)
-        if(X_end % 8 != 0):
-            X_end = int(X_end/8) + 1
-        else:
-            X_end = int(X_end/8)
-        
-        buf = [0x00] * (Y_end - Y_start) * (X_end - X_start)
+        box = (X_start // 8 * 8, Y_start, (X_end + 7) // 8 * 8, Y_end)
+        self.send_partial(box, Image)
 
-        
+    # Send the box of `image`, the old data coming from the shadow of the
+    # panel; the controller takes both planes inverted
+    def send_partial(self, box, image):
+        x0, y0, x1, y1 = box
         self.send_command(0x91)  #This command makes the display enter partial mode
         self.send_command(0x90)  #resolution setting
-        self.send_data (int(X_start*8/256))
-        self.send_data (int(X_start*8%256))   #x-start    
-        
-        self.send_data (int(X_end*8 /256))
-        self.send_data (int(X_end*8 %256)-1)  #x-end
+        self.send_data2([
+            x0 >> 8, x0 & 0xFF, (x1 - 1) >> 8, (x1 - 1) & 0xFF,
+            y0 >> 8, y0 & 0xFF, (y1 - 1) >> 8, (y1 - 1) & 0xFF,
+            0x28,
+        ])
 
-        self.send_data (int(Y_start/256))
-        self.send_data (int(Y_start%256))   #y-start    
-        
+        self.send_command(0x10)  #writes Old data to SRAM for programming
+        self.send_data2(framebuffer.inverted(framebuffer.crop(self.shadow, self.width, self.height, box)))
 
-        self.send_data (int(Y_end/256)) 
-        self.send_data (int(Y_end%256)-1)  #y-end
-        self.send_data (0x28)
-         
+        self.send_command(0x13)  #writes New data to SRAM.
+        self.send_data2(framebuffer.inverted(framebuffer.crop(image, self.width, self.height, box)))
+        framebuffer.paste(self.shadow, image, self.width, self.height, box)
 
-        self.send_command(0x10);        #writes Old data to SRAM for programming
-        for j in range(0, Y_end - Y_start):
-            for i in range(0, X_end - X_start):
-                buf[j * (X_end - X_start) + i] = self.DATA[(Y_start + j)*Width + X_start + i]
-        self.send_data2(buf)
-            
-        self.send_command(0x13);     #writes New data to SRAM.
-        for j in range(0, Y_end - Y_start):
-            for i in range(0, X_end - X_start):
-                buf[j * (X_end - X_start) + i] = ~Image[(Y_start + j)*Width + X_start + i]
-                self.DATA[(Y_start + j)*Width + X_start + i] = ~Image[(Y_start + j)*Width + X_start/8 + i]
-        self.send_data2(buf)
-            
-        self.send_command(0x12)   #DISPLAY REFRESH                
-        epdconfig.delay_ms(200)    #The delay here is necessary, 200uS at least!!!     
+        self.send_command(0x12)   #DISPLAY REFRESH
+        epdconfig.delay_ms(200)    #The delay here is necessary, 200uS at least!!!
         self.ReadBusy()
 
-
     def display_4Gray(self, image):
         self.send_command(0x92); 
-        self.set_lut()
+        # Gray_SetLut() below replaces the whole LUT before the refresh
+        high, low = grayscale.planes(image)
         self.send_command(0x10)
+        self.send_data2(high)
 
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-
-        buf = [0x00] * self.height * linewidth
-
-        for i in range(0, int(EPD_WIDTH * EPD_HEIGHT / 8)):                   # EPD_WIDTH * EPD_HEIGHT / 4
-            temp3=0
-            for j in range(0, 2):
-                temp1 = image[i*2+j]
-                for k in range(0, 2):
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):
-                        temp3 |= 0x01#white
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x00  #black
-                    elif(temp2 == 0x80): 
-                        temp3 |= 0x01  #gray1
-                    else: #0x40
-                        temp3 |= 0x00 #gray2
-                    temp3 <<= 1 
-                    
-                    temp1 <<= 2
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):  #white
-                        temp3 |= 0x01
-                    elif(temp2 == 0x00): #black
-                        temp3 |= 0x00
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x01 #gray1
-                    else :   #0x40
-                            temp3 |= 0x00 #gray2 
-                    if(j!=1 or k!=1):    
-                        temp3 <<= 1
-                    temp1 <<= 2
-            buf[i] = temp3
-        self.send_data2(buf)
-            
-        self.send_command(0x13)     
-               
-        for i in range(0, int(EPD_WIDTH * EPD_HEIGHT / 8)):                #5808*4  46464
-            temp3=0
-            for j in range(0, 2):
-                temp1 = image[i*2+j]
-                for k in range(0, 2):
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):
-                        temp3 |= 0x01#white
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x00  #black
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x00  #gray1
-                    else: #0x40
-                        temp3 |= 0x01 #gray2
-                    temp3 <<= 1 
-                    
-                    temp1 <<= 2
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):  #white
-                        temp3 |= 0x01
-                    elif(temp2 == 0x00): #black
-                        temp3 |= 0x00
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x00 #gray1
-                    else:    #0x40
-                        temp3 |= 0x01 #gray2
-                    if(j!=1 or k!=1):     
-                        temp3 <<= 1
-                    temp1 <<= 2
-            buf[i] = temp3
-        self.send_data2(buf)
+        self.send_command(0x13)
+        self.send_data2(low)
+        # Partial refreshes take light gray for white, dark gray for black
+        self.shadow[:] = high
         
         self.Gray_SetLut()
         self.send_command(0x12)
@@ -659,10 +476,11 @@ class EPD:
             linewidth = int(self.width/8) + 1
 
         self.send_command(0x10)
-        self.send_data2([0xff] * int(self.height * linewidth)) 
+        self.send_data2(framebuffer.fill(0xff, int(self.height * linewidth))) 
             
         self.send_command(0x13)
-        self.send_data2([0xff] * int(self.height * linewidth)) 
+        self.send_data2(framebuffer.fill(0xff, int(self.height * linewidth))) 
+        self.shadow[:] = framebuffer.fill(0xFF, len(self.shadow))
             
         self.send_command(0x12) 
         self.ReadBusy()
@@ -672,9 +490,10 @@ class EPD:
         self.ReadBusy()
         self.send_command(0x07) # DEEP_SLEEP
         self.send_data(0XA5)
+        lut.invalidate(self)
+        self.refresh_mode = None    # deep sleep needs a reset and init
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
         
 ### END OF FILE ###
 
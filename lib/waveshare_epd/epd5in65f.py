@@ -30,7 +30,8 @@
 #
 
 import logging
-from . import epdconfig
+from . import epdconfig, framebuffer, palette, sequence
+from .sequence import step
 
 import PIL
 from PIL import Image
@@ -42,6 +43,21 @@ EPD_HEIGHT      = 448
 
 logger = logging.getLogger(__name__)
 
+INIT_SEQUENCE = (
+    step(0x00, 0xEF, 0x08),
+    step(0x01, 0x37, 0x00, 0x23, 0x23),
+    step(0x03, 0x00),
+    step(0x06, 0xC7, 0xC7, 0x1D),
+    step(0x30, 0x3c),
+    step(0x41, 0x00),
+    step(0x50, 0x37),
+    step(0x60, 0x22),
+    step(0x61, 0x02, 0x58, 0x01, 0xC0),
+    step(0xE3, 0xAA, delay_ms=100),
+    step(0x50, 0x37),
+)
+
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -106,69 +122,14 @@ class EPD:
         self.reset()
 
         self.ReadBusyHigh()
-        self.send_command(0x00)
-        self.send_data(0xEF)
-        self.send_data(0x08)
-        self.send_command(0x01)
-        self.send_data(0x37)
-        self.send_data(0x00)
-        self.send_data(0x23)
-        self.send_data(0x23)
-        self.send_command(0x03)
-        self.send_data(0x00)
-        self.send_command(0x06)
-        self.send_data(0xC7)
-        self.send_data(0xC7)
-        self.send_data(0x1D)
-        self.send_command(0x30)
-        self.send_data(0x3c)
-        self.send_command(0x41)
-        self.send_data(0x00)
-        self.send_command(0x50)
-        self.send_data(0x37)
-        self.send_command(0x60)
-        self.send_data(0x22)
-        self.send_command(0x61)
-        self.send_data(0x02)
-        self.send_data(0x58)
-        self.send_data(0x01)
-        self.send_data(0xC0)
-        self.send_command(0xE3)
-        self.send_data(0xAA)
-
-        epdconfig.delay_ms(100)
-        self.send_command(0x50)
-        self.send_data(0x37)
+        sequence.run(self, INIT_SEQUENCE, epdconfig)
         # EPD hardware init end
         return 0
 
-    def getbuffer(self, image):
-        # Create a pallette with the 7 colors supported by the panel
-        pal_image = Image.new("P", (1,1))
-        pal_image.putpalette( (0,0,0,  255,255,255,  0,255,0,   0,0,255,  255,0,0,  255,255,0, 255,128,0) + (0,0,0)*249)
-
-        # Check if we need to rotate the image
-        imwidth, imheight = image.size
-        if(imwidth == self.width and imheight == self.height):
-            image_temp = image
-        elif(imwidth == self.height and imheight == self.width):
-            image_temp = image.rotate(90, expand=True)
-        else:
-            logger.warning("Invalid image dimensions: %d x %d, expected %d x %d" % (imwidth, imheight, self.width, self.height))
-
-        # Convert the soruce image to the 7 colors, dithering if needed
-        image_7color = image_temp.convert("RGB").quantize(palette=pal_image)
-        buf_7color = bytearray(image_7color.tobytes('raw'))
-
-        # PIL does not support 4 bit color, so pack the 4 bits of color
-        # into a single byte to transfer to the panel
-        buf = [0x00] * int(self.width * self.height / 2)
-        idx = 0
-        for i in range(0, len(buf_7color), 2):
-            buf[idx] = (buf_7color[i] << 4) + buf_7color[i+1]
-            idx += 1
-
-        return buf
+    def getbuffer(self, image, dither=True):
+        # Convert the source image to the 7 colors supported by the panel,
+        # dithering if needed, packed 2 pixels per byte
+        return palette.getbuffer(image, self.width, self.height, palette.SEVEN_COLOUR, dither)
 
     def display(self,image):
         self.send_command(0x61) #Set Resolution setting
@@ -196,7 +157,7 @@ class EPD:
         self.send_command(0x10)
 
         # Set all pixels to white
-        buf = [0x11] * int(self.width * self.height / 2)
+        buf = framebuffer.fill(0x11, int(self.width * self.height / 2))
         self.send_data2(buf)
 
         self.send_command(0x04) #0x04
@@ -213,5 +174,4 @@ class EPD:
         self.send_data(0XA5)
         epdconfig.digital_write(self.reset_pin, 0)
 
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
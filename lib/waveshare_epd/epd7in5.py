@@ -29,7 +29,8 @@
 
 
 import logging
-from . import epdconfig
+from . import epdconfig, framebuffer, sequence
+from .sequence import step
 
 # Display resolution
 EPD_WIDTH       = 640
@@ -37,6 +38,16 @@ EPD_HEIGHT      = 384
 
 logger = logging.getLogger(__name__)
 
+INIT_SEQUENCE = (
+    step(0x04, busy=True),  # POWER_ON
+    step(0x30, 0x3c),  # PLL_CONTROL
+    step(0x41, 0x00),  # TEMPERATURE_CALIBRATION
+    step(0x50, 0x77),  # VCOM_AND_DATA_INTERVAL_SETTING
+    step(0x60, 0x22),  # TCON_SETTING
+    step(0x61),  # TCON_RESOLUTION
+)
+
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -94,22 +105,7 @@ class EPD:
         self.send_command(0x06) # BOOSTER_SOFT_START
         self.send_data2([0xc7, 0xcc, 0x28])
         
-        self.send_command(0x04) # POWER_ON
-        self.ReadBusy()
-        
-        self.send_command(0x30) # PLL_CONTROL
-        self.send_data(0x3c)
-        
-        self.send_command(0x41) # TEMPERATURE_CALIBRATION
-        self.send_data(0x00)
-        
-        self.send_command(0x50) # VCOM_AND_DATA_INTERVAL_SETTING
-        self.send_data(0x77)
-        
-        self.send_command(0x60) # TCON_SETTING
-        self.send_data(0x22)
-        
-        self.send_command(0x61) # TCON_RESOLUTION
+        sequence.run(self, INIT_SEQUENCE, epdconfig)
         self.send_data(EPD_WIDTH >> 8)     #source 640
         self.send_data(EPD_WIDTH & 0xff)
         self.send_data(EPD_HEIGHT >> 8)     #gate 384
@@ -125,38 +121,8 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        halfwidth = int(self.width / 2)
-        buf = [0x33] * halfwidth * self.height
-        
-        if(imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif(imwidth == self.height and imheight == self.width):
-            img = img.rotate(90, expand=True).convert('1')
-            imwidth, imheight = img.size
-        else:
-            logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
-            # return a blank buffer
-            return buf
-        
-        pixels = img.load()
-
-        for y in range(imheight):
-            offset = y * halfwidth
-            for x in range(1, imwidth, 2):
-                i = offset + x // 2
-                if(pixels[x-1, y] > 191):
-                    if(pixels[x, y] > 191):
-                        buf[i] = 0x33
-                    else:
-                        buf[i] = 0x30
-                else:
-                    if(pixels[x, y] > 191):
-                        buf[i] = 0x03
-                    else:
-                        buf[i] = 0x00
-        return buf
+        # 4 bits per pixel, the pixels black or white
+        return framebuffer.uc8159(framebuffer.getbuffer(image, self.width, self.height))
         
     def display(self, image):
         self.send_command(0x10)
@@ -166,7 +132,7 @@ class EPD:
         self.ReadBusy()
         
     def Clear(self):
-        buf = [0x33] * int(self.width * self.height / 2)
+        buf = framebuffer.fill(0x33, int(self.width * self.height / 2))
         self.send_command(0x10)
         self.send_data2(buf)
         self.send_command(0x12)
@@ -179,7 +145,6 @@ class EPD:
         self.send_command(0x07) # DEEP_SLEEP
         self.send_data(0XA5)
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
 ### END OF FILE ###
 
@@ -29,7 +29,7 @@
 
 
 import logging
-from . import epdconfig
+from . import epdconfig, framebuffer
 
 # Display resolution
 EPD_WIDTH       = 880
@@ -130,20 +130,8 @@ class EPD:
         # EPD hardware init end
         return 0
 
-    def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        if(imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif(imwidth == self.height and imheight == self.width):
-            img = img.rotate(90, expand=True).convert('1')
-        else:
-            logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
-            # return a blank buffer
-            return [0xff] * int(self.width * self.height / 8)
-
-        buf = bytearray(img.tobytes('raw'))
-        return buf
+    def getbuffer(self, image, out=None):
+        return framebuffer.getbuffer(image, self.width, self.height, out)
         
     def display(self, image):
         self.send_command(0x4F); 
@@ -157,7 +145,7 @@ class EPD:
         self.ReadBusy();
         
     def Clear(self):
-        buf = [0xff] * int(self.width * self.height / 8)
+        buf = framebuffer.fill(0xff, int(self.width * self.height / 8))
         self.send_command(0x4F); 
         self.send_data2([0x00, 0x00])
         self.send_command(0x24)
@@ -176,7 +164,6 @@ class EPD:
         self.send_command(0x10);
         self.send_data(0x01);
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
 ### END OF FILE ###
 
@@ -29,7 +29,8 @@
 
 
 import logging
-from . import epdconfig
+from . import epdconfig, framebuffer, sequence
+from .sequence import step
 
 # Display resolution
 EPD_WIDTH       = 800
@@ -37,6 +38,27 @@ EPD_HEIGHT      = 480
 
 logger = logging.getLogger(__name__)
 
+INIT_SEQUENCE = (
+    step(0x04, delay_ms=100, busy=True),  # POWER ON
+    step(0x00, 0x3F),  # PANNEL SETTING: KW-3f   KWR-2F	BWROTP 0f	BWOTP 1f
+    step(0x61,  # tres
+         0x03,  # source 800
+         0x20,
+         0x01,  # gate 480
+         0xE0,
+    ),
+    step(0x15, 0x00),
+    step(0x50, 0x10, 0x07),  # VCOM AND DATA INTERVAL SETTING
+    step(0x60, 0x22),  # TCON SETTING
+    step(0x65,  # Resolution setting
+         0x00,
+         0x00,  # 800*480
+         0x00,
+         0x00,
+    ),
+)
+
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -195,58 +217,14 @@ class EPD:
         self.send_command(0x30);   # OSC Setting
         self.send_data(self.Voltage_Frame_7IN5_V2[0]);  # 2-0=100: N=4  ; 5-3=111: M=7  ;  3C=50Hz     3A=100HZ
 
-        self.send_command(0x04) #POWER ON
-        epdconfig.delay_ms(100)
-        self.ReadBusy()
-
-        self.send_command(0X00)			#PANNEL SETTING
-        self.send_data(0x3F)   #KW-3f   KWR-2F	BWROTP 0f	BWOTP 1f
-
-        self.send_command(0x61)        	#tres
-        self.send_data(0x03)		#source 800
-        self.send_data(0x20)
-        self.send_data(0x01)		#gate 480
-        self.send_data(0xE0)
-
-        self.send_command(0X15)
-        self.send_data(0x00)
-
-        self.send_command(0X50)			#VCOM AND DATA INTERVAL SETTING
-        self.send_data(0x10)
-        self.send_data(0x07)
-
-        self.send_command(0X60)			#TCON SETTING
-        self.send_data(0x22)
-
-        self.send_command(0x65);  # Resolution setting
-        self.send_data(0x00);
-        self.send_data(0x00); # 800*480
-        self.send_data(0x00);
-        self.send_data(0x00);
+        sequence.run(self, INIT_SEQUENCE, epdconfig)
 
         self.SetLut(self.LUT_VCOM_7IN5_V2, self.LUT_WW_7IN5_V2, self.LUT_BW_7IN5_V2, self.LUT_WB_7IN5_V2, self.LUT_BB_7IN5_V2)
         # EPD hardware init end
         return 0
 
-    def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        if(imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif(imwidth == self.height and imheight == self.width):
-            # image has correct dimensions, but needs to be rotated
-            img = img.rotate(90, expand=True).convert('1')
-        else:
-            logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
-            # return a blank buffer
-            return [0x00] * (int(self.width/8) * self.height)
-
-        buf = bytearray(img.tobytes('raw'))
-        # The bytes need to be inverted, because in the PIL world 0=black and 1=white, but
-        # in the e-paper world 0=white and 1=black.
-        for i in range(len(buf)):
-            buf[i] ^= 0xFF
-        return buf
+    def getbuffer(self, image, out=None):
+        return framebuffer.getbuffer(image, self.width, self.height, out, invert=True, blank=0x00)
 
     def display(self, image):
         self.send_command(0x13)
@@ -257,7 +235,7 @@ class EPD:
         self.ReadBusy()
 
     def Clear(self):
-        buf = [0x00] * (int(self.width/8) * self.height)
+        buf = framebuffer.fill(0x00, int(self.width/8) * self.height)
         self.send_command(0x10)
         self.send_data2(buf)
         self.send_command(0x13)
@@ -273,7 +251,6 @@ class EPD:
         self.send_command(0x07) # DEEP_SLEEP
         self.send_data(0XA5)
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
 ### END OF FILE ###
 
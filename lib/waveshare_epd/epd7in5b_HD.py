@@ -29,7 +29,8 @@
 
 
 import logging
-from . import epdconfig
+from . import epdconfig, framebuffer, sequence
+from .sequence import step
 
 # Display resolution
 EPD_WIDTH       = 880
@@ -37,6 +38,34 @@ EPD_HEIGHT      = 528
 
 logger = logging.getLogger(__name__)
 
+INIT_SEQUENCE = (
+    step(0x12, busy=True),  # SWRESET; waiting for the electronic paper IC to release the idle signal
+    step(0x46, 0xF7, busy=True),  # Auto Write RAM; waiting for the electronic paper IC to release the idle signal
+    step(0x47, 0xF7, busy=True),  # Auto Write RAM; waiting for the electronic paper IC to release the idle signal
+    step(0x0C, 0xAE, 0xC7, 0xC3, 0xC0, 0x40),  # Soft start setting
+    step(0x01, 0xAF, 0x02, 0x01),  # Set MUX as 527
+    step(0x11, 0x01),  # Data entry mode
+    step(0x44,
+         0x00,  # RAM x address start at 0
+         0x00,
+         0x6F,  # RAM x address end at 36Fh -> 879
+         0x03,
+    ),
+    step(0x45,
+         0xAF,  # RAM y address start at 20Fh;
+         0x02,
+         0x00,  # RAM y address end at 00h;
+         0x00,
+    ),
+    step(0x3C, 0x01),  # VBD: LUT1, for white
+    step(0x18, 0x80),
+    step(0x22, 0xB1),  # Load Temperature and waveform setting.
+    step(0x20, busy=True),  # waiting for the electronic paper IC to release the idle signal
+    step(0x4E, 0x00, 0x00),
+    step(0x4F, 0xAF, 0x02),
+)
+
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -66,6 +95,13 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a lot of data
+    def send_data2(self, data):
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
@@ -80,85 +116,12 @@ class EPD:
             
         self.reset()
         
-        self.send_command(0x12); 		  #SWRESET
-        self.ReadBusy();        #waiting for the electronic paper IC to release the idle signal
-
-        self.send_command(0x46);  # Auto Write RAM
-        self.send_data(0xF7);
-        self.ReadBusy();        #waiting for the electronic paper IC to release the idle signal
-
-        self.send_command(0x47);  # Auto Write RAM
-        self.send_data(0xF7);
-        self.ReadBusy();        #waiting for the electronic paper IC to release the idle signal
-
-        self.send_command(0x0C);  # Soft start setting
-        self.send_data(0xAE);
-        self.send_data(0xC7);
-        self.send_data(0xC3);
-        self.send_data(0xC0);
-        self.send_data(0x40);   
-
-        self.send_command(0x01);  # Set MUX as 527
-        self.send_data(0xAF);
-        self.send_data(0x02);
-        self.send_data(0x01);
-
-        self.send_command(0x11);  # Data entry mode
-        self.send_data(0x01);
-
-        self.send_command(0x44);
-        self.send_data(0x00); # RAM x address start at 0
-        self.send_data(0x00);
-        self.send_data(0x6F); # RAM x address end at 36Fh -> 879
-        self.send_data(0x03);
-        self.send_command(0x45);
-        self.send_data(0xAF); # RAM y address start at 20Fh;
-        self.send_data(0x02);
-        self.send_data(0x00); # RAM y address end at 00h;
-        self.send_data(0x00);
-
-        self.send_command(0x3C); # VBD
-        self.send_data(0x01); # LUT1, for white
-
-        self.send_command(0x18);
-        self.send_data(0X80);
-        self.send_command(0x22);
-        self.send_data(0XB1);	#Load Temperature and waveform setting.
-        self.send_command(0x20);
-        self.ReadBusy();        #waiting for the electronic paper IC to release the idle signal
-
-        self.send_command(0x4E); 
-        self.send_data(0x00);
-        self.send_data(0x00);
-        self.send_command(0x4F); 
-        self.send_data(0xAF);
-        self.send_data(0x02);
+        sequence.run(self, INIT_SEQUENCE, epdconfig)
         
         return 0
 
-    def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        logger.debug('imwidth = %d  imheight =  %d ',imwidth, imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+    def getbuffer(self, image, out=None):
+        return framebuffer.getbuffer(image, self.width, self.height, out)
 
     def display(self, imageblack, imagered):
         self.send_command(0x4F); 
@@ -184,13 +147,11 @@ class EPD:
         self.send_data(0xAf);
         
         self.send_command(0x24)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xff);
+        self.send_data2(framebuffer.fill(0xff, int(self.width * self.height / 8)))
         
         
         self.send_command(0x26)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0x00);
+        self.send_data2(framebuffer.fill(0x00, int(self.width * self.height / 8)))
         
         self.send_command(0x22);
         self.send_data(0xC7);    #Load LUT from MCU(0x32)
@@ -202,7 +163,6 @@ class EPD:
         self.send_command(0x10);  	#deep sleep
         self.send_data(0x01);
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
 ### END OF FILE ###
 
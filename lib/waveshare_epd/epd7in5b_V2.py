@@ -29,7 +29,8 @@
 
 
 import logging
-from . import epdconfig
+from . import epdconfig, framebuffer, sequence
+from .sequence import step
 
 # Display resolution
 EPD_WIDTH       = 800
@@ -37,6 +38,28 @@ EPD_HEIGHT      = 480
 
 logger = logging.getLogger(__name__)
 
+INIT_SEQUENCE = (
+    step(0x01,  # POWER SETTING
+         0x07,
+         0x07,  # VGH=20V,VGL=-20V
+         0x3f,  # VDH=15V
+         0x3f,  # VDL=-15V
+    ),
+    step(0x04, delay_ms=100, busy=True),  # POWER ON
+    step(0x00, 0x0F),  # PANNEL SETTING: KW-3f   KWR-2F	BWROTP 0f	BWOTP 1f
+    step(0x61,  # tres
+         0x03,  # source 800
+         0x20,
+         0x01,  # gate 480
+         0xE0,
+    ),
+    step(0x15, 0x00),
+    step(0x50, 0x11, 0x07),  # VCOM AND DATA INTERVAL SETTING
+    step(0x60, 0x22),  # TCON SETTING
+    step(0x65, 0x00, 0x00, 0x00, 0x00),
+)
+
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -95,69 +118,17 @@ class EPD:
         # self.send_data(0x38)        # If an exception is displayed, try using 0x38
         # self.send_data(0x17)
 
-        self.send_command(0x01);			#POWER SETTING
-        self.send_data(0x07);
-        self.send_data(0x07);    #VGH=20V,VGL=-20V
-        self.send_data(0x3f);		#VDH=15V
-        self.send_data(0x3f);		#VDL=-15V
-
-        self.send_command(0x04); #POWER ON
-        epdconfig.delay_ms(100);
-        self.ReadBusy();
-
-        self.send_command(0X00);			#PANNEL SETTING
-        self.send_data(0x0F);   #KW-3f   KWR-2F	BWROTP 0f	BWOTP 1f
-
-        self.send_command(0x61);        	#tres
-        self.send_data(0x03);		#source 800
-        self.send_data(0x20);
-        self.send_data(0x01);		#gate 480
-        self.send_data(0xE0);
-
-        self.send_command(0X15);
-        self.send_data(0x00);
-
-        self.send_command(0X50);			#VCOM AND DATA INTERVAL SETTING
-        self.send_data(0x11);
-        self.send_data(0x07);
-
-        self.send_command(0X60);			#TCON SETTING
-        self.send_data(0x22);
-
-        self.send_command(0x65);
-        self.send_data(0x00);
-        self.send_data(0x00);
-        self.send_data(0x00);
-        self.send_data(0x00);
+        sequence.run(self, INIT_SEQUENCE, epdconfig)
     
         return 0
 
-    def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        if(imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif(imwidth == self.height and imheight == self.width):
-            # image has correct dimensions, but needs to be rotated
-            img = img.rotate(90, expand=True).convert('1')
-        else:
-            logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
-            # return a blank buffer
-            return [0x00] * (int(self.width/8) * self.height)
-
-        buf = bytearray(img.tobytes('raw'))
-        # The bytes need to be inverted, because in the PIL world 0=black and 1=white, but
-        # in the e-paper world 0=white and 1=black.
-        for i in range(len(buf)):
-            buf[i] ^= 0xFF
-        return buf
+    def getbuffer(self, image, out=None):
+        return framebuffer.getbuffer(image, self.width, self.height, out, invert=True, blank=0x00)
 
     def display(self, imageblack, imagered):
         self.send_command(0x10)
         # The black bytes need to be inverted back from what getbuffer did
-        for i in range(len(imageblack)):
-            imageblack[i] ^= 0xFF
-        self.send_data2(imageblack)
+        self.send_data2(framebuffer.inverted(imageblack))
 
         self.send_command(0x13)
         self.send_data2(imagered)
@@ -167,8 +138,8 @@ class EPD:
         self.ReadBusy()
         
     def Clear(self):
-        buf = [0x00] * (int(self.width/8) * self.height)
-        buf2 = [0xff] * (int(self.width/8) * self.height)
+        buf = framebuffer.fill(0x00, int(self.width/8) * self.height)
+        buf2 = framebuffer.fill(0xff, int(self.width/8) * self.height)
         self.send_command(0x10)
         self.send_data2(buf2)
             
@@ -186,7 +157,6 @@ class EPD:
         self.send_command(0x07) # DEEP_SLEEP
         self.send_data(0XA5)
         
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        epdconfig.module_exit(settle_ms=2000)
 ### END OF FILE ###
 
@@ -27,15 +27,151 @@
 # THE SOFTWARE.
 #
 
+import atexit
+import contextlib
 import os
+import json
 import logging
 import sys
+import threading
 import time
 
 logger = logging.getLogger(__name__)
 
+# SPI transport settings. Every key can be overridden per board and per panel
+# in SPI_CONFIG_FILE, or through the EPD_SPI_<KEY> environment variables.
+DEFAULT_SPI_SETTINGS = {
+    "bus": 0,
+    "device": 0,
+    "speed_hz": 4000000,
+    "mode": 0b00,
+    # Largest single spidev write; 0 sends the whole buffer in one call
+    "chunk_bytes": 4096,
+}
+BOARD_SPI_SETTINGS = {
+    "SunriseX3": {"bus": 2},
+}
+# Pins a panel can be wired to, as the drivers read them from epdconfig
+PIN_NAMES = ("RST_PIN", "DC_PIN", "CS_PIN", "BUSY_PIN")
+SPI_CONFIG_FILE = os.environ.get(
+    "EPD_SPI_CONFIG", os.path.expanduser("~/.config/waveshare_epd/spi.json")
+)
+
+
+def validate_settings(settings):
+    for key in DEFAULT_SPI_SETTINGS:
+        if not isinstance(settings.get(key), int) or settings[key] < 0:
+            raise ValueError("SPI setting %s must be a non-negative int, got %r" % (key, settings.get(key)))
+    if settings["mode"] > 3:
+        raise ValueError("SPI mode must be 0-3, got %d" % settings["mode"])
+    if settings["speed_hz"] == 0:
+        raise ValueError("SPI speed_hz must be positive")
+    return settings
+
+
+def load_settings(board=None, panel=None, config_file=None, **overrides):
+    """Merge SPI settings, later sources winning: defaults, board defaults,
+    the config file's "<board>", "<panel>" and "<board>/<panel>" sections,
+    EPD_SPI_* environment variables and finally keyword overrides.
+    """
+    settings = dict(DEFAULT_SPI_SETTINGS)
+    settings.update(BOARD_SPI_SETTINGS.get(board, {}))
+
+    config_file = config_file or SPI_CONFIG_FILE
+    if os.path.exists(config_file):
+        with open(config_file) as f:
+            config = json.load(f)
+        for section in (board, panel, "%s/%s" % (board, panel)):
+            settings.update(config.get(section) or {})
+
+    for key in DEFAULT_SPI_SETTINGS:
+        value = os.environ.get("EPD_SPI_" + key.upper())
+        if value is not None:
+            settings[key] = int(value, 0)
+
+    settings.update((k, v) for k, v in overrides.items() if v is not None)
+    return validate_settings(settings)
+
+
+def chunks(data, size):
+    if size <= 0 or len(data) <= size:
+        yield data
+        return
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+class Backend:
+    """Settings and session handling shared by the board implementations.
+
+    Subclasses implement _module_init()/_module_exit() to claim and release
+    the GPIO pins and SPI bus. While a session is open module_exit() leaves
+    them configured, so a daemon only pays for setup once instead of on every
+    init()/sleep() cycle; close_session() or interpreter exit releases them.
+    """
+    initialized = False
+    in_session = False
+
+    @property
+    def lock(self):
+        """Held by whoever drives this panel, e.g. for a whole refresh."""
+        # The board __init__ methods do not chain up, create it on first use
+        if "_lock" not in self.__dict__:
+            self.__dict__.setdefault("_lock", threading.RLock())
+        return self.__dict__["_lock"]
+
+    def configure(self, panel=None, **overrides):
+        # Updated in place, the module level `settings` alias stays valid
+        self.settings.clear()
+        self.settings.update(load_settings(type(self).__name__, panel, **overrides))
+        logger.debug("SPI settings %s", self.settings)
 
-class Generic:
+    def module_init(self):
+        if self.initialized:
+            return 0
+        ret = self._module_init()
+        self.initialized = ret == 0
+        return ret
+
+    def module_exit(self, settle_ms=0):
+        if self.in_session:
+            logger.debug("session open, keeping SPI and GPIO configured")
+            return
+        if not self.initialized:
+            return
+        # Let the panel finish entering deep sleep before the pins drop
+        self.delay_ms(settle_ms)
+        self._module_exit()
+        self.initialized = False
+
+    def is_initialized(self):
+        """Whether the pins and SPI bus are claimed, so the panel has not
+        been reset by module_exit() since."""
+        return self.initialized
+
+    def open_session(self):
+        if not self.in_session:
+            logger.debug("opening SPI/GPIO session")
+            self.in_session = True
+            atexit.register(self.close_session)
+
+    def close_session(self):
+        if self.in_session:
+            logger.debug("closing SPI/GPIO session")
+            self.in_session = False
+            atexit.unregister(self.close_session)
+        self.module_exit()
+
+    @contextlib.contextmanager
+    def session(self):
+        self.open_session()
+        try:
+            yield self
+        finally:
+            self.close_session()
+
+
+class Generic(Backend):
     # Pin definition
     RST_PIN         = 17
     DC_PIN          = 25
@@ -47,6 +183,7 @@ class Generic:
 
         self.GPIO = GPIO
         self.SPI = spidev.SpiDev()
+        self.settings = load_settings(board=type(self).__name__)
 
     def digital_write(self, pin, value):
         self.GPIO.output(pin, value)
@@ -61,9 +198,10 @@ class Generic:
         self.SPI.writebytes(data)
 
     def spi_writebyte2(self, data):
-        self.SPI.writebytes2(data)
+        for chunk in chunks(data, self.settings["chunk_bytes"]):
+            self.SPI.writebytes2(chunk)
 
-    def module_init(self):
+    def _module_init(self):
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
         self.GPIO.setup(self.RST_PIN, self.GPIO.OUT)
@@ -71,13 +209,12 @@ class Generic:
         self.GPIO.setup(self.CS_PIN, self.GPIO.OUT)
         self.GPIO.setup(self.BUSY_PIN, self.GPIO.IN)
 
-        # SPI device, bus = 0, device = 0
-        self.SPI.open(0, 0)
-        self.SPI.max_speed_hz = 4000000
-        self.SPI.mode = 0b00
+        self.SPI.open(self.settings["bus"], self.settings["device"])
+        self.SPI.max_speed_hz = self.settings["speed_hz"]
+        self.SPI.mode = self.settings["mode"]
         return 0
 
-    def module_exit(self):
+    def _module_exit(self):
         logger.debug("spi end")
         self.SPI.close()
 
@@ -89,7 +226,7 @@ class Generic:
 
 
 
-class RaspberryPi:
+class RaspberryPi(Backend):
     # Pin definition
     RST_PIN         = 17
     DC_PIN          = 25
@@ -102,6 +239,7 @@ class RaspberryPi:
 
         self.GPIO = RPi.GPIO
         self.SPI = spidev.SpiDev()
+        self.settings = load_settings(board=type(self).__name__)
 
     def digital_write(self, pin, value):
         self.GPIO.output(pin, value)
@@ -116,9 +254,10 @@ class RaspberryPi:
         self.SPI.writebytes(data)
 
     def spi_writebyte2(self, data):
-        self.SPI.writebytes2(data)
+        for chunk in chunks(data, self.settings["chunk_bytes"]):
+            self.SPI.writebytes2(chunk)
 
-    def module_init(self):
+    def _module_init(self):
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
         self.GPIO.setup(self.RST_PIN, self.GPIO.OUT)
@@ -126,13 +265,12 @@ class RaspberryPi:
         self.GPIO.setup(self.CS_PIN, self.GPIO.OUT)
         self.GPIO.setup(self.BUSY_PIN, self.GPIO.IN)
 
-        # SPI device, bus = 0, device = 0
-        self.SPI.open(0, 0)
-        self.SPI.max_speed_hz = 4000000
-        self.SPI.mode = 0b00
+        self.SPI.open(self.settings["bus"], self.settings["device"])
+        self.SPI.max_speed_hz = self.settings["speed_hz"]
+        self.SPI.mode = self.settings["mode"]
         return 0
 
-    def module_exit(self):
+    def _module_exit(self):
         logger.debug("spi end")
         self.SPI.close()
 
@@ -143,7 +281,7 @@ class RaspberryPi:
         self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN])
 
 
-class JetsonNano:
+class JetsonNano(Backend):
     # Pin definition
     RST_PIN         = 17
     DC_PIN          = 25
@@ -168,6 +306,8 @@ class JetsonNano:
 
         import Jetson.GPIO
         self.GPIO = Jetson.GPIO
+        # Software SPI: only chunk_bytes applies, speed is whatever sysfs manages
+        self.settings = load_settings(board=type(self).__name__)
 
     def digital_write(self, pin, value):
         self.GPIO.output(pin, value)
@@ -185,7 +325,7 @@ class JetsonNano:
         for i in range(len(data)):
             self.SPI.SYSFS_software_spi_transfer(data[i])
 
-    def module_init(self):
+    def _module_init(self):
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
         self.GPIO.setup(self.RST_PIN, self.GPIO.OUT)
@@ -195,7 +335,7 @@ class JetsonNano:
         self.SPI.SYSFS_software_spi_begin()
         return 0
 
-    def module_exit(self):
+    def _module_exit(self):
         logger.debug("spi end")
         self.SPI.SYSFS_software_spi_end()
 
@@ -205,7 +345,7 @@ class JetsonNano:
 
         self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN])
 
-class SunriseX3:
+class SunriseX3(Backend):
     # Pin definition
     RST_PIN         = 17
     DC_PIN          = 25
@@ -219,6 +359,7 @@ class SunriseX3:
 
         self.GPIO = Hobot.GPIO
         self.SPI = spidev.SpiDev()
+        self.settings = load_settings(board=type(self).__name__)
 
     def digital_write(self, pin, value):
         self.GPIO.output(pin, value)
@@ -235,9 +376,10 @@ class SunriseX3:
     def spi_writebyte2(self, data):
         # for i in range(len(data)):
         #     self.SPI.writebytes([data[i]])
-        self.SPI.xfer3(data)
+        for chunk in chunks(data, self.settings["chunk_bytes"]):
+            self.SPI.xfer3(chunk)
 
-    def module_init(self):
+    def _module_init(self):
         if self.Flag == 0 :
             self.Flag = 1
             self.GPIO.setmode(self.GPIO.BCM)
@@ -247,15 +389,14 @@ class SunriseX3:
             self.GPIO.setup(self.CS_PIN, self.GPIO.OUT)
             self.GPIO.setup(self.BUSY_PIN, self.GPIO.IN)
 
-            # SPI device, bus = 0, device = 0
-            self.SPI.open(2, 0)
-            self.SPI.max_speed_hz = 4000000
-            self.SPI.mode = 0b00
+            self.SPI.open(self.settings["bus"], self.settings["device"])
+            self.SPI.max_speed_hz = self.settings["speed_hz"]
+            self.SPI.mode = self.settings["mode"]
             return 0
         else :
             return 0
 
-    def module_exit(self):
+    def _module_exit(self):
         logger.debug("spi end")
         self.SPI.close()
 
@@ -266,7 +407,146 @@ class SunriseX3:
 
         self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN])
 
-if os.path.exists('/sys/class/gpio/export'):
+class Simulated(Backend):
+    """Hardware free backend for benchmarks and dry runs.
+
+    Records the command/data stream and keeps a virtual clock: delays, SPI
+    transfers and BUSY waits advance clock_ms instead of sleeping, so drivers
+    run at full speed but still report how long the panel would have taken.
+    Select it with EPD_BACKEND=Simulated.
+    """
+    # Pin definition
+    RST_PIN         = 17
+    DC_PIN          = 25
+    CS_PIN          = 8
+    BUSY_PIN        = 24
+
+    # Rough busy time in ms started by a command: power off/on, the UC81xx
+    # refresh (0x12) and the SSD16xx master activation (0x20)
+    BUSY_MS = {0x02: 30, 0x04: 80, 0x12: 3000, 0x20: 3000}
+
+    def __init__(self, record=True):
+        self.settings = load_settings(board=type(self).__name__)
+        self.record = record
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.clock_ms = 0.0
+        self.busy_until_ms = 0.0
+        self.busy_wait_ms = 0.0
+        self.bytes_sent = 0
+        self.transfers = 0
+        self.pins = {}
+        self.transactions = []
+        # Controllers disagree on which BUSY level means idle. A wait starts
+        # with the level that ended the previous one and alternates while the
+        # driver keeps polling, so every "while busy" loop ends quickly.
+        self.idle_level = 1
+        self._busy_level = 1
+        self._polling = False
+
+    def _end_poll(self):
+        if self._polling:
+            self._polling = False
+            self.idle_level = self._busy_level
+
+    def digital_write(self, pin, value):
+        if pin not in (self.DC_PIN, self.CS_PIN):
+            self._end_poll()
+        self.pins[pin] = value
+
+    def digital_read(self, pin):
+        if pin != self.BUSY_PIN:
+            return self.pins.get(pin, 0)
+        if self.clock_ms < self.busy_until_ms:
+            self.busy_wait_ms += self.busy_until_ms - self.clock_ms
+            self.clock_ms = self.busy_until_ms
+        if self._polling:
+            self._busy_level ^= 1
+        else:
+            self._polling = True
+            self._busy_level = self.idle_level
+        return self._busy_level
+
+    def delay_ms(self, delaytime):
+        self.clock_ms += delaytime
+
+    def spi_writebyte(self, data):
+        self._transfer(data)
+
+    def spi_writebyte2(self, data):
+        self._transfer(data)
+
+    def _transfer(self, data):
+        self.bytes_sent += len(data)
+        self.transfers += 1
+        self.clock_ms += len(data) * 8000.0 / self.settings["speed_hz"]
+        if self.pins.get(self.DC_PIN, 0) == 0:
+            for command in data:
+                self.command(command)
+        else:
+            self.data(data)
+
+    def command(self, command):
+        # 0x71 (get status) is sent by some drivers while polling BUSY
+        if command != 0x71:
+            self._end_poll()
+        self.busy_until_ms = max(self.busy_until_ms, self.clock_ms + self.BUSY_MS.get(command, 0))
+        if self.record:
+            self.transactions.append((command, bytearray()))
+
+    def data(self, data):
+        self._end_poll()
+        if self.record and self.transactions:
+            try:
+                self.transactions[-1][1].extend(data)
+            except ValueError:
+                # spidev truncates to 8 bits, some drivers rely on it
+                self.transactions[-1][1].extend(byte & 0xFF for byte in data)
+
+    def _module_init(self):
+        return 0
+
+    def _module_exit(self):
+        pass
+
+BACKENDS = {cls.__name__: cls for cls in (Generic, RaspberryPi, JetsonNano, SunriseX3, Simulated)}
+
+
+def set_pins(backend, pins):
+    """Wire `backend` to other pins, e.g. {"CS_PIN": 7} for a second HAT."""
+    for name, pin in pins.items():
+        if name not in PIN_NAMES:
+            raise ValueError("Unknown pin %r, expected one of %s" % (name, ", ".join(PIN_NAMES)))
+        setattr(backend, name, pin)
+    return backend
+
+
+def create(board=None, panel=None, pins=None, **overrides):
+    """A backend of its own for one of several panels.
+
+    `board` defaults to the one in use, `pins` rewires it and `overrides`
+    are SPI settings on top of the config file's for `panel`, e.g. device=1
+    for a panel on the second chip select. Bind a driver to it with
+    panels.load_driver()."""
+    backend = BACKENDS[board or type(implementation).__name__]()
+    set_pins(backend, pins or {})
+    backend.configure(panel, **overrides)
+    return backend
+
+
+def use(backend):
+    """Point the module level functions (and pin numbers) at `backend`."""
+    global implementation
+    implementation = backend
+    for func in [x for x in dir(implementation) if not x.startswith('_')]:
+        setattr(sys.modules[__name__], func, getattr(implementation, func))
+    return backend
+
+
+if os.environ.get('EPD_BACKEND'):
+    implementation = BACKENDS[os.environ['EPD_BACKEND']]()
+elif os.path.exists('/sys/class/gpio/export'):
     implementation = Generic()
 elif os.path.exists('/sys/bus/platform/drivers/gpiomem-bcm2835'):
     implementation = RaspberryPi()
@@ -275,8 +555,7 @@ elif os.path.exists('/sys/bus/platform/drivers/gpio-x3'):
 else:
     implementation = JetsonNano()
 
-for func in [x for x in dir(implementation) if not x.startswith('_')]:
-    setattr(sys.modules[__name__], func, getattr(implementation, func))
+use(implementation)
 
 
 ### END OF FILE ###
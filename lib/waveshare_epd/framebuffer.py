@@ -0,0 +1,215 @@
+"""1 bit per pixel framebuffers shared by the black and white (and red)
+drivers.
+
+getbuffer() packs an image with PIL instead of a per pixel Python loop into
+a bytearray, rows of whole bytes with the leftmost pixel in the top bit and
+0 for ink. Pass `out` to pack into a buffer allocated once instead of a new
+one every frame:
+
+    buf = framebuffer.allocate(epd.width, epd.height)
+    while True:
+        epd.display(epd.getbuffer(draw(), out=buf))
+
+Clear() sends fill() patterns, constant bytes built once per size and value,
+pattern() builds test and maintenance patterns (stripes, checkerboards, a
+frame) once the same way, and the planes a controller wants inverted go
+through inverted(), one table lookup over the whole buffer.
+
+Drivers with partial refreshes keep a shadow of what the panel shows, so a
+refresh only sends the box around the pixels that changed:
+
+    box = framebuffer.changed(self.shadow, image, self.width, self.height)
+    if box is not None:
+        ... window `box`, send framebuffer.crop(image, self.width, self.height, box)
+        self.shadow[:] = image
+"""
+import functools
+import logging
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Every byte value with its bits flipped
+INVERT = bytes(range(255, -1, -1))
+
+
+def line_bytes(width):
+    return (width + 7) // 8
+
+
+def size(width, height):
+    """Bytes in a width x height buffer."""
+    return line_bytes(width) * height
+
+
+def allocate(width, height, value=0xFF):
+    """A width x height buffer of `value` bytes, white by default."""
+    return bytearray(fill(value, size(width, height)))
+
+
+@functools.lru_cache(maxsize=16)
+def fill(value, nbytes):
+    """`nbytes` bytes of `value`, e.g. a whole plane of white."""
+    return bytes((value,)) * nbytes
+
+
+# Test and maintenance patterns pattern() draws, 0 ink
+PATTERNS = (
+    "white",
+    "black",
+    "source-lines",  # every other pixel column
+    "gate-lines",  # every other line
+    "checkerboard",  # every other pixel
+    "chessboard",  # top left and bottom right quarters white
+    "left-black",
+    "up-black",
+    "frame",  # a 1 pixel border
+    "crosstalk",  # black bands across the top and bottom thirds
+)
+
+
+@functools.lru_cache(maxsize=32)
+def pattern(name, width, height):
+    """The test pattern `name` for a width x height panel, built once."""
+    nbytes = line_bytes(width)
+    x = np.arange(nbytes)[None, :]
+    y = np.arange(height)[:, None]
+    if name == "white":
+        packed = 0xFF
+    elif name == "black":
+        packed = 0x00
+    elif name == "source-lines":
+        packed = 0xAA
+    elif name == "gate-lines":
+        packed = np.where(y % 2 == 1, 0xFF, 0x00)
+    elif name == "checkerboard":
+        packed = np.where(y % 2 == 1, 0x55, 0xAA)
+    elif name == "chessboard":
+        packed = np.where((x >= nbytes / 2) == (y >= height / 2), 0xFF, 0x00)
+    elif name == "left-black":
+        packed = np.where(x >= nbytes / 2, 0xFF, 0x00)
+    elif name == "up-black":
+        packed = np.where(y >= height / 2, 0xFF, 0x00)
+    elif name == "frame":
+        packed = np.full((height, nbytes), 0xFF)
+        packed[:, 0] &= 0x7F
+        packed[:, -1] &= 0xFE
+        packed[[0, -1], :] = 0x00
+    elif name == "crosstalk":
+        bands = (x >= nbytes / 3) & (x <= nbytes / 3 * 2) & ((y <= height / 3) | (y >= height / 3 * 2))
+        packed = np.where(bands, 0x00, 0xFF)
+    else:
+        raise ValueError("Unknown pattern %r, one of %s" % (name, ", ".join(PATTERNS)))
+    return np.broadcast_to(np.asarray(packed, dtype=np.uint8), (height, nbytes)).tobytes()
+
+
+def inverted(buf):
+    """`buf` with ink and paper swapped, as bytes."""
+    return bytes(buf).translate(INVERT)
+
+
+def getbuffer(image, width, height, out=None, invert=False, blank=0xFF):
+    """Pack `image`, width x height or rotated, into `out` or a new buffer.
+
+    Rotated images are turned a quarter counterclockwise. With `invert` ink
+    is 1, as some controllers want it. Images of any other size give a
+    buffer of `blank` bytes. Bits past the right edge are left white."""
+    nbytes = size(width, height)
+    if out is None:
+        out = bytearray(nbytes)
+    elif len(out) != nbytes:
+        raise ValueError("buffer of %d bytes for a %dx%d panel, need %d" % (len(out), width, height, nbytes))
+
+    imwidth, imheight = image.size
+    if imwidth == width and imheight == height:
+        logger.debug("Vertical")
+        image = image.convert("1")
+    elif imwidth == height and imheight == width:
+        logger.debug("Horizontal")
+        image = image.convert("1").transpose(Image.Transpose.ROTATE_90)
+    else:
+        logger.warning("Wrong image dimensions: must be %dx%d", width, height)
+        out[:] = fill(blank, nbytes)
+        return out
+
+    out[:] = image.tobytes()
+    packed = np.frombuffer(out, dtype=np.uint8).reshape(height, line_bytes(width))
+    padding = -width % 8
+    if padding:
+        # PIL pads rows with ink
+        packed[:, -1] |= (1 << padding) - 1
+    if invert:
+        np.bitwise_not(packed, out=packed)
+    return out
+
+
+def view(buf, width, height):
+    """`buf` as a height x line bytes array sharing its memory, writable
+    when `buf` is a bytearray."""
+    if not isinstance(buf, (bytes, bytearray, memoryview)):
+        buf = bytes(buf)
+    return np.frombuffer(buf, dtype=np.uint8).reshape(height, line_bytes(width))
+
+
+def changed(old, new, width, height):
+    """The (x0, y0, x1, y1) box around every pixel that differs between `old`
+    and `new`, x on byte boundaries and the ends exclusive, or None when
+    nothing did."""
+    diff = view(old, width, height) != view(new, width, height)
+    rows = np.flatnonzero(diff.any(axis=1))
+    if not len(rows):
+        return None
+    columns = np.flatnonzero(diff.any(axis=0))
+    return (int(columns[0]) * 8, int(rows[0]), int(columns[-1] + 1) * 8, int(rows[-1]) + 1)
+
+
+def crop(buf, width, height, box):
+    """The bytes of `buf` inside a byte aligned box, row by row."""
+    x0, y0, x1, y1 = box
+    return view(buf, width, height)[y0:y1, x0 // 8:x1 // 8].tobytes()
+
+
+def paste(buf, src, width, height, box):
+    """Copy the box of `src` into the bytearray `buf`."""
+    x0, y0, x1, y1 = box
+    view(buf, width, height)[y0:y1, x0 // 8:x1 // 8] = view(src, width, height)[y0:y1, x0 // 8:x1 // 8]
+
+
+# The 4 bit pixels of UC8159 controllers
+UC8159_BLACK = 0x0
+UC8159_WHITE = 0x3
+UC8159_RED = 0x4
+# UC8159 pixel of each 2 bit pixel: 00 black, 11 white, red in between
+UC8159_OF_2BPP = np.array((UC8159_BLACK, UC8159_RED, UC8159_RED, UC8159_WHITE), dtype=np.uint8)
+
+
+def _bits(buf):
+    return np.unpackbits(np.frombuffer(bytes(buf), dtype=np.uint8))
+
+
+def nibbles(pixels):
+    """A flat array of 4 bit pixels packed two to a byte, left one high."""
+    return bytearray((pixels[0::2] << 4 | pixels[1::2]).tobytes())
+
+
+def uc8159(black, red=None):
+    """The 1 bit `black` and `red` planes (0 ink) as the 4 bits per pixel
+    UC8159 controllers take, red over black, in one pass."""
+    pixels = np.where(_bits(black), UC8159_WHITE, UC8159_BLACK).astype(np.uint8)
+    if red is not None:
+        pixels[_bits(red) == 0] = UC8159_RED
+    return nibbles(pixels)
+
+
+def uc8159_of_2bpp(buf):
+    """A 2 bits per pixel buffer, 11 white and 00 black, as UC8159 pixels."""
+    packed = np.frombuffer(bytes(buf), dtype=np.uint8)
+    pixels = packed[:, None] >> np.array((6, 4, 2, 0), dtype=np.uint8) & 0x3
+    return nibbles(UC8159_OF_2BPP[pixels.ravel()])
+
+
+def widen(buf):
+    """A 1 bit buffer as 2 bits per pixel, every bit doubled."""
+    return bytearray(np.packbits(_bits(buf).repeat(2)).tobytes())
@@ -0,0 +1,119 @@
+"""Packed frame buffers on disk, ready to send to the panel.
+
+A frame file holds the controller RAM planes of one picture exactly as the
+driver's getbuffer() packs them, after a small header:
+
+    offset  size  field
+    0       4     magic b"EPDF"
+    4       1     format version, 1
+    5       16    panel, the driver module name, NUL padded
+    21      2     width  \
+    23      2     height  | of the planes in the panel's native orientation
+    25      1     bits per pixel
+    26      1     number of planes
+    27      2     rotation the picture was turned by, in degrees
+    29      4     CRC-32 of the plane data
+
+All numbers are little endian. Every plane is height rows of
+ceil(width * depth / 8) bytes, rows padded to whole bytes, planes one after
+the other in the order the driver's display() takes them.
+
+load() maps the file and returns the planes as memoryviews into the mapping,
+so they can go straight to send_data2() without PIL or a copy:
+
+    frame = framefile.load("roguh_pics/generated/rose.epd2in13b_V3.epdf")
+    epd.display(*frame.planes)
+"""
+import mmap
+import os
+import struct
+import zlib
+from typing import NamedTuple, Tuple
+
+import numpy as np
+
+MAGIC = b"EPDF"
+VERSION = 1
+EXTENSION = ".epdf"
+
+HEADER = struct.Struct("<4sB16sHHBBHI")
+
+
+class Frame(NamedTuple):
+    panel: str
+    width: int
+    height: int
+    depth: int
+    rotation: int
+    planes: Tuple[memoryview, ...]
+
+
+def plane_size(width, height, depth=1):
+    return (width * depth + 7) // 8 * height
+
+
+def pack(panel, width, height, planes, depth=1, rotation=0):
+    """Header and planes of a frame file as bytes."""
+    size = plane_size(width, height, depth)
+    for plane in planes:
+        if len(plane) != size:
+            raise ValueError("Plane of %d bytes, expected %d for %dx%d at %d bpp" % (len(plane), size, width, height, depth))
+    data = b"".join(bytes(plane) for plane in planes)
+    header = HEADER.pack(
+        MAGIC, VERSION, panel.encode("ascii"), width, height, depth, len(planes), rotation, zlib.crc32(data)
+    )
+    return header + data
+
+
+def save(path, panel, width, height, planes, depth=1, rotation=0):
+    """Write a frame file, replacing any old one only once it is complete so
+    frames mapped by load() stay valid."""
+    data = pack(panel, width, height, planes, depth, rotation)
+    with open(path + ".tmp", "wb") as frame_file:
+        frame_file.write(data)
+    os.replace(path + ".tmp", path)
+
+
+def parse(data, verify=True):
+    """Frame of a bytes-like object, planes are memoryviews into `data`."""
+    view = memoryview(data)
+    if len(view) < HEADER.size:
+        raise ValueError("Frame file too short: %d bytes" % len(view))
+    magic, version, panel, width, height, depth, count, rotation, checksum = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError("Not a frame file, magic %r" % magic)
+    if version != VERSION:
+        raise ValueError("Unsupported frame file version %d" % version)
+    size = plane_size(width, height, depth)
+    payload = view[HEADER.size:]
+    if len(payload) != size * count:
+        raise ValueError("Frame data is %d bytes, expected %d planes of %d" % (len(payload), count, size))
+    if verify and zlib.crc32(payload) != checksum:
+        raise ValueError("Frame data checksum mismatch")
+    planes = tuple(payload[i * size:(i + 1) * size] for i in range(count))
+    return Frame(panel.rstrip(b"\0").decode("ascii"), width, height, depth, rotation, planes)
+
+
+def load(path, verify=True):
+    """Frame of the file at `path`, its planes backed by a read only mapping."""
+    with open(path, "rb") as frame_file:
+        if os.fstat(frame_file.fileno()).st_size < HEADER.size:
+            raise ValueError("Frame file too short: %s" % path)
+        # The mapping outlives the file, and lives as long as the planes
+        mapping = mmap.mmap(frame_file.fileno(), 0, access=mmap.ACCESS_READ)
+    return parse(mapping, verify)
+
+
+def as_array(plane):
+    """uint8 array of a bytes-like plane without copying, or of a list."""
+    if isinstance(plane, list):
+        return np.array(plane, dtype=np.uint8)
+    return np.frombuffer(plane, dtype=np.uint8)
+
+
+def merge(*planes):
+    """Ink of all the 1 bit planes where 0 is ink, as one plane."""
+    merged = as_array(planes[0])
+    for plane in planes[1:]:
+        merged = merged & as_array(plane)
+    return bytearray(merged.tobytes())
@@ -0,0 +1,69 @@
+"""4 gray level encoding shared by the gray capable drivers.
+
+getbuffer() turns an image into the drivers' 2 bits per pixel buffer, four
+pixels per byte with the leftmost pixel in the top bits, and planes() splits
+that buffer into the two controller RAM planes. Both are table lookups over
+whole arrays instead of per pixel Python loops:
+
+    high, low = grayscale.planes(grayscale.getbuffer(image, epd.width, epd.height))
+
+Gray codes, and the bit each level sets in the two planes:
+
+    code  level    high  low
+    3     white    1     1
+    2     gray1    1     0
+    1     gray2    0     1
+    0     black    0     0
+"""
+import logging
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Gray code of every L value: the top 2 bits, except that the exact levels
+# 0xC0 and 0x80 of the Waveshare demo pictures move one level darker
+LEVELS = [(0x80 if value == 0xC0 else 0x40 if value == 0x80 else value) >> 6 for value in range(256)]
+
+_SHIFTS = np.array([6, 4, 2, 0], dtype=np.uint8)
+
+# The high and low bits of the 4 pixels in a buffer byte, as a nibble
+_HIGH = np.array(
+    [sum(((byte >> shift) >> 1 & 1) << (3 - i) for i, shift in enumerate(_SHIFTS.tolist())) for byte in range(256)],
+    dtype=np.uint8,
+)
+_LOW = np.array(
+    [sum(((byte >> shift) & 1) << (3 - i) for i, shift in enumerate(_SHIFTS.tolist())) for byte in range(256)],
+    dtype=np.uint8,
+)
+
+
+def getbuffer(image, width, height, transpose=False):
+    """2 bits per pixel buffer of `image`, width x height or rotated.
+
+    Rotated images are turned a quarter counterclockwise, or mirrored along
+    the diagonal with `transpose` as the 4.2" driver always did."""
+    imwidth, imheight = image.size
+    if imwidth == width and imheight == height:
+        logger.debug("Vertical")
+    elif imwidth == height and imheight == width:
+        logger.debug("Horizontal")
+        image = image.transpose(Image.Transpose.TRANSPOSE if transpose else Image.Transpose.ROTATE_90)
+    else:
+        logger.warning("Wrong image dimensions: must be %dx%d", width, height)
+        return bytearray(b"\xff" * (width // 4 * height))
+    codes = np.asarray(image.convert("L").point(LEVELS), dtype=np.uint8)
+    codes = codes[:, : width // 4 * 4].reshape(height, -1, 4)
+    return bytearray(np.bitwise_or.reduce(codes << _SHIFTS, axis=2).tobytes())
+
+
+def planes(buf):
+    """Split a 2 bits per pixel buffer into its (high, low) 1 bit planes."""
+    packed = np.frombuffer(bytes(buf), dtype=np.uint8)
+    packed = packed[: len(packed) // 2 * 2]
+    high, low = _HIGH[packed], _LOW[packed]
+    return (
+        bytearray((high[0::2] << 4 | high[1::2]).tobytes()),
+        bytearray((low[0::2] << 4 | low[1::2]).tobytes()),
+    )
@@ -0,0 +1,105 @@
+"""What the panel shows, kept on disk across restarts.
+
+A panel keeps its picture without power, but a new process knows nothing of
+it and has to start with a full refresh. refreshing() stores the planes of
+every refresh in a frame file (see framefile.py), so after a restart
+restore() gives them back, checksum verified, and the drivers that keep a
+shadow of the panel (epd1in02, epd2in13d, epd2in9d, epd4in2) go on with
+partial refreshes of only what changed:
+
+    path = lastframe.path(epd)
+    epd.init()
+    lastframe.restore(epd, path)
+    while True:
+        with lastframe.refreshing(epd, path):
+            epd.DisplayPartial(epd.getbuffer(draw()))
+
+Drivers without a shadow pass the planes they display, and can skip a
+refresh when restore() returned the same ones:
+
+    with lastframe.refreshing(epd, path, (black, red)):
+        epd.display(black, red)
+
+The file is removed while a refresh runs, so a process killed halfway never
+leaves a frame the panel does not show. Loaded LUTs are not kept: init()
+resets the controller, which forgets them. Call forget() when something
+else draws on the panel.
+"""
+import contextlib
+import logging
+import os
+
+from . import framebuffer, framefile
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.environ.get("EPD_STATE_DIR", os.path.expanduser("~/.cache/waveshare_epd"))
+
+
+def panel_name(epd):
+    return type(epd).__module__.rsplit(".", 1)[-1]
+
+
+def path(epd, directory=STATE_DIR):
+    """Where the last frame of `epd`'s panel is kept."""
+    return os.path.join(directory, panel_name(epd) + framefile.EXTENSION)
+
+
+def save(epd, path, planes=None):
+    """Store `planes`, by default the driver's shadow of the panel."""
+    if planes is None:
+        planes = (epd.shadow,)
+    if planes[0] is None or getattr(epd, "refresh_mode", None) == "gray":
+        # No whole panel refresh yet, or the shadow only holds one of the two
+        # gray planes: no old data for a 1 bit partial refresh
+        forget(path)
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    framefile.save(path, panel_name(epd), epd.width, epd.height, planes)
+
+
+def load(epd, path):
+    """The planes last stored for `epd`'s panel, or None when there are none
+    or they are damaged or for another panel."""
+    try:
+        frame = framefile.load(path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring the last frame in %s: %s", path, e)
+        return None
+    if (frame.panel, frame.width, frame.height, frame.depth) != (panel_name(epd), epd.width, epd.height, 1):
+        logger.warning("Last frame %s is for %s %dx%d, not this panel", path, frame.panel, frame.width, frame.height)
+        return None
+    return frame.planes
+
+
+def restore(epd, path):
+    """Load the last frame and make it the driver's shadow of the panel.
+    Returns its planes, or None when the panel's contents are unknown."""
+    planes = load(epd, path)
+    if planes is None:
+        logger.info("No last frame in %s, the panel's contents are unknown", path)
+        return None
+    if hasattr(epd, "shadow"):
+        if len(planes) != 1 or len(planes[0]) != framebuffer.size(epd.width, epd.height):
+            logger.warning("Last frame %s does not fit the shadow of %s", path, panel_name(epd))
+            return None
+        epd.shadow = bytearray(planes[0])
+    logger.info("Panel shows the last frame from %s", path)
+    return planes
+
+
+def forget(path):
+    """Drop the last frame, the panel's contents are unknown."""
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+
+@contextlib.contextmanager
+def refreshing(epd, path, planes=None):
+    """Forget the last frame while the block refreshes the panel, then store
+    `planes` (by default the driver's shadow) as the new one."""
+    forget(path)
+    yield
+    save(epd, path, planes)
@@ -0,0 +1,42 @@
+"""Waveform LUT residency for the drivers that upload their own LUTs.
+
+The controllers keep uploaded LUTs in their registers until a hardware
+reset or deep sleep, yet the drivers upload them before every refresh.
+load() remembers what each LUT register of an EPD holds and only sends the
+tables that differ, so back-to-back refreshes with one waveform only send
+image data:
+
+    def set_lut(self):
+        lut.load(self, ((0x20, self.lut_vcom0), (0x21, self.lut_ww), ...))
+
+    def reset(self):
+        lut.invalidate(self)
+        ...
+
+Tables are compared by value; keep them as bytes constants.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def load(epd, tables):
+    """Upload the (register, table) pairs `epd`'s controller does not hold
+    already. Returns how many were sent."""
+    loaded = epd.__dict__.setdefault("loaded_luts", {})
+    sent = 0
+    for register, table in tables:
+        if loaded.get(register) == table:
+            continue
+        epd.send_command(register)
+        epd.send_data2(table)
+        loaded[register] = table
+        sent += 1
+    if sent < len(tables):
+        logger.debug("%d of %d LUTs already loaded", len(tables) - sent, len(tables))
+    return sent
+
+
+def invalidate(epd):
+    """Forget the loaded LUTs, after a reset or deep sleep cleared them."""
+    epd.__dict__["loaded_luts"] = {}
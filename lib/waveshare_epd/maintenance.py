@@ -0,0 +1,142 @@
+"""Anti-burn-in maintenance for panels that show the same layout for weeks.
+
+Pixels that keep their colour for long build up ghosting, most of all on
+three-colour panels. A Maintenance drives every pixel through each colour
+and back to white with full refreshes, once a night during quiet hours, so
+it never blanks the panel while people look at it:
+
+    maintenance = Maintenance(epd, planes=2, quiet_hours=(3, 5))
+    atexit.register(maintenance.flush)
+    while True:
+        if maintenance.due():
+            maintenance.run()
+        epd.display(black, red)
+        maintenance.record_refresh()
+
+The cycles send framebuffer.pattern() fills, built once, in bulk, so they
+are for drivers whose display() takes 1 bit planes. Refresh counts, the
+cycles' own refreshes included, are kept per panel in a JSON file (by default
+~/.cache/waveshare_epd/maintenance.json), so restarts neither skip a run nor
+run the cycles twice a night. The file is written when the schedule
+changes, after the cycles and at the first refresh after them, and else
+every SAVE_EVERY refreshes; call flush() on shutdown to keep the ones since.
+"""
+import datetime
+import json
+import logging
+import os
+import time
+
+from . import framebuffer, lastframe, modes
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = os.path.join(lastframe.STATE_DIR, "maintenance.json")
+# Refreshes counted between writes of the state file, to spare the SD card
+SAVE_EVERY = 20
+
+# Planes of the refreshes of one cycle by the number of planes display()
+# takes: black then white, and red in between on three-colour panels
+CYCLES = {
+    1: (("black",), ("white",)),
+    2: (("black", "white"), ("white", "black"), ("white", "white")),
+}
+
+
+def parse_hours(text):
+    """(start, end) hours of "start-end", e.g. "23-5", or None for "off".
+    Equal hours, a window that is never quiet, are rejected."""
+    if text in (None, "", "off"):
+        return None
+    start, end = (int(hour) for hour in text.split("-"))
+    if not (0 <= start < 24 and 0 <= end < 24):
+        raise ValueError("Hours out of range in %r" % text)
+    if start == end:
+        raise ValueError("No quiet hours in %r, use \"off\" to disable" % text)
+    return start, end
+
+
+class Maintenance:
+    def __init__(self, epd, planes=1, quiet_hours=(3, 5), interval_hours=20, cycles=2, state_file=STATE_FILE):
+        if planes not in CYCLES:
+            raise ValueError("No maintenance cycle for %d planes" % planes)
+        self.epd = epd
+        self.steps = CYCLES[planes]
+        self.quiet_hours = quiet_hours
+        self.interval_hours = interval_hours
+        self.cycles = cycles
+        self.state_file = state_file
+        self.panel = lastframe.panel_name(epd)
+        self.counts = self.load().get(self.panel, {"refreshes": 0, "since_maintenance": 0, "last_maintenance": 0})
+        self.unsaved = 0
+
+    # ---- state --------------------------------------------------------------
+    def load(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file) as state:
+                return json.load(state)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring maintenance state %s: %s", self.state_file, e)
+            return {}
+
+    def save(self):
+        if not self.state_file:
+            return
+        panels = self.load()
+        panels[self.panel] = self.counts
+        os.makedirs(os.path.dirname(self.state_file) or ".", exist_ok=True)
+        with open(self.state_file + ".tmp", "w") as state:
+            json.dump(panels, state, indent=2)
+        os.replace(self.state_file + ".tmp", self.state_file)
+        self.unsaved = 0
+
+    def flush(self):
+        """Write the refreshes counted since the last write, if any."""
+        if self.unsaved:
+            self.save()
+
+    def record_refresh(self):
+        """Count a refresh of the panel's contents."""
+        self.counts["refreshes"] += 1
+        self.counts["since_maintenance"] += 1
+        self.unsaved += 1
+        # The first refresh after the cycles makes them due again
+        if self.counts["since_maintenance"] == 1 or self.unsaved >= SAVE_EVERY:
+            self.save()
+
+    # ---- scheduling ---------------------------------------------------------
+    def quiet(self, now=None):
+        """Whether `now` (default: local time) falls in the quiet hours."""
+        if self.quiet_hours is None:
+            return False
+        hour = (now or datetime.datetime.now()).hour
+        start, end = self.quiet_hours
+        if start <= end:
+            return start <= hour < end
+        # Past midnight, e.g. 23-5
+        return hour >= start or hour < end
+
+    def due(self, now=None):
+        """Whether to run the cycles now: in the quiet hours, the interval
+        after the last run, and only if the panel was refreshed since."""
+        now = now or datetime.datetime.now()
+        if not self.quiet(now) or not self.counts["since_maintenance"]:
+            return False
+        return now.timestamp() - self.counts["last_maintenance"] >= self.interval_hours * 3600
+
+    def run(self):
+        """Full refreshes through every cycle, leaving the panel white. The
+        caller redraws its contents afterwards."""
+        epd = self.epd
+        logger.info("Running %d anti-burn-in cycles on %s after %d refreshes",
+                    self.cycles, self.panel, self.counts["since_maintenance"])
+        for _ in range(self.cycles):
+            for names in self.steps:
+                planes = [framebuffer.pattern(name, epd.width, epd.height) for name in names]
+                modes.display(epd, *planes)
+        self.counts["refreshes"] += self.cycles * len(self.steps)
+        self.counts["since_maintenance"] = 0
+        self.counts["last_maintenance"] = time.time()
+        self.save()
@@ -0,0 +1,51 @@
+"""Refresh modes: one display() for the waveforms a panel has.
+
+Drivers with more than one waveform list them in `refresh_modes` and take
+display(buf, mode=...):
+
+  full     the normal refresh; flashes, but clears ghosting
+  fast     a quicker whole panel waveform (e.g. DU), leaves some ghosting
+  partial  drives only the pixels that changed, without flashing
+  gray     4 gray levels, from a getbuffer_4Gray() buffer
+
+display() sets the controller up for the mode (init, LUTs) when the last
+refresh used another one, so callers can alternate, e.g. fast refreshes for
+a clock and a full one for every new picture:
+
+    mode = modes.pick(epd, modes.FAST, modes.PARTIAL)
+    modes.display(epd, epd.getbuffer(image), mode=mode)
+
+Drivers without `refresh_modes` only have the full refresh.
+./benchmarks/bench_modes.py reports what each mode costs.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+FULL = "full"
+FAST = "fast"
+PARTIAL = "partial"
+GRAY = "gray"
+MODES = (FULL, FAST, PARTIAL, GRAY)
+
+
+def supported(epd):
+    """The refresh modes `epd`'s display() takes."""
+    return getattr(epd, "refresh_modes", (FULL,))
+
+
+def pick(epd, *preferred):
+    """The first of `preferred` the panel has, else the full refresh."""
+    for mode in preferred:
+        if mode in supported(epd):
+            return mode
+    return FULL
+
+
+def display(epd, *buffers, mode=FULL):
+    """epd.display(*buffers) with the refresh `mode`, on any driver."""
+    if mode not in supported(epd):
+        raise ValueError("%s has no %s refresh" % (type(epd).__module__, mode))
+    if not hasattr(epd, "refresh_modes"):
+        return epd.display(*buffers)
+    return epd.display(*buffers, mode=mode)
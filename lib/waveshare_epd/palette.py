@@ -0,0 +1,96 @@
+"""Colour encoding shared by the 4 and 7 colour drivers.
+
+Palettes and everything derived from them are built once and cached, so a
+frame costs one quantize or table lookup plus a vectorized pack into bytes:
+
+    buf = palette.getbuffer(image, epd.width, epd.height, palette.SEVEN_COLOUR)
+
+With dither=True (the default, and what the drivers always did) PIL
+quantizes with Floyd-Steinberg error diffusion. dither=False maps every
+pixel to its nearest palette colour through a 32x32x32 RGB lookup cube,
+which is several times faster and exact for pictures already drawn in the
+panel colours. dither can also name one of the dither.ENGINES, which match
+against the measured panel colours instead of the ideal ones.
+"""
+import functools
+import logging
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Palette index is the colour code the controller expects
+FOUR_COLOUR = ((0, 0, 0), (255, 255, 255), (255, 255, 0), (255, 0, 0))
+SEVEN_COLOUR = (
+    (0, 0, 0),
+    (255, 255, 255),
+    (0, 255, 0),
+    (0, 0, 255),
+    (255, 0, 0),
+    (255, 255, 0),
+    (255, 128, 0),
+)
+
+# Panel colours name of each palette in dither.DEFAULT_PALETTES
+NAMES = {FOUR_COLOUR: "g4", SEVEN_COLOUR: "acep7"}
+
+CUBE_BITS = 5
+
+
+@functools.lru_cache(maxsize=None)
+def palette_image(colours):
+    """"P" image holding `colours`, padded with the first one to 256 entries."""
+    image = Image.new("P", (1, 1))
+    image.putpalette(sum(colours, ()) + colours[0] * (256 - len(colours)))
+    return image
+
+
+@functools.lru_cache(maxsize=None)
+def lookup_cube(colours):
+    """Nearest palette index for every RGB cell of a 32x32x32 cube."""
+    size = 1 << CUBE_BITS
+    step = 256 // size
+    centres = np.arange(size) * step + step // 2
+    r, g, b = np.meshgrid(centres, centres, centres, indexing="ij")
+    cells = np.stack((r, g, b), axis=-1).reshape(-1, 1, 3)
+    distance = ((cells - np.array(colours)) ** 2).sum(axis=-1)
+    return distance.argmin(axis=-1).astype(np.uint8).reshape(size, size, size)
+
+
+def quantize(image, colours, dither=True):
+    """Palette index of every pixel of `image` as a 2D uint8 array."""
+    if isinstance(dither, str):
+        from . import dither as engines
+
+        return engines.dither(image, dither, NAMES.get(colours, colours))
+    image = image.convert("RGB")
+    if dither:
+        return np.asarray(image.quantize(palette=palette_image(colours)), dtype=np.uint8)
+    rgb = np.asarray(image, dtype=np.uint8) >> (8 - CUBE_BITS)
+    return lookup_cube(colours)[rgb[..., 0], rgb[..., 1], rgb[..., 2]]
+
+
+def pack(indices, bits_per_pixel):
+    """Pack 2D palette indices into bytes, leftmost pixel in the top bits."""
+    per_byte = 8 // bits_per_pixel
+    height, width = indices.shape
+    if width % per_byte:
+        indices = np.pad(indices, ((0, 0), (0, per_byte - width % per_byte)))
+    shifts = np.arange(8 - bits_per_pixel, -1, -bits_per_pixel, dtype=np.uint8)
+    grouped = indices.reshape(height, -1, per_byte) << shifts
+    return bytearray(np.bitwise_or.reduce(grouped, axis=2).tobytes())
+
+
+def getbuffer(image, width, height, colours, dither=True):
+    """Packed buffer of `image`, width x height or rotated a quarter turn."""
+    bits_per_pixel = 2 if len(colours) <= 4 else 4
+    imwidth, imheight = image.size
+    if imwidth == width and imheight == height:
+        pass
+    elif imwidth == height and imheight == width:
+        image = image.transpose(Image.Transpose.ROTATE_90)
+    else:
+        logger.warning("Invalid image dimensions: %d x %d, expected %d x %d" % (imwidth, imheight, width, height))
+        return pack(np.ones((height, width), dtype=np.uint8), bits_per_pixel)
+    return pack(quantize(image, colours, dither), bits_per_pixel)
@@ -0,0 +1,36 @@
+"""Several panels driven from one process.
+
+The drivers call the module level epdconfig functions, which all go to one
+backend with one set of pins. load_driver() runs a private copy of a driver
+module whose `epdconfig` is a backend of its own instead, so every panel
+has its own pins, SPI device and lock and can be driven from its own
+thread:
+
+    backend = epdconfig.create(panel="epd7in5_V2", pins={"CS_PIN": 7}, device=1)
+    epd = panels.load_driver("epd7in5_V2", backend).EPD()
+    with backend.lock:
+        epd.init()
+        epd.display(epd.getbuffer(image))
+        epd.sleep()
+
+A backend instance stands in for the epdconfig module: it has the same
+functions and pin numbers.
+"""
+import importlib.util
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def load_driver(name, backend):
+    """Copy of the driver module `name` talking to `backend`."""
+    spec = importlib.util.find_spec(f"{__package__}.{name}")
+    if spec is None:
+        raise ValueError("No driver named %r" % name)
+    # Same name as the shared module, so Emulator.for_epd() recognises it,
+    # but not registered in sys.modules
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.epdconfig = backend
+    logger.debug("Loaded %s for %s", name, backend)
+    return module
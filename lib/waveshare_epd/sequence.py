@@ -0,0 +1,67 @@
+"""Controller set-up sequences as data.
+
+The init sequences of the drivers are tables of steps: a command, its
+parameters, then a delay and a BUSY wait. run() sends every command with
+all its parameters in one SPI transfer, instead of toggling DC and CS for
+each byte:
+
+    INIT_SEQUENCE = (
+        step(0x01, 0x03, 0x00, 0x2b, 0x2b),    # POWER SETTING
+        step(0x04, busy=True),                  # POWER_ON
+        step(0x00, 0xbf),                       # panel setting
+    )
+
+    def init(self):
+        ...
+        self.reset()
+        sequence.run(self, INIT_SEQUENCE, epdconfig)
+
+The driver passes the epdconfig it uses, which is not this module's when
+panels.load_driver() gave it a backend of its own. stream() lists what a
+table sends, in the form of Simulated.transactions, and replay() plays it
+into a backend such as the emulator without a driver.
+"""
+from typing import NamedTuple
+
+
+class Step(NamedTuple):
+    command: int
+    data: bytes = b""
+    delay_ms: int = 0
+    busy: bool = False
+
+
+def step(command, *data, delay_ms=0, busy=False):
+    """A Step sending `command` with the parameter bytes `data`."""
+    return Step(command, bytes(data), delay_ms, busy)
+
+
+def run(epd, steps, config, wait=None):
+    """Send `steps` through `epd`; BUSY waits call `wait`, by default
+    epd.ReadBusy."""
+    for command, data, delay_ms, busy in steps:
+        epd.send_command(command)
+        if data:
+            epd.send_data2(data)
+        if delay_ms:
+            config.delay_ms(delay_ms)
+        if busy:
+            (wait or epd.ReadBusy)()
+
+
+def stream(steps):
+    """(command, data) pairs `steps` send."""
+    return [(command, data) for command, data, _, _ in steps]
+
+
+def replay(backend, steps):
+    """Play `steps` into a Simulated backend, BUSY waits included."""
+    for command, data, delay_ms, busy in steps:
+        backend.command(command)
+        if data:
+            backend.data(data)
+        if delay_ms:
+            backend.delay_ms(delay_ms)
+        if busy and backend.clock_ms < backend.busy_until_ms:
+            backend.busy_wait_ms += backend.busy_until_ms - backend.clock_ms
+            backend.clock_ms = backend.busy_until_ms
@@ -0,0 +1,243 @@
+"""Opt-in timing instrumentation for the e-paper drivers.
+
+A Tracer wraps an EPD object's methods (reset, init, getbuffer, ReadBusy,
+display, Clear, sleep, ...) and the SPI, delay and pin functions of its
+epdconfig, and records how long each call took and how many bytes went over
+SPI while it ran. Calls are grouped into frames, one per refresh cycle, and
+every finished frame is appended to a JSON lines file:
+
+    tracer = Tracer("trace.jsonl")
+    tracer.instrument(epd, epdconfig)
+    with tracer.frame("clock"):
+        epd.init()
+        epd.display(epd.getbuffer(image))
+        epd.sleep()
+    print(tracer.format_summary())
+
+`python3 -m lib.waveshare_epd.tracing trace.jsonl` summarizes a saved trace.
+Nothing is wrapped unless instrument() is called, so untraced runs pay nothing.
+"""
+import collections
+import copy
+import functools
+import json
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Driver methods too fine grained to be worth a span, their bytes are still
+# counted by the SPI wrappers
+UNTRACED_METHODS = ("send_command", "send_data", "send_data2", "digital_write")
+
+# epdconfig functions recorded as totals per frame instead of as spans
+TRANSFER_FUNCTIONS = ("spi_writebyte", "spi_writebyte2")
+TOTALED_FUNCTIONS = TRANSFER_FUNCTIONS + ("delay_ms", "digital_read")
+SPAN_FUNCTIONS = ("module_init", "module_exit")
+
+# Finished frames kept in memory; the summary covers all of them through
+# running totals, and the output file has every one
+MAX_FRAMES = 100
+
+
+class Tracer:
+    def __init__(self, output_file=None):
+        self.output_file = output_file
+        self.frames = collections.deque(maxlen=MAX_FRAMES)
+        self.count = 0
+        self.ops = {}
+        self.current = None
+        self.depth = 0
+        self.bytes = 0
+        self.lock = threading.RLock()
+
+    # ---- recording ----------------------------------------------------------
+    def begin_frame(self, label=None):
+        with self.lock:
+            if self.current is not None:
+                self.end_frame()
+            self.current = {
+                "frame": self.count,
+                "label": label,
+                "time": time.time(),
+                "start_ns": time.perf_counter_ns(),
+                "events": [],
+                "totals": {},
+            }
+
+    def end_frame(self):
+        with self.lock:
+            frame, self.current = self.current, None
+            if frame is None:
+                return None
+            frame["duration_ms"] = (time.perf_counter_ns() - frame.pop("start_ns")) / 1e6
+            frame["bytes"] = sum(
+                total["bytes"] for name, total in frame["totals"].items() if name in TRANSFER_FUNCTIONS
+            )
+            self.frames.append(frame)
+            self.count += 1
+            add_frame(self.ops, frame)
+            if self.output_file:
+                with open(self.output_file, "a") as output_file:
+                    output_file.write(json.dumps(frame) + "\n")
+            return frame
+
+    def frame(self, label=None):
+        return _FrameContext(self, label)
+
+    def _ensure_frame(self):
+        if self.current is None:
+            self.begin_frame()
+        return self.current
+
+    def record_span(self, name, start_ns, end_ns, nbytes, depth):
+        with self.lock:
+            frame = self._ensure_frame()
+            frame["events"].append(
+                {
+                    "name": name,
+                    "depth": depth,
+                    "start_ms": (start_ns - frame["start_ns"]) / 1e6,
+                    "duration_ms": (end_ns - start_ns) / 1e6,
+                    "bytes": nbytes,
+                }
+            )
+
+    def record_total(self, name, duration_ns, nbytes):
+        with self.lock:
+            totals = self._ensure_frame()["totals"]
+            total = totals.setdefault(name, {"count": 0, "ms": 0.0, "max_ms": 0.0, "bytes": 0})
+            total["count"] += 1
+            total["ms"] += duration_ns / 1e6
+            total["max_ms"] = max(total["max_ms"], duration_ns / 1e6)
+            total["bytes"] += nbytes
+            self.bytes += nbytes
+
+    def span(self, name, func):
+        @functools.wraps(func)
+        def traced(*args, **kwargs):
+            start_bytes = self.bytes
+            depth = self.depth
+            self.depth += 1
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                end = time.perf_counter_ns()
+                self.depth = depth
+                self.record_span(name, start, end, self.bytes - start_bytes, depth)
+
+        return traced
+
+    def total(self, name, func, count_bytes=False):
+        @functools.wraps(func)
+        def traced(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                nbytes = len(args[0]) if count_bytes and args else 0
+                self.record_total(name, time.perf_counter_ns() - start, nbytes)
+
+        return traced
+
+    # ---- wiring -------------------------------------------------------------
+    def instrument(self, epd, config=None):
+        """Wrap the public methods of `epd` and the transfer functions of
+        `config`, the epdconfig module or backend the driver talks to."""
+        for name in dir(epd):
+            if name.startswith("_") or name in UNTRACED_METHODS:
+                continue
+            method = getattr(epd, name)
+            if callable(method) and not isinstance(method, type):
+                setattr(epd, name, self.span(name, method))
+        if config is not None:
+            self.instrument_config(config)
+        return epd
+
+    def instrument_config(self, config):
+        for name in TOTALED_FUNCTIONS:
+            if hasattr(config, name):
+                func = getattr(config, name)
+                setattr(config, name, self.total(name, func, name in TRANSFER_FUNCTIONS))
+        for name in SPAN_FUNCTIONS:
+            if hasattr(config, name):
+                setattr(config, name, self.span(name, getattr(config, name)))
+        return config
+
+    # ---- reporting ----------------------------------------------------------
+    def summary(self):
+        """summarize() of every frame since the tracer was created."""
+        with self.lock:
+            return with_means(copy.deepcopy(self.ops))
+
+    def format_summary(self):
+        return format_summary(self.summary())
+
+
+class _FrameContext:
+    def __init__(self, tracer, label):
+        self.tracer = tracer
+        self.label = label
+
+    def __enter__(self):
+        self.tracer.begin_frame(self.label)
+        return self.tracer
+
+    def __exit__(self, *exc):
+        self.tracer.end_frame()
+
+
+def add_frame(ops, frame):
+    """Add a finished frame to the per operation totals `ops`."""
+
+    def add(name, count, ms, max_ms, nbytes):
+        op = ops.setdefault(name, {"count": 0, "ms": 0.0, "max_ms": 0.0, "bytes": 0})
+        op["count"] += count
+        op["ms"] += ms
+        op["max_ms"] = max(op["max_ms"], max_ms)
+        op["bytes"] += nbytes
+
+    add("frame", 1, frame["duration_ms"], frame["duration_ms"], frame["bytes"])
+    for event in frame["events"]:
+        add(event["name"], 1, event["duration_ms"], event["duration_ms"], event["bytes"])
+    for name, total in frame["totals"].items():
+        add(name, total["count"], total["ms"], total["max_ms"], total["bytes"])
+
+
+def with_means(ops):
+    for op in ops.values():
+        op["mean_ms"] = op["ms"] / op["count"] if op["count"] else 0.0
+    return ops
+
+
+def summarize(frames):
+    """Per operation count, total, mean and max milliseconds and bytes over
+    all frames, top level spans and per-frame totals alike."""
+    ops = {}
+    for frame in frames:
+        add_frame(ops, frame)
+    return with_means(ops)
+
+
+def format_summary(ops):
+    lines = ["%-28s %8s %12s %10s %10s %10s" % ("operation", "count", "total ms", "mean ms", "max ms", "bytes")]
+    for name, op in sorted(ops.items(), key=lambda item: -item[1]["ms"]):
+        lines.append(
+            "%-28s %8d %12.1f %10.2f %10.2f %10d"
+            % (name, op["count"], op["ms"], op["mean_ms"], op["max_ms"], op["bytes"])
+        )
+    return "\n".join(lines)
+
+
+def load(path):
+    with open(path) as trace_file:
+        return [json.loads(line) for line in trace_file if line.strip()]
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        print(path)
+        print(format_summary(summarize(load(path))))
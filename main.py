@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 # -*- coding:utf-8 -*-
+import atexit
+import contextlib
 import datetime
+import functools
 import json
 import logging
 import os
@@ -15,6 +18,10 @@ from argparse import ArgumentParser
 
 from PIL import Image, ImageChops, ImageDraw, ImageFont
 
+from lib.waveshare_epd import framefile, maintenance
+from lib.waveshare_epd.tracing import Tracer
+from slideshow import MinuteFrames, Slideshow
+
 
 DESCRIPTION = "Felina's e-paper calendar, slideshow, clock, and 3-color art."
 
@@ -36,6 +43,10 @@ logging.getLogger().addHandler(fh)
 class C:
     def module_exit(self):
         logging.info("DryRunEPD exit")
+    def open_session(self):
+        logging.info("DryRunEPD session")
+    def close_session(self):
+        self.module_exit()
 class DryRunEPD:
     @property
     def width(self):
@@ -54,12 +65,6 @@ class DryRunEPD:
     def EPD(cls):
         return cls()
 
-try:
-    from lib.waveshare_epd import epd2in13b_V3
-except Exception:
-    logging.exception("Unable to load e-ink module, assuming dry-run mode.")
-    epd2in13b_V3 = DryRunEPD
-
 parser = ArgumentParser(description=DESCRIPTION)
 parser.add_argument(
     "--cycle", "--period", "-c", type=float, default=1, help="Run every X minutes"
@@ -68,7 +73,53 @@ parser.add_argument("--black-background", "-b", action="store_true")
 parser.add_argument("--dry-run", action="store_true")
 parser.add_argument("--max-iterations", "-m", type=int, default=float("inf"))
 parser.add_argument("--pictures", "-p", type=str, default="buffalo,rose")
+parser.add_argument(
+    "--no-session",
+    action="store_true",
+    help="Release SPI and GPIO after every refresh instead of keeping them open",
+)
+parser.add_argument(
+    "--power-off",
+    action="store_true",
+    help="Only power the panel off between refreshes instead of deep sleeping it, "
+    "the next refresh then skips the reset and controller set-up",
+)
+parser.add_argument(
+    "--trace",
+    type=str,
+    default=os.environ.get("EPD_TRACE"),
+    help="Append per-refresh driver timings to this JSON lines file",
+)
+parser.add_argument(
+    "--quiet-hours",
+    type=maintenance.parse_hours,
+    default="3-5",
+    help="Local hours (start-end) when the panel may run its nightly anti-burn-in "
+    "cycles, blanking it for a minute or two; 'off' never runs them",
+)
+parser.add_argument(
+    "--prebake",
+    action="store_true",
+    help="Draw the next hour of clock frames while idle and refresh right on the minute",
+)
+parser.add_argument(
+    "--snapshot-dir",
+    type=str,
+    default=os.path.join(root, "dry_run"),
+    help="With --dry-run, save what the panel would show after every refresh here",
+)
 argp = parser.parse_args()
+
+if argp.dry_run:
+    # Drive the emulated panel instead of GPIO and SPI
+    os.environ.setdefault("EPD_BACKEND", "Simulated")
+
+try:
+    from lib.waveshare_epd import epd2in13b_V3
+except Exception:
+    logging.exception("Unable to load e-ink module, assuming dry-run mode.")
+    epd2in13b_V3 = DryRunEPD
+
 black_background = argp.black_background
 max_iterations = argp.max_iterations
 target_cycle = argp.cycle
@@ -101,6 +152,15 @@ logging.info("Log file %s", LOG_FILE)
 
 TIME_FORMAT = "%H:%M:%S"
 SUB_TIME_FORMAT = "%H"
+# Rows at the top redrawn every refresh: clocks, ping and calendar
+STATUS_HEIGHT = 104
+# The big clock, then the three small hour clocks
+TIMEZONES = [
+    "America/Denver",
+    "America/Los_Angeles",
+    "America/New_York",
+    "Europe/Paris",
+]
 
 # Ping google's rock-solid DNS server
 PING_IP = "8.8.8.8"
@@ -113,7 +173,7 @@ SPEEDTEST_CMD_TIMEOUT_SECS = 35
 
 def handler_stop_signals(signum, frame):
     logging.critical("SHUTTING DOWN DUE TO SIGNAL %s frame=%s", signum, frame)
-    epd2in13b_V3.epdconfig.module_exit()
+    epd2in13b_V3.epdconfig.close_session()
     sys.exit()
 
 
@@ -146,6 +206,30 @@ def run(cmd, timeout):
     return process_output
 
 
+def load_frame(picture):
+    """Packed planes of a picture converted with to3color.py, or None to
+    draw it from its PNGs."""
+    path = os.path.join(rpicdir, "generated", f"{picture}.epd2in13b_V3{framefile.EXTENSION}")
+    if not os.path.exists(path):
+        return None
+    try:
+        frame = framefile.load(path)
+    except (OSError, ValueError):
+        logging.exception("Unable to load frame %s", path)
+        return None
+    if (frame.panel, frame.width, frame.height, frame.depth, len(frame.planes)) != (
+        "epd2in13b_V3",
+        epd.width,
+        epd.height,
+        1,
+        2,
+    ):
+        logging.warning("Frame %s is for %s %dx%d, not this panel", path, frame.panel, frame.width, frame.height)
+        return None
+    logging.info("Using frame %s for %s", path, picture)
+    return frame
+
+
 def get_internet_speed():
     try:
         logging.info("Running SPEEDTEST_CMD command %s", SPEEDTEST_CMD)
@@ -159,10 +243,36 @@ def get_internet_speed():
 
 
 try:
+    epd = epd2in13b_V3.EPD()
     if argp.dry_run:
-        epd = DryRunEPD.EPD()
+        if epd2in13b_V3 is not DryRunEPD:
+            from lib.waveshare_epd.emulator import Emulator
+
+            epd2in13b_V3.epdconfig.use(Emulator.for_epd(epd, snapshot_dir=argp.snapshot_dir))
+            logging.info("Saving emulated panel snapshots to %s", argp.snapshot_dir)
     else:
-        epd = epd2in13b_V3.EPD()
+        # Per-panel SPI speed/bus overrides, see spi_tune.py
+        epd2in13b_V3.epdconfig.configure(panel="epd2in13b_V3")
+        if not argp.no_session:
+            # Keep SPI and GPIO set up between refreshes, init()/sleep() then
+            # only reset and deep sleep the panel itself
+            epd2in13b_V3.epdconfig.open_session()
+
+    tracer = None
+    if argp.trace and epd2in13b_V3 is not DryRunEPD:
+        logging.info("Tracing driver timings to %s", argp.trace)
+        tracer = Tracer(argp.trace)
+        tracer.instrument(epd, epd2in13b_V3.epdconfig)
+
+    burn_in = None
+    if argp.quiet_hours and epd2in13b_V3 is not DryRunEPD:
+        # Refresh counts only persist for the real panel
+        burn_in = maintenance.Maintenance(
+            epd, planes=2, quiet_hours=argp.quiet_hours, state_file=None if argp.dry_run else maintenance.STATE_FILE
+        )
+        # Keep the refreshes counted since the last write; the stop signals
+        # exit through sys.exit(), which runs it too
+        atexit.register(burn_in.flush)
 
     # Drawing on the image
     logging.info("Loading files")
@@ -190,77 +300,21 @@ try:
     except Exception:
         logging.warning("Unable to find dumb robot from union-buster-inc")
         robot_red, robot_black = None, None
+    # Pictures converted with to3color.py --align bottom go straight to the
+    # panel
+    frames = {picture: load_frame(picture) for picture in pictures}
 
-    # Drawing on the Vertical image
-    refresh_time = 15
-    iteration = 0
-    internet_speed = ""
-    while iteration < max_iterations:
-        picture = pictures[iteration % len(pictures)]
-
-        msgs = [
-            (
-                datetime.datetime.now(tz=zoneinfo.ZoneInfo(tz))
-                + datetime.timedelta(seconds=refresh_time)
-            )
-            for tz in [
-                "America/Denver",
-                "America/Los_Angeles",
-                "America/New_York",
-                "Europe/Paris",
-            ]
-        ]
-
-        logging.info("Running PING command %s", PING_CMD)
-        ping_output = run(PING_CMD, PING_CMD_TIMEOUT_SECS)
-
-        packet_loss = re.match(".*, (.*% packet loss)", ping_output, re.DOTALL)
-        if packet_loss is not None and len(packet_loss.groups()):
-            packet_loss = packet_loss.groups()[0]
-        else:
-            packet_loss = "naurrr"
-
-        ping = re.match(".*mdev = (.*)ms", ping_output, re.DOTALL)
-        if ping is not None and len(ping.groups()):
-            ping = ping.groups()[0]
-            ping = re.sub("\\.\\d+", "", ping, count=4).strip() + " ms"
-        else:
-            ping = ""
-
-        # Don't run this too often
-        if iteration % 5 == 1:
-            new_internet_speed = get_internet_speed()
-            if new_internet_speed != "":
-                internet_speed = new_internet_speed
-
-        jpath = os.path.join(root, "./upcoming.json")
-        logging.info("Running CALENDAR command %s", PING_CMD)
-        upcoming_output = run(
-            [os.path.join(root, "./upcoming_ical_events.py"), "--output-file", jpath],
-            60,
-        )
-        upcoming_event = {"summary": "", "delta": ""}
-        if os.path.exists(jpath):
-            with open(jpath) as upcoming_file:
-                upcoming_event = json.load(upcoming_file)
-
-        logging.info(
-            "Drawing the current time=%s + refresh time=%s, packet_loss=%s, ping=%s, internet_speed=%s, upcoming event=%s",
-            datetime.datetime.now(),
-            refresh_time,
-            packet_loss,
-            ping,
-            internet_speed,
-            upcoming_event,
-        )
-        drawing_start_time = time.time()
+    def compose_picture(picture):
+        """The picture's black and red planes, without the status text."""
+        frame = frames[picture]
+        if frame is not None:
+            return frame.planes
 
         LBlackimage = Image.new("1", (epd.width, epd.height), 255)  # 126*298
         LRYimage = Image.new("1", (epd.width, epd.height), 255)  # 126*298
         drawblack = ImageDraw.Draw(LBlackimage)
         drawry = ImageDraw.Draw(LRYimage)
 
-        logging.info("Drawing %s", picture)
         if picture == "rose":
             if black_background:
                 rose = entire_rose.convert("1")
@@ -278,7 +332,19 @@ try:
             y = epd.height - robot_black.height
             drawblack.bitmap((0, y), robot_black)
             drawry.bitmap((0, y), robot_red)
-
+        return LBlackimage, LRYimage
+
+    # Upcoming pictures are composed and packed in the background, only the
+    # status text at the top is drawn at refresh time
+    slideshow = Slideshow(epd.width, epd.height, STATUS_HEIGHT, compose_picture, pictures)
+    slideshow.start()
+    minute_frames = MinuteFrames(slideshow)
+
+    def draw_status(status, when, drawblack, drawry):
+        """Clocks at `when` and the (packet loss, event summary, event delta,
+        internet speed) status text."""
+        packet_loss, summary, delta, internet_speed = status
+        msgs = [when.astimezone(zoneinfo.ZoneInfo(tz)) for tz in TIMEZONES]
         # greeting = "howdy!"
         # drawblack.text((2, 0), greeting, font=font16, fill=0)
         # greeting_w = 104 // 2 + 5
@@ -300,29 +366,120 @@ try:
             )
 
         info_y = 60
-        drawblack.text((0, info_y), f"{packet_loss}", font=font12, fill=0)
+        drawblack.text((0, info_y), packet_loss, font=font12, fill=0)
         drawblack.text(
             (0, info_y + 12),
-            f"{upcoming_event['summary']}",
+            summary,
             font=font10,
             fill=0,
         )
         drawblack.text(
             (0, info_y + 22),
-            f"{upcoming_event['delta']}",
+            delta,
             font=font10,
             fill=0,
         )
         drawblack.text(
-            (0, info_y + 2 + 10 * 3), f"{internet_speed}", font=font10, fill=0
+            (0, info_y + 2 + 10 * 3), internet_speed, font=font10, fill=0
         )
 
-        logging.info("Initializing screen and sending drawing")
-        epd.init()
-        epd.display(epd.getbuffer(LBlackimage), epd.getbuffer(LRYimage))
+    # Drawing on the Vertical image
+    refresh_time = 15
+    iteration = 0
+    internet_speed = ""
+    while iteration < max_iterations:
+        logging.info("Running PING command %s", PING_CMD)
+        ping_output = run(PING_CMD, PING_CMD_TIMEOUT_SECS)
+
+        packet_loss = re.match(".*, (.*% packet loss)", ping_output, re.DOTALL)
+        if packet_loss is not None and len(packet_loss.groups()):
+            packet_loss = packet_loss.groups()[0]
+        else:
+            packet_loss = "naurrr"
+
+        ping = re.match(".*mdev = (.*)ms", ping_output, re.DOTALL)
+        if ping is not None and len(ping.groups()):
+            ping = ping.groups()[0]
+            ping = re.sub("\\.\\d+", "", ping, count=4).strip() + " ms"
+        else:
+            ping = ""
 
-        logging.info("Putting screen to low power mode")
-        epd.sleep()
+        # Don't run this too often
+        if iteration % 5 == 1:
+            new_internet_speed = get_internet_speed()
+            if new_internet_speed != "":
+                internet_speed = new_internet_speed
+
+        jpath = os.path.join(root, "./upcoming.json")
+        logging.info("Running CALENDAR command %s", PING_CMD)
+        upcoming_output = run(
+            [os.path.join(root, "./upcoming_ical_events.py"), "--output-file", jpath],
+            60,
+        )
+        upcoming_event = {"summary": "", "delta": ""}
+        if os.path.exists(jpath):
+            with open(jpath) as upcoming_file:
+                upcoming_event = json.load(upcoming_file)
+
+        logging.info(
+            "Drawing the current time=%s + refresh time=%s, packet_loss=%s, ping=%s, internet_speed=%s, upcoming event=%s",
+            datetime.datetime.now(),
+            refresh_time,
+            packet_loss,
+            ping,
+            internet_speed,
+            upcoming_event,
+        )
+        status = (
+            f"{packet_loss}",
+            f"{upcoming_event['summary']}",
+            f"{upcoming_event['delta']}",
+            f"{internet_speed}",
+        )
+        if argp.prebake:
+            # Frames for the coming minutes are drawn while the panel idles,
+            # the refresh then starts right on the next minute
+            when = (datetime.datetime.now().astimezone() + datetime.timedelta(minutes=1)).replace(
+                second=0, microsecond=0
+            )
+            minute_frames.bake(functools.partial(draw_status, status), status, when)
+            logging.info("Waiting for %s", when)
+            time.sleep(max(0, when.timestamp() - time.time()))
+            drawing_start_time = time.time()
+            status_planes = minute_frames.get(when, status)
+            if status_planes is None:
+                logging.warning("No frame baked for %s, drawing it now", when)
+                status_planes = slideshow.render(draw_status, status, when)
+            logging.info("Sending the %s frame %.1f ms after the minute", when, (time.time() - when.timestamp()) * 1000)
+        else:
+            drawing_start_time = time.time()
+            when = datetime.datetime.now().astimezone() + datetime.timedelta(seconds=refresh_time)
+            status_planes = slideshow.render(draw_status, status, when)
+
+        picture, (black, red) = slideshow.next_frame(status_planes)
+        logging.info("Drawing %s", picture)
+
+        if burn_in is not None and burn_in.due():
+            with tracer.frame("maintenance") if tracer else contextlib.nullcontext():
+                logging.info("Running the anti-burn-in cycles, then redrawing %s", picture)
+                epd.init()
+                burn_in.run()
+
+        with tracer.frame(picture) if tracer else contextlib.nullcontext():
+            logging.info("Initializing screen and sending drawing")
+            epd.init()
+            epd.display(black, red)
+            if burn_in is not None:
+                burn_in.record_refresh()
+
+            if argp.power_off:
+                logging.info("Powering screen off")
+                epd.power_off()
+            else:
+                logging.info("Putting screen to low power mode")
+                epd.sleep()
+        if tracer:
+            logging.info("Driver timings so far:\n%s", tracer.format_summary())
 
         refresh_time = time.time() - drawing_start_time
         iteration += 1
@@ -334,11 +491,17 @@ try:
             time.sleep(sleep_time)
 
     logging.info("Done")
+    if argp.power_off:
+        epd.sleep()
+    epd2in13b_V3.epdconfig.close_session()
 
 except IOError as e:
     logging.exception("Unexpected error detected!")
-    epd2in13b_V3.epdconfig.module_exit()
+    epd2in13b_V3.epdconfig.close_session()
 
 except KeyboardInterrupt:
     logging.critical("Shutting down. Bye!")
-    epd2in13b_V3.epdconfig.module_exit()
+    if argp.power_off:
+        # Do not leave the controller powered for good
+        epd.sleep()
+    epd2in13b_V3.epdconfig.close_session()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""Drive several e-paper panels from one process.
+
+Every panel gets its own epdconfig backend (pins, SPI device, lock) and its
+own thread, so while one panel waits out its refresh the others send their
+frames, and N panels take about as long as the slowest one instead of N
+times as long. Panels on the same SPI bus take turns through
+lib/waveshare_epd/bus.py, one command and its data at a time. Panels show
+the frame files to3color.py made for them, one after the other. The panels
+are listed in a JSON file:
+
+    [
+      {"driver": "epd2in13b_V3", "frames": "roguh_pics/generated", "cycle": 5},
+      {
+        "name": "kitchen",
+        "driver": "epd7in5_V2",
+        "pins": {"CS_PIN": 7, "RST_PIN": 5, "DC_PIN": 6, "BUSY_PIN": 13},
+        "spi": {"device": 1},
+        "frames": "kitchen_pics/generated",
+        "cycle": 10
+      }
+    ]
+
+"cycle" is in minutes, "pins" and "spi" default to the usual HAT wiring
+and SPI settings. "mode" picks a refresh mode the driver has (see
+lib/waveshare_epd/modes.py), e.g. "fast" on the 3.52", default "full".
+
+    ./multi_panel.py panels.json
+    ./multi_panel.py --dry-run --max-refreshes 2 panels.json
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from argparse import ArgumentParser
+from typing import Any, Dict, List, Optional
+
+from lib.waveshare_epd import framefile, modes
+
+FORMAT = "[%(levelname)s] %(threadName)s %(module)s:%(funcName)s %(asctime)s: %(message)s"
+
+
+class PanelWorker(threading.Thread):
+    def __init__(
+        self,
+        config: Dict[str, Any],
+        stopped: threading.Event,
+        dry_run: bool = False,
+        snapshot_dir: Optional[str] = None,
+        max_refreshes: Optional[int] = None,
+    ):
+        self.driver_name = config["driver"]
+        super().__init__(name=config.get("name", self.driver_name), daemon=True)
+        self.config = config
+        self.stopped = stopped
+        self.dry_run = dry_run
+        self.snapshot_dir = snapshot_dir
+        self.max_refreshes = max_refreshes
+        self.refreshes = 0
+        self.refresh_seconds = 0.0
+
+    def open(self) -> None:
+        from lib.waveshare_epd import bus, epdconfig, panels
+
+        pins = self.config.get("pins", {})
+        board = "Simulated" if self.dry_run else None
+        self.backend = epdconfig.create(board, self.driver_name, pins, **self.config.get("spi", {}))
+        driver = panels.load_driver(self.driver_name, self.backend)
+        self.epd = driver.EPD()
+        if self.dry_run:
+            from lib.waveshare_epd.emulator import Emulator
+
+            snapshot_dir = os.path.join(self.snapshot_dir, self.name)
+            self.backend = epdconfig.set_pins(Emulator.for_epd(self.epd, snapshot_dir=snapshot_dir), pins)
+            driver.epdconfig = self.backend
+        # Panels on one SPI bus take turns, one command and its data at a time
+        self.bus = bus.for_backend(self.backend)
+        self.bus.attach(self.epd, self.backend)
+        self.backend.open_session()
+
+    def frames(self) -> List[str]:
+        pattern = f"*.{self.driver_name}{framefile.EXTENSION}"
+        return sorted(glob.glob(os.path.join(self.config["frames"], pattern)))
+
+    def show(self, path: str) -> None:
+        frame = framefile.load(path)
+        if frame.panel != self.driver_name:
+            logging.warning("%s is for %s, not %s", path, frame.panel, self.driver_name)
+            return
+        start = time.perf_counter()
+        with self.backend.lock:
+            self.epd.init()
+            modes.display(self.epd, *frame.planes, mode=self.config.get("mode", modes.FULL))
+            self.epd.sleep()
+        seconds = time.perf_counter() - start
+        self.refreshes += 1
+        self.refresh_seconds += seconds
+        logging.info("Showed %s in %.1f s", path, seconds)
+
+    def run(self) -> None:
+        try:
+            self.open()
+        except Exception:
+            logging.exception("Unable to open %s", self.name)
+            return
+        cycle = self.config.get("cycle", 1) * 60
+        index = 0
+        try:
+            while not self.stopped.is_set():
+                frames = self.frames()
+                if not frames:
+                    logging.warning("No %s frames in %s", self.driver_name, self.config["frames"])
+                    if self.dry_run:
+                        # Nothing will add frames to a dry run
+                        break
+                else:
+                    try:
+                        self.show(frames[index % len(frames)])
+                    except Exception:
+                        logging.exception("Unable to show %s", frames[index % len(frames)])
+                # Attempts without frames count too
+                index += 1
+                if self.max_refreshes is not None and index >= self.max_refreshes:
+                    break
+                self.stopped.wait(0 if self.dry_run else cycle)
+        finally:
+            self.backend.close_session()
+
+
+def main() -> None:
+    argparser = ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument("config", help="JSON list of panels")
+    argparser.add_argument("--dry-run", action="store_true", help="Drive emulated panels")
+    argparser.add_argument(
+        "--snapshot-dir", default="dry_run", help="With --dry-run, save what each panel shows here"
+    )
+    argparser.add_argument("--max-refreshes", type=int, help="Stop after this many refreshes per panel")
+    argparser.add_argument("--verbose", "-v", action="store_true")
+    args = argparser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format=FORMAT)
+    if args.dry_run:
+        os.environ.setdefault("EPD_BACKEND", "Simulated")
+    with open(args.config) as config_file:
+        configs = json.load(config_file)
+
+    stopped = threading.Event()
+    workers = [
+        PanelWorker(config, stopped, args.dry_run, args.snapshot_dir, args.max_refreshes) for config in configs
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            while worker.is_alive():
+                worker.join(1)
+    except KeyboardInterrupt:
+        logging.critical("Shutting down. Bye!")
+        stopped.set()
+        for worker in workers:
+            worker.join()
+
+    for worker in workers:
+        logging.info(
+            "%s: %d refreshes, %.1f s refreshing", worker.name, worker.refreshes, worker.refresh_seconds
+        )
+    for shared in {id(worker.bus): worker.bus for worker in workers if hasattr(worker, "bus")}.values():
+        logging.info(shared.format_stats())
+    logging.info("%.1f s in total", time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
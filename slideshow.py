@@ -0,0 +1,168 @@
+"""Slideshow frames composed ahead of time.
+
+Every frame is a picture, which only changes when the slideshow moves on,
+under a status region at the top (clock, ping, next event) that changes
+every refresh. A worker thread composes and packs the pictures of the next
+frames into a small ring of ready buffers, so at refresh time only the
+status region is drawn and packed, then merged over a copy of the picture:
+
+    show = Slideshow(epd.width, epd.height, STATUS_HEIGHT, compose, ["rose", "buffalo"])
+    show.start()
+    picture, (black, red) = show.next_frame(show.render(draw_status))
+    epd.display(black, red)
+
+For a clock, MinuteFrames goes one step further and packs the status
+regions of the coming minutes while the panel idles, so at the minute only
+the merge is left.
+
+compose(picture) returns the picture's planes, black first, either as
+images of the whole panel or already packed, e.g. the planes of a frame
+file. Buffers are packed like the 1 bit drivers' getbuffer() of a portrait
+image: rows of whole bytes, leftmost pixel in the top bit, 0 for ink.
+"""
+import datetime
+import logging
+import queue
+import threading
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple, Union
+
+from PIL import Image, ImageDraw
+
+from lib.waveshare_epd import framefile
+
+Plane = Union[Image.Image, bytes, bytearray, memoryview]
+
+
+def pack(image: Image.Image) -> bytes:
+    return image.convert("1").tobytes()
+
+
+class Slideshow:
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        status_height: int,
+        compose: Callable[[str], Sequence[Plane]],
+        pictures: List[str],
+        ahead: int = 2,
+        planes: int = 2,
+    ):
+        self.width = width
+        self.height = height
+        self.status_height = status_height
+        self.compose = compose
+        self.pictures = pictures
+        self.planes = planes
+        self.ring: "queue.Queue[Tuple[str, Tuple[bytes, ...]]]" = queue.Queue(maxsize=ahead)
+        self.stopped = threading.Event()
+        self.worker = threading.Thread(target=self.run, name="slideshow", daemon=True)
+        self.blank = pack(Image.new("1", (width, height), 255))
+
+    def start(self) -> None:
+        self.worker.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def prepare(self, picture: str) -> Tuple[bytes, ...]:
+        """Packed planes of the picture alone."""
+        try:
+            planes = tuple(pack(plane) if isinstance(plane, Image.Image) else plane for plane in self.compose(picture))
+        except Exception:
+            logging.exception("Unable to compose %s, showing it blank", picture)
+            planes = ()
+        for plane in planes:
+            if len(plane) != len(self.blank):
+                logging.warning("%s has a %d byte plane, expected %d", picture, len(plane), len(self.blank))
+                planes = ()
+                break
+        return planes + (self.blank,) * (self.planes - len(planes))
+
+    def run(self) -> None:
+        iteration = 0
+        while not self.stopped.is_set():
+            picture = self.pictures[iteration % len(self.pictures)]
+            prepared = (picture, self.prepare(picture))
+            logging.debug("Composed %s ahead", picture)
+            # Blocks while the ring is full
+            while not self.stopped.is_set():
+                try:
+                    self.ring.put(prepared, timeout=1)
+                    break
+                except queue.Full:
+                    pass
+            iteration += 1
+
+    def render(self, draw: Callable[..., None], *args) -> Tuple[bytes, ...]:
+        """Packed planes of the status region drawn by draw(*args, *ImageDraw)."""
+        status = [Image.new("1", (self.width, self.status_height), 255) for _ in range(self.planes)]
+        draw(*args, *(ImageDraw.Draw(image) for image in status))
+        return tuple(pack(image) for image in status)
+
+    def next_frame(self, status: Sequence[bytes]) -> Tuple[str, Tuple[bytearray, ...]]:
+        """The next picture and its planes, with the packed status region on top."""
+        picture, planes = self.ring.get()
+        frame = []
+        for plane, region in zip(planes, status):
+            buf = bytearray(plane)
+            buf[: len(region)] = framefile.merge(buf[: len(region)], region)
+            frame.append(buf)
+        return picture, tuple(frame)
+
+
+class MinuteFrames:
+    """Packed status regions of the coming minutes, keyed by minute.
+
+    bake() renders the next `minutes` minutes in a background thread with
+    draw(minute, *ImageDraw), for the status `key` it shows besides the
+    time. A later bake() for another key starts over, one for the same key
+    only adds the minutes not baked yet. Planes equal across minutes, such
+    as the hours of the other timezones, are stored once.
+    """
+
+    def __init__(self, slideshow: Slideshow, minutes: int = 60):
+        self.slideshow = slideshow
+        self.minutes = minutes
+        self.frames: Dict[datetime.datetime, Tuple[Hashable, Tuple[bytes, ...]]] = {}
+        self.lock = threading.Lock()
+        self.generation = 0
+
+    def bake(self, draw: Callable[..., None], key: Hashable, start: datetime.datetime) -> None:
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+            for minute in [minute for minute in self.frames if minute < start]:
+                del self.frames[minute]
+        worker = threading.Thread(
+            target=self.run, args=(draw, key, start, generation), name="minute-frames", daemon=True
+        )
+        worker.start()
+
+    def run(self, draw: Callable[..., None], key: Hashable, start: datetime.datetime, generation: int) -> None:
+        shared: Dict[bytes, bytes] = {}
+        baked = 0
+        for i in range(self.minutes):
+            minute = start + datetime.timedelta(minutes=i)
+            with self.lock:
+                if generation != self.generation:
+                    logging.debug("Minute frames for %s superseded after %d", key, baked)
+                    return
+                if self.frames.get(minute, (None,))[0] == key:
+                    continue
+            planes = tuple(shared.setdefault(plane, plane) for plane in self.slideshow.render(draw, minute))
+            with self.lock:
+                # A newer bake() may have stored this minute while rendering
+                if generation != self.generation:
+                    logging.debug("Minute frames for %s superseded after %d", key, baked)
+                    return
+                self.frames[minute] = (key, planes)
+            baked += 1
+        logging.debug("Baked %d minute frames from %s", baked, start)
+
+    def get(self, minute: datetime.datetime, key: Hashable) -> Optional[Tuple[bytes, ...]]:
+        with self.lock:
+            baked = self.frames.get(minute)
+        if baked is None or baked[0] != key:
+            return None
+        return baked[1]
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""Try SPI clock speeds on a real panel and time the transfers.
+
+Each speed writes a few test patterns to the panel and refreshes it, so check
+the panel while this runs: a garbled pattern means the speed is too high for
+your wiring. Put the fastest clean speed in the SPI config file, e.g.
+~/.config/waveshare_epd/spi.json:
+
+    {"epd2in13b_V3": {"speed_hz": 16000000}}
+"""
+import importlib
+import inspect
+import json
+import logging
+import time
+from argparse import ArgumentParser
+from typing import Callable, Dict, List
+
+from PIL import Image, ImageDraw
+
+from lib.waveshare_epd import epdconfig
+
+DEFAULT_SPEEDS = "4000000,8000000,10000000,16000000,20000000"
+
+
+def pattern_images(width: int, height: int) -> Dict[str, Image.Image]:
+    checker = Image.new("1", (width, height), 255)
+    draw = ImageDraw.Draw(checker)
+    for y in range(0, height, 8):
+        for x in range((y // 8) % 2 * 8, width, 16):
+            draw.rectangle((x, y, x + 7, y + 7), fill=0)
+
+    stripes = Image.new("1", (width, height), 255)
+    draw = ImageDraw.Draw(stripes)
+    for y in range(0, height, 4):
+        draw.line((0, y, width, y), fill=0)
+
+    return {
+        "checkerboard": checker,
+        "stripes": stripes,
+        "black": Image.new("1", (width, height), 0),
+    }
+
+
+class TransferTimer:
+    """Wraps the epdconfig SPI writes to count bytes and time spent."""
+
+    def __init__(self) -> None:
+        self.bytes = 0
+        self.seconds = 0.0
+        self.originals: Dict[str, Callable] = {}
+
+    def wrap(self, name: str) -> None:
+        original = getattr(epdconfig, name)
+        self.originals[name] = original
+
+        def timed(data):
+            start = time.perf_counter()
+            original(data)
+            self.seconds += time.perf_counter() - start
+            self.bytes += len(data)
+
+        setattr(epdconfig, name, timed)
+
+    def __enter__(self) -> "TransferTimer":
+        self.wrap("spi_writebyte")
+        self.wrap("spi_writebyte2")
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for name, original in self.originals.items():
+            setattr(epdconfig, name, original)
+
+
+def tune(panel: str, speeds: List[int], chunk_bytes: int) -> List[dict]:
+    module = importlib.import_module(f"lib.waveshare_epd.{panel}")
+    epd = module.EPD()
+    planes = len(inspect.signature(epd.display).parameters)
+    images = pattern_images(epd.width, epd.height)
+
+    results = []
+    for speed in speeds:
+        epdconfig.configure(panel, speed_hz=speed, chunk_bytes=chunk_bytes)
+        for name, image in images.items():
+            logging.info("Writing %s at %s Hz", name, speed)
+            buf = epd.getbuffer(image)
+            white = epd.getbuffer(Image.new("1", image.size, 255))
+            epd.init()
+            with TransferTimer() as timer:
+                start = time.perf_counter()
+                epd.display(buf, *[white] * (planes - 1))
+                total = time.perf_counter() - start
+            epd.sleep()
+            results.append(
+                {
+                    "panel": panel,
+                    "speed_hz": speed,
+                    "pattern": name,
+                    "bytes": timer.bytes,
+                    "spi_secs": round(timer.seconds, 4),
+                    "bytes_per_sec": round(timer.bytes / timer.seconds)
+                    if timer.seconds
+                    else None,
+                    "refresh_secs": round(total - timer.seconds, 3),
+                }
+            )
+            logging.info("%s", results[-1])
+    return results
+
+
+def main() -> None:
+    argparser = ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument("--panel", default="epd2in13b_V3")
+    argparser.add_argument(
+        "--speeds",
+        default=DEFAULT_SPEEDS,
+        help=f"Comma separated SPI clock speeds in Hz (default {DEFAULT_SPEEDS})",
+    )
+    argparser.add_argument("--chunk-bytes", type=int, default=None)
+    argparser.add_argument("--output-file", help="Write results as JSON lines")
+    args = argparser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    speeds = [int(speed, 0) for speed in args.speeds.split(",")]
+    try:
+        results = tune(args.panel, speeds, args.chunk_bytes)
+    finally:
+        epdconfig.module_exit()
+
+    if args.output_file:
+        with open(args.output_file, "w") as output_file:
+            for result in results:
+                output_file.write(json.dumps(result) + "\n")
+
+    for result in results:
+        print(
+            "{speed_hz:>10} Hz {pattern:>12}: {bytes} bytes in {spi_secs}s "
+            "({bytes_per_sec} B/s), refresh {refresh_secs}s".format(**result)
+        )
+
+
+if __name__ == "__main__":
+    main()
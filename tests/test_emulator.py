@@ -0,0 +1,76 @@
+import os
+import sys
+
+from PIL import Image, ImageChops, ImageDraw
+
+os.environ.setdefault("EPD_BACKEND", "Simulated")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "lib"))
+
+from waveshare_epd import epd2in9d, epd2in13b_V3, epd4in2, epdconfig  # noqa: E402
+from waveshare_epd.emulator import Emulator  # noqa: E402
+
+
+def gray_stripes(width, height):
+    image = Image.new("L", (width, height), 0xFF)
+    draw = ImageDraw.Draw(image)
+    for i, level in enumerate((0x00, 0x80, 0xC0, 0xFF)):
+        draw.rectangle((i * width // 4, 0, (i + 1) * width // 4 - 1, height - 1), fill=level)
+    return image
+
+
+def test_4gray_refresh_renders_gray_levels():
+    epd = epd4in2.EPD()
+    emulator = epdconfig.use(Emulator.for_epd(epd))
+    epd.display(epd.getbuffer_4Gray(gray_stripes(epd.width, epd.height)), mode="gray")
+
+    image = emulator.image.convert("L")
+    stripe = epd.width // 4
+    assert [image.getpixel((i * stripe + stripe // 2, 10)) for i in range(4)] == [0, 85, 170, 255]
+
+    # A full refresh loads the b/w LUTs again
+    epd.display(epd.getbuffer(Image.new("1", (epd.width, epd.height), 0)))
+    assert not emulator.gray
+    assert emulator.image.convert("L").getextrema() == (0, 0)
+
+
+def test_display_after_sleep_initialises_again():
+    epd = epd4in2.EPD()
+    emulator = epdconfig.use(Emulator.for_epd(epd, record=True))
+    blank = epd.getbuffer(Image.new("1", (epd.width, epd.height), 0xFF))
+    epd.display(blank)
+    epd.sleep()
+    assert epd.refresh_mode is None
+
+    emulator.reset_stats()
+    epd.display(blank)
+    commands = [command for command, _ in emulator.transactions]
+    assert 0x04 in commands and commands.index(0x04) < commands.index(0x12)  # power on before the refresh
+    assert epd.refresh_mode == "full"
+
+
+def test_sleep_sends_nothing_without_init():
+    epd = epd2in13b_V3.EPD()
+    emulator = epdconfig.use(Emulator.for_epd(epd, record=True))
+    epd.sleep()
+    assert emulator.transactions == []
+
+    epd.init()
+    epd.sleep()
+    emulator.reset_stats()
+    epd.sleep()
+    assert emulator.transactions == []
+
+
+def test_2in9d_partial_refresh_matches_the_image():
+    epd = epd2in9d.EPD()
+    emulator = epdconfig.use(Emulator.for_epd(epd))
+    epd.init()
+    image = Image.new("1", (epd.width, epd.height), 0xFF)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((5, 5, 60, 90), fill=0)
+    epd.display(epd.getbuffer(image))
+    draw.rectangle((10, 150, 40, 170), fill=0)
+    epd.DisplayPartial(epd.getbuffer(image))
+
+    assert emulator.partial
+    assert ImageChops.difference(emulator.image.convert("L"), image.convert("L")).getbbox() is None
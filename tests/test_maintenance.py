@@ -0,0 +1,46 @@
+import datetime
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "lib"))
+
+from waveshare_epd import maintenance  # noqa: E402
+
+
+class Panel:
+    width = 104
+    height = 212
+
+
+def test_parse_hours_rejects_an_empty_window():
+    assert maintenance.parse_hours("23-5") == (23, 5)
+    assert maintenance.parse_hours("off") is None
+    with pytest.raises(ValueError):
+        maintenance.parse_hours("3-3")
+
+
+def saved_counts(burn_in):
+    with open(burn_in.state_file) as state:
+        return json.load(state)[burn_in.panel]
+
+
+def test_record_refresh_writes_on_schedule_changes_and_flush(tmp_path):
+    burn_in = maintenance.Maintenance(Panel(), state_file=str(tmp_path / "maintenance.json"))
+    burn_in.record_refresh()
+    os.utime(burn_in.state_file, ns=(0, 0))
+    for _ in range(5):
+        burn_in.record_refresh()
+    assert os.stat(burn_in.state_file).st_mtime_ns == 0
+    assert saved_counts(burn_in)["since_maintenance"] == 1
+    # A restart still knows the cycles are due
+    restarted = maintenance.Maintenance(Panel(), state_file=burn_in.state_file)
+    assert restarted.due(datetime.datetime(2026, 1, 1, 4))
+
+    burn_in.flush()
+    assert saved_counts(burn_in)["refreshes"] == 6
+    for _ in range(maintenance.SAVE_EVERY):
+        burn_in.record_refresh()
+    assert saved_counts(burn_in)["refreshes"] == 6 + maintenance.SAVE_EVERY
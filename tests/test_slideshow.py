@@ -0,0 +1,46 @@
+import datetime
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from slideshow import MinuteFrames  # noqa: E402
+
+
+class StubSlideshow:
+    """Renders draw's name; the first render of "old" waits for `release`."""
+
+    def __init__(self):
+        self.rendering = threading.Event()
+        self.release = threading.Event()
+
+    def render(self, draw, minute):
+        if draw == "old" and not self.rendering.is_set():
+            self.rendering.set()
+            self.release.wait(5)
+        return (draw.encode(),)
+
+
+def join_workers():
+    for worker in threading.enumerate():
+        if worker.name == "minute-frames":
+            worker.join(5)
+
+
+def test_superseded_bake_keeps_the_newer_frames():
+    slideshow = StubSlideshow()
+    frames = MinuteFrames(slideshow, minutes=3)
+    start = datetime.datetime(2026, 1, 1, 12, 0)
+
+    frames.bake("old", "old", start)
+    assert slideshow.rendering.wait(5)
+    frames.bake("new", "new", start)
+    while frames.get(start + datetime.timedelta(minutes=2), "new") is None:
+        time.sleep(0.01)
+    slideshow.release.set()
+    join_workers()
+
+    assert frames.get(start, "new") == (b"new",)
+    assert frames.get(start, "old") is None
@@ -0,0 +1,22 @@
+import os
+import sys
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import to3color  # noqa: E402
+
+
+def test_second_batch_converts_nothing(tmp_path):
+    picture = tmp_path / "pictures" / "rose.png"
+    picture.parent.mkdir()
+    Image.new("RGB", (64, 48), (200, 30, 30)).save(picture)
+    panel = to3color.panel_descriptor()
+    output_dir = str(tmp_path / "generated")
+
+    first = to3color.convert_batch([str(picture)], panel, output_dir, jobs=1)
+    second = to3color.convert_batch([str(picture)], panel, output_dir, jobs=1)
+
+    assert first["converted"] == 1
+    assert second == {"converted": 0, "skipped": 1, "failed": 0}
@@ -1,17 +1,99 @@
 #!/usr/bin/env python3
+"""Convert pictures to black and red planes for 3 colour e-paper.
+
+    ./to3color.py roguh_pics/test.png
+    ./to3color.py --panel epd4in2b_V2 --rotation 90 --jobs 4 ~/slideshow/
+
+Every picture is read once, downsampled once to fit the target panel, and
+split into the panel's colour planes by hue: saturated reds (or yellows)
+go to the colour plane, dark pixels to the black one. --dither uses one of
+the lib/waveshare_epd/dither.py engines instead. One pass writes
+
+  NAME.resizedW.png            the downsampled picture
+  NAME.black.png, NAME.red.png plane masks at picture size, ink set
+  NAME.PANEL.preview.png       the full panel frame in the panel's colours
+  NAME.PANEL.epdf              the frame packed like the driver's getbuffer,
+                               see lib/waveshare_epd/framefile.py
+
+Directories are walked recursively and their layout is kept under the output
+directory. Pictures whose outputs are newer than the picture, or whose
+content hashes the same as on the last run with the same settings, are
+skipped, so re-running over a whole slideshow only converts what changed.
+"""
+import functools
+import hashlib
+import importlib
+import json
+import logging
 import os
-import sys
-from typing import Optional
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+# Only the panel sizes are needed from the drivers, not the hardware
+os.environ.setdefault("EPD_BACKEND", "Simulated")
+
+import numpy as np  # noqa: E402
+from PIL import Image, ImageEnhance, ImageFilter  # noqa: E402
 
-from PIL import Image, ImageEnhance, ImageFilter,ImageChops
+from lib.waveshare_epd import dither as dithering  # noqa: E402
+from lib.waveshare_epd import framefile  # noqa: E402
+from lib.waveshare_epd.emulator import PANELS  # noqa: E402
 
 GENERATED_DIRECTORY = "./roguh_pics/generated/"
 
-# 104px is the width of my 2.13 inch e-paper
-DEFAULT_NEW_WIDTH = 104
+# My 2.13 inch e-paper
+DEFAULT_PANEL = "epd2in13b_V3"
+
+# Colour planes besides white, by the panel colours of emulator.PANELS
+PLANES = {"bw": ("black",), "bwr": ("black", "red"), "bwy": ("black", "yellow")}
+
+# Hue ranges of each colour plane on PIL's 0-255 HSV scale, red is +-30
+# degrees and yellow 40 to 75 degrees
+HUES = {"red": ((0, 21), (234, 255)), "yellow": ((28, 53),)}
+# How saturated and bright a pixel must be to be printed in colour
+MIN_SATURATION = 90
+MIN_VALUE = 64
+# Luminance up to which the remaining pixels are black
+DARK = 128
+
+ROTATIONS = (0, 90, 180, 270)
+# Where pictures smaller than the frame go, top to bottom
+ALIGNMENTS = ("top", "centre", "bottom")
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+# Per output directory record of what was converted from what
+MANIFEST_FILE = ".to3color.json"
+
+
+class Panel(NamedTuple):
+    """Target panel: native size, colour planes and how frames are turned.
 
-BLACK = 25
-WHITE = 255 - BLACK
+    rotation turns the frame counterclockwise into the native orientation,
+    90 is a landscape frame as the drivers' getbuffer rotates one."""
+
+    name: str
+    width: int
+    height: int
+    planes: Tuple[str, ...]
+    rotation: int = 0
+
+    @property
+    def frame_size(self) -> Tuple[int, int]:
+        if self.rotation in (90, 270):
+            return self.height, self.width
+        return self.width, self.height
+
+
+@functools.lru_cache(maxsize=None)
+def panel_descriptor(name: str = DEFAULT_PANEL, rotation: int = 0) -> Panel:
+    if rotation not in ROTATIONS:
+        raise ValueError(f"Rotation must be one of {ROTATIONS}, not {rotation}")
+    colours = PANELS.get(name, (None, "bw"))[1]
+    if colours not in PLANES:
+        raise ValueError(f"{name} is not a black and white, red or yellow panel")
+    module = importlib.import_module(f"lib.waveshare_epd.{name}")
+    return Panel(name, module.EPD_WIDTH, module.EPD_HEIGHT, PLANES[colours], rotation)
 
 
 def enhance(input_img: Image.Image) -> Image.Image:
@@ -22,45 +104,260 @@ def enhance(input_img: Image.Image) -> Image.Image:
     return preprocessed_img
 
 
-def save_to_2color(
-    input_img: Image.Image,
-    out_fname: str,
-    white_threshold: int = 128,
-    black_threshold: Optional[int] = None,
-) -> None:
-    def pixel_filter(pixel256: int) -> bool:
-        if pixel256 > white_threshold:
-            return False
-        if black_threshold is not None:
-            if pixel256 < black_threshold:
-                return False
-        return True
+@functools.lru_cache(maxsize=None)
+def threshold_table(
+    white_threshold: int, black_threshold: Optional[int] = None
+) -> Tuple[int, ...]:
+    """point() table setting the pixels between the thresholds."""
+    return tuple(
+        255
+        if pixel256 <= white_threshold and (black_threshold is None or pixel256 >= black_threshold)
+        else 0
+        for pixel256 in range(256)
+    )
+
+
+def fit(img: Image.Image, box: Tuple[int, float]) -> Image.Image:
+    """Downsample once, with a good filter, to fit in the box."""
+    scale = min(box[0] / img.size[0], box[1] / img.size[1])
+    size = (max(1, round(img.size[0] * scale)), max(1, round(img.size[1] * scale)))
+    # JPEGs decode straight to a fraction of their size
+    img.draft("RGB", size)
+    img = img.convert("RGB")
+    return img.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def separate(
+    img: Image.Image, planes: Tuple[str, ...], dither: Optional[str] = None
+) -> Dict[str, np.ndarray]:
+    """Ink mask of every plane, black first."""
+    if dither:
+        indices = dithering.dither(img, dither, "bw" + "".join(plane[0] for plane in planes[1:]))
+        return {plane: indices == (0 if plane == "black" else 2) for plane in planes}
+
+    hsv = np.asarray(img.convert("HSV"))
+    hue, saturation, value = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    vivid = (saturation >= MIN_SATURATION) & (value >= MIN_VALUE)
+    masks = {}
+    coloured = np.zeros(hue.shape, dtype=bool)
+    for plane in planes[1:]:
+        in_hue = np.zeros(hue.shape, dtype=bool)
+        for low, high in HUES[plane]:
+            in_hue |= (hue >= low) & (hue <= high)
+        masks[plane] = vivid & in_hue
+        coloured |= masks[plane]
+    dark = np.asarray(img.convert("L").point(threshold_table(DARK))) > 0
+    return {"black": dark & ~coloured, **masks}
+
+
+def output_files(in_fname: str, output_dir: str, panel: Panel, new_width: int) -> Dict[str, str]:
+    base_fname = os.path.join(output_dir, os.path.splitext(os.path.basename(in_fname))[0])
+    outputs = {"resized": f"{base_fname}.resized{new_width}.png"}
+    for plane in panel.planes:
+        outputs[plane] = f"{base_fname}.{plane}.png"
+    outputs["preview"] = f"{base_fname}.{panel.name}.preview.png"
+    outputs["frame"] = f"{base_fname}.{panel.name}{framefile.EXTENSION}"
+    return outputs
 
-    out_img = input_img.convert("L").point(pixel_filter, mode="1")
-    out_img.save(out_fname)
 
-    with open(out_fname.replace(".png", ".raw"), "wb") as rawout:
-        rawout.write(out_img.tobytes())
+def convert_to_3color(
+    in_fname: str,
+    panel: Optional[Panel] = None,
+    output_dir: str = GENERATED_DIRECTORY,
+    new_width: Optional[int] = None,
+    dither: Optional[str] = None,
+    align: str = "centre",
+) -> Dict[str, str]:
+    """Convert one picture for `panel`, fitting it to the panel frame or,
+    like older versions did, to `new_width` pixels wide."""
+    panel = panel or panel_descriptor()
+    frame_width, frame_height = panel.frame_size
+    box = (new_width, float("inf")) if new_width else (frame_width, frame_height)
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = output_files(in_fname, output_dir, panel, new_width or frame_width)
 
+    with Image.open(in_fname) as img:
+        shrunken_img = fit(img, box)
+    shrunken_img.save(outputs["resized"])
+    masks = separate(shrunken_img, panel.planes, dither)
 
-def convert_to_3color(in_fname: str, new_width: int = DEFAULT_NEW_WIDTH) -> None:
-    os.makedirs(GENERATED_DIRECTORY, exist_ok=True)
-    base_fname = os.path.basename(in_fname)
-    black_fname = os.path.join(GENERATED_DIRECTORY, base_fname.replace(".png", ".black.png"))
-    red_fname = os.path.join(GENERATED_DIRECTORY, base_fname.replace(".png", ".red.png"))
-    resized_fname = os.path.join(GENERATED_DIRECTORY, base_fname.replace(".png", f".resized{new_width}.png"))
+    # The picture on a white frame, cropped if it is larger
+    left = (frame_width - shrunken_img.size[0]) // 2
+    top = (frame_height - shrunken_img.size[1]) * ALIGNMENTS.index(align) // 2
+    indices = np.ones((frame_height, frame_width), dtype=np.uint8)
+    native_planes = []
+    for code, (plane, mask) in enumerate(masks.items()):
+        Image.fromarray(mask).save(outputs[plane])
 
-    img = Image.open(in_fname)
+        frame_mask = Image.new("1", (frame_width, frame_height), 0)
+        frame_mask.paste(Image.fromarray(mask), (left, top))
+        frame_ink = np.asarray(frame_mask)
+        indices[frame_ink] = 0 if code == 0 else 2
+        # Drivers take 0 for ink, rows MSB first and padded to whole bytes
+        native = Image.fromarray(~frame_ink).rotate(panel.rotation, expand=True)
+        native_planes.append(native.tobytes())
 
-    shrunken_img = img.resize(
-        (new_width, int(img.size[1] * new_width / img.size[0])),
-        Image.Resampling.NEAREST,
+    framefile.save(outputs["frame"], panel.name, panel.width, panel.height, native_planes, rotation=panel.rotation)
+
+    colours = "bw" + "".join(plane[0] for plane in panel.planes[1:])
+    dithering.render(indices, colours).save(outputs["preview"])
+    return outputs
+
+
+# ---- batch mode -------------------------------------------------------------
+def find_images(paths: List[str], output_dir: str) -> Iterator[Tuple[str, str]]:
+    """(picture, directory relative to its root) for files and directory
+    trees, leaving out our own outputs."""
+    output_dir = os.path.realpath(output_dir)
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path, ""
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = sorted(
+                dirname
+                for dirname in dirnames
+                if os.path.realpath(os.path.join(dirpath, dirname)) != output_dir
+            )
+            for filename in sorted(filenames):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(dirpath, filename), os.path.relpath(dirpath, path)
+
+
+def file_hash(fname: str) -> str:
+    digest = hashlib.sha1()
+    with open(fname, "rb") as image_file:
+        for block in iter(lambda: image_file.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(output_dir: str) -> Dict[str, dict]:
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE)) as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(output_dir: str, manifest: Dict[str, dict]) -> None:
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def up_to_date(
+    in_fname: str, outputs: Dict[str, str], entry: Optional[dict], settings: dict
+) -> Optional[str]:
+    """Why the outputs need no conversion, or None when they do."""
+    if not all(os.path.exists(out_fname) for out_fname in outputs.values()):
+        return None
+    if entry is None or entry.get("settings") != settings:
+        return None
+    oldest_output = min(os.path.getmtime(out_fname) for out_fname in outputs.values())
+    if oldest_output >= os.path.getmtime(in_fname):
+        return "mtime"
+    # Touched or copied but unchanged
+    if entry.get("sha1") == file_hash(in_fname):
+        return "hash"
+    return None
+
+
+def convert_job(
+    in_fname: str,
+    panel: Panel,
+    output_dir: str,
+    new_width: Optional[int],
+    dither: Optional[str],
+    align: str,
+) -> Tuple[str, str]:
+    convert_to_3color(in_fname, panel, output_dir, new_width, dither, align)
+    return in_fname, file_hash(in_fname)
+
+
+def convert_batch(
+    paths: List[str],
+    panel: Panel,
+    output_dir: str,
+    new_width: Optional[int] = None,
+    dither: Optional[str] = None,
+    jobs: Optional[int] = None,
+    force: bool = False,
+    align: str = "centre",
+) -> Dict[str, int]:
+    # As the manifest gives them back, tuples as lists, to compare with it
+    settings = json.loads(
+        json.dumps(
+            {
+                "panel": panel._asdict(),
+                "width": new_width,
+                "dither": dither,
+                "align": align,
+                "thresholds": [MIN_SATURATION, MIN_VALUE, DARK],
+            }
+        )
     )
-    shrunken_img.save(resized_fname)
+    counts = {"converted": 0, "skipped": 0, "failed": 0}
+    manifests: Dict[str, Dict[str, dict]] = {}
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {}
+        for in_fname, relative_dir in find_images(paths, output_dir):
+            job_dir = os.path.normpath(os.path.join(output_dir, relative_dir))
+            manifest = manifests.setdefault(job_dir, load_manifest(job_dir))
+            key = os.path.abspath(in_fname)
+            outputs = output_files(in_fname, job_dir, panel, new_width or panel.frame_size[0])
+            reason = None if force else up_to_date(in_fname, outputs, manifest.get(key), settings)
+            if reason is not None:
+                logging.debug("Skipping %s, up to date by %s", in_fname, reason)
+                counts["skipped"] += 1
+                continue
+            job = pool.submit(convert_job, in_fname, panel, job_dir, new_width, dither, align)
+            futures[job] = (key, job_dir)
+
+        for future, (key, job_dir) in futures.items():
+            try:
+                in_fname, sha1 = future.result()
+            except Exception:
+                logging.exception("Unable to convert %s", key)
+                counts["failed"] += 1
+                continue
+            logging.info("Converted %s", in_fname)
+            manifests[job_dir][key] = {"sha1": sha1, "settings": settings}
+            counts["converted"] += 1
+
+    for job_dir, manifest in manifests.items():
+        if os.path.isdir(job_dir):
+            save_manifest(job_dir, manifest)
+    return counts
 
-    save_to_2color(shrunken_img, black_fname, WHITE)
-    save_to_2color(shrunken_img, red_fname, WHITE, black_threshold=BLACK)
+
+def main() -> None:
+    argparser = ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument("paths", nargs="+", help="Pictures or directories of pictures")
+    argparser.add_argument("--panel", default=DEFAULT_PANEL, help="Driver module of the target panel")
+    argparser.add_argument(
+        "--rotation", type=int, default=0, choices=ROTATIONS, help="Turn frames, 90 for landscape"
+    )
+    argparser.add_argument("--width", type=int, help="Fit pictures to this width, not the panel")
+    argparser.add_argument("--dither", choices=dithering.ENGINES, help="Dither instead of separating by hue")
+    argparser.add_argument(
+        "--align", default="centre", choices=ALIGNMENTS, help="Where smaller pictures go in the frame"
+    )
+    argparser.add_argument("--output-dir", default=GENERATED_DIRECTORY)
+    argparser.add_argument("--jobs", "-j", type=int, default=None, help="Worker processes (default: CPU count)")
+    argparser.add_argument("--force", action="store_true", help="Convert even if the outputs are up to date")
+    argparser.add_argument("--verbose", "-v", action="store_true")
+    args = argparser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    panel = panel_descriptor(args.panel, args.rotation)
+    counts = convert_batch(
+        args.paths, panel, args.output_dir, args.width, args.dither, args.jobs, args.force, args.align
+    )
+    logging.info("%(converted)d converted, %(skipped)d up to date, %(failed)d failed", counts)
 
 
 if __name__ == "__main__":
-    convert_to_3color(sys.argv[1])
+    main()